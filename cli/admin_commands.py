@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+from core import model_gc
+from core import mongo
+from core.termcolor import get_colored_text_by_hsv
+from core.tracking import Tracking
+from core.trigger_manager import TriggerManager
+
+import click
+import tabulate
+
+
+@click.group(name="admin")
+def admin():
+    """
+    Commands to administrate the model factory databases.
+    """
+    pass
+
+
+@admin.command(name="ensure-indexes")
+def ensure_indexes():
+    """
+    Create or migrate the managed indexes of the tracking collections.
+    """
+    Tracking.ensure_indexes()
+    TriggerManager.ensure_indexes()
+
+    print("Managed indexes are up to date.")
+
+
+@admin.command(name="migrate-job-events")
+@click.option("--batch-size", default=1000, type=int, show_default=True, help="The number of jobs to migrate per batch.")
+def migrate_job_events(batch_size):
+    """
+    Move the events embedded in job documents into the job events collection.
+    """
+    migrated_job_count = Tracking.migrate_job_events(batch_size=batch_size)
+
+    print("Migrated the events of {} jobs.".format(migrated_job_count))
+
+
+@admin.command(name="migrate-model-metrics")
+@click.option("--batch-size", default=1000, type=int, show_default=True, help="The number of models to migrate per batch.")
+def migrate_model_metrics(batch_size):
+    """
+    Move the metrics embedded in model documents into the model metrics collection.
+    """
+    migrated_model_count = Tracking.migrate_model_metrics(batch_size=batch_size)
+
+    print("Migrated the metrics of {} models.".format(migrated_model_count))
+
+
+@admin.command(name="rebuild-model-metric-summaries")
+def rebuild_model_metric_summaries():
+    """
+    Recompute the model metric summaries used by mf model top from the model metrics collection.
+    """
+    summary_count = Tracking.rebuild_model_metric_summaries()
+
+    print("Rebuilt {} model metric summaries.".format(summary_count))
+
+
+@admin.command(name="migrate-model-metadata")
+@click.option("--batch-size", default=1000, type=int, show_default=True, help="The number of models to migrate per batch.")
+def migrate_model_metadata(batch_size):
+    """
+    Convert the json string metadata of the models into queryable subdocuments.
+    """
+    migrated_model_count = Tracking.migrate_model_metadata(batch_size=batch_size)
+
+    print("Migrated the metadata of {} models.".format(migrated_model_count))
+
+
+@admin.command(name="metadata-index")
+@click.argument("model-name", required=False)
+@click.argument("key", required=False)
+@click.option("--drop", is_flag=True, help="Drop the metadata index instead of declaring it.")
+def metadata_index(model_name, key, drop):
+    """
+    Declare an index on a metadata key of the models of a model name, or list the declared ones.
+    """
+    if not model_name:
+        table = [
+            [
+                get_colored_text_by_hsv(0.4, 0.8, 0.7, metadata_index["model_name"]),
+                get_colored_text_by_hsv(0.55, 0.8, 0.7, metadata_index["key"]),
+                get_colored_text_by_hsv(0.15, 0.8, 0.7, mongo.MANAGED_INDEX_PREFIX + metadata_index["index_name"]),
+            ]
+            for metadata_index in Tracking.list_model_metadata_indexes()
+        ]
+
+        print(tabulate.tabulate(table, ["Model Name", "Metadata Key", "Index"], tablefmt="pretty"))
+        return
+
+    assert key, "The metadata key is missing!"
+
+    if drop:
+        Tracking.drop_model_metadata_index(model_name, key)
+        print("Dropped the index on metadata {} of model {}.".format(key, model_name))
+    else:
+        Tracking.declare_model_metadata_index(model_name, key)
+        print("Declared an index on metadata {} of model {}.".format(key, model_name))
+
+
+@admin.command(name="migrate-job-stats")
+def migrate_job_stats():
+    """
+    Mark the jobs created before the job stats as not counted yet, so that the execution syncer counts them.
+    """
+    migrated_job_count = Tracking.migrate_job_stats()
+
+    print("Marked {} jobs to be counted in the job stats.".format(migrated_job_count))
+
+
+@admin.command(name="migrate-model-promotions")
+def migrate_model_promotions():
+    """
+    Record the promotions of the models promoted before they were recorded, so that they are never garbage collected.
+    """
+    migrated_model_count = Tracking.migrate_model_promotions()
+
+    print("Recorded the promotions of {} models.".format(migrated_model_count))
+
+
+@admin.command(name="rebuild-job-stats")
+@click.option("--since-day", help="Only rebuild the stats of the jobs created since this day (YYYY-MM-DD).")
+def rebuild_job_stats(since_day):
+    """
+    Recompute the job stats summaries from the jobs collection and the job archive.
+    """
+    recorded_job_count = Tracking.rebuild_job_stats(since_day=since_day)
+
+    print("Recorded the stats of {} jobs.".format(recorded_job_count))
+
+
+@admin.command(name="gc-models")
+@click.option("--age-days", default=30, type=int, show_default=True, help="Collect the hidden models created more than this many days ago.")
+@click.option("--dry-run", is_flag=True, help="Only list what would be collected, with the sizes of the objects.")
+def gc_models(age_days, dry_run):
+    """
+    Delete the hidden models which were never in production, the model objects without a model, and the unreferenced
+    model chunks.
+    """
+    collected_models = model_gc.collect_models(age_seconds=age_days * 24 * 3600, dry_run=dry_run)
+    collected_chunks = model_gc.collect_model_chunks(dry_run=dry_run)
+
+    header = ["Model ID", "Model Name", "Reason", "Objects", "Bytes"]
+
+    table = []
+    for collected_model in collected_models:
+        table.append([
+            get_colored_text_by_hsv(0.4, 0.8, 0.7, collected_model["model_id"]),
+            get_colored_text_by_hsv(0.55, 0.8, 0.7, collected_model["model_name"] or ""),
+            get_colored_text_by_hsv(0.1, 0.8, 0.7, collected_model["reason"]),
+            collected_model["object_count"],
+            collected_model["size"],
+        ])
+
+    print(tabulate.tabulate(table, header, tablefmt="pretty"))
+
+    model_size = sum(collected_model["size"] for collected_model in collected_models)
+    print("{} {} models ({} bytes) and {} unreferenced chunks ({} bytes), {} bytes in total.".format(
+        "Would reclaim" if dry_run else "Reclaimed",
+        len(collected_models),
+        model_size,
+        collected_chunks["chunk_count"],
+        collected_chunks["size"],
+        model_size + collected_chunks["size"],
+    ))
+
+
+@admin.command(name="explain")
+@click.option("--only-scans", is_flag=True, help="Only show the queries answered by a collection scan.")
+def explain(only_scans):
+    """
+    Explain the canonical queries, and report collection scans versus index hits.
+    """
+    header = [
+        "Query",
+        "Collection",
+        "Plan",
+        "Indexes",
+        "Keys Examined",
+        "Docs Examined",
+        "Docs Returned",
+        "Time (ms)",
+    ]
+
+    table = []
+    for canonical_query in Tracking.get_canonical_queries() + TriggerManager.get_canonical_queries():
+        query_plan = mongo.explain_query(
+            collection=canonical_query["collection"],
+            query_filter=canonical_query["filter"],
+            sort=canonical_query.get("sort"),
+            limit=canonical_query.get("limit"),
+        )
+
+        if only_scans and not query_plan["collection_scan"]:
+            continue
+
+        if query_plan["collection_scan"]:
+            plan = get_colored_text_by_hsv(0, 0.8, 0.8, "COLLSCAN")
+        elif query_plan["in_memory_sort"]:
+            plan = get_colored_text_by_hsv(0.1, 0.8, 0.8, "IXSCAN + SORT")
+        else:
+            plan = get_colored_text_by_hsv(0.35, 0.8, 0.7, "IXSCAN")
+
+        table.append([
+            canonical_query["name"],
+            query_plan["collection"],
+            plan,
+            ", ".join(query_plan["index_names"]),
+            query_plan["keys_examined"],
+            query_plan["docs_examined"],
+            query_plan["docs_returned"],
+            query_plan["execution_time_ms"],
+        ])
+
+    print(tabulate.tabulate(table, header, tablefmt="pretty"))
@@ -4,7 +4,8 @@ from core import consts as mf_consts
 from core import utils as core_utils
 from core.config import Config
 from core.termcolor import get_colored_text_by_hsv
-from datetime import datetime
+from core.tracking import Tracking
+from datetime import datetime, timedelta
 from treelib import Tree
 from zlib import crc32
 import click
@@ -13,6 +14,7 @@ import pytz
 import socket
 import stat
 import tabulate
+import time
 import uuid
 
 from services.model_factory_frontend.client import ModelFactoryFrontendClient
@@ -200,13 +202,20 @@ def retry(
 
 @job.command(name="events")
 @click.argument("job-id")
-def events(job_id):
+@click.option("--since", type=click.DateTime(), help="Only show the events after this UTC time.")
+@click.option("--until", type=click.DateTime(), help="Only show the events before this UTC time.")
+@click.option("--event-types", help="Comma separated event types to show.")
+def events(job_id, since, until, event_types):
     """
-    Create a job to execute a model factory pipeline.
+    Show the events of a job.
     """
     model_factory_frontend_client = ModelFactoryFrontendClient()
-    job_info = model_factory_frontend_client.get_info_for_single_job(job_id)
-    job_events = sorted(job_info["events"], key=lambda event: event["timestamp"])
+    job_events = model_factory_frontend_client.get_job_events(
+        job_id,
+        start_timestamp=since and since.replace(tzinfo=pytz.utc).timestamp(),
+        end_timestamp=until and until.replace(tzinfo=pytz.utc).timestamp(),
+        event_types=event_types.split(",") if event_types else None,
+    )
 
     tree = Tree()
 
@@ -241,6 +250,92 @@ def events(job_id):
     tree.show(key=lambda node: node._identifier)
 
 
+@job.command(name="wait")
+@click.argument("job-ids", nargs=-1, required=True)
+@click.option("--timeout", type=float, help="The maximum number of seconds to wait.")
+def wait(job_ids, timeout):
+    """
+    Wait until all the jobs reach a terminal status.
+
+    The command exits with a non-zero code if any of the jobs did not succeed.
+    """
+    def _print_job_status(job_info):
+        job_status = job_info.get("status")
+        print("{} {}".format(
+            get_colored_text_by_hsv(0.4, 0.8, 0.7, job_info["_id"]),
+            get_colored_text_by_hsv(0.35 if job_status == "succeeded" else 0, 0.8, 0.7, job_status),
+        ))
+
+    jobs_info = Tracking.wait_for_jobs(
+        job_ids=job_ids,
+        timeout=timeout,
+        on_job_done=_print_job_status,
+    )
+
+    if any(job_info.get("status") != "succeeded" for job_info in jobs_info.values()):
+        raise SystemExit(1)
+
+
+@job.command(name="stats")
+@click.option(
+    "--group-by", default="pipeline_name", show_default=True,
+    help="Comma separated dimensions to group by, among day, pipeline_name, owner and pool.",
+)
+@click.option("--days", default=7, type=int, show_default=True, help="Only count the jobs of the last n days.")
+@click.option("--pipeline", help="The pipeline filter.")
+@click.option("--owner", help="The owner filter.")
+@click.option("--pool", help="The pool filter.")
+def stats(group_by, days, pipeline, owner, pool):
+    """
+    Show job success rates, durations, queue waits and failure reasons.
+    """
+    group_by = [dimension.strip() for dimension in group_by.split(",")] if group_by else []
+    start_day = datetime.utcfromtimestamp(time.time() - (days - 1) * 24 * 3600).strftime("%Y-%m-%d")
+
+    model_factory_frontend_client = ModelFactoryFrontendClient()
+    jobs_stats = model_factory_frontend_client.job_stats(
+        group_by=group_by,
+        start_day=start_day,
+        pipeline_name=pipeline,
+        owner=owner,
+        pool=pool,
+    )
+
+    def _get_duration_str(seconds):
+        return seconds is not None and str(timedelta(seconds=int(seconds)))
+
+    header = group_by + [
+        "Jobs",
+        "Success Rate",
+        "P50 Duration",
+        "P95 Duration",
+        "P50 Queue Wait",
+        "P95 Queue Wait",
+        "Top Failure Reasons",
+    ]
+
+    table = []
+    for job_stats in jobs_stats:
+        top_failure_reasons = sorted(job_stats["failure_reasons"].items(), key=lambda item: -item[1])[:3]
+
+        table.append([job_stats.get(dimension) for dimension in group_by] + [
+            get_colored_text_by_hsv(0.4, 0.8, 0.7, job_stats["count"]),
+            get_colored_text_by_hsv(
+                0.35 * (job_stats["success_rate"] or 0), 0.8, 0.7,
+                "{:.1%}".format(job_stats["success_rate"] or 0),
+            ),
+            get_colored_text_by_hsv(0.2, 0.8, 0.7, _get_duration_str(job_stats["p50_duration"])),
+            get_colored_text_by_hsv(0.2, 0.8, 0.7, _get_duration_str(job_stats["p95_duration"])),
+            get_colored_text_by_hsv(0.1, 0.8, 0.7, _get_duration_str(job_stats["p50_queue_wait"])),
+            get_colored_text_by_hsv(0.1, 0.8, 0.7, _get_duration_str(job_stats["p95_queue_wait"])),
+            get_colored_text_by_hsv(0, 0.8, 0.7, ", ".join(
+                "{} ({})".format(reason, count) for reason, count in top_failure_reasons
+            )),
+        ])
+
+    print(tabulate.tabulate(table, header, tablefmt="pretty"))
+
+
 @job.command(name="info")
 @click.argument("job-id")
 def info(job_id):
@@ -391,15 +486,32 @@ def delete(job_id):
     print("{} master job deleted".format(job_id))
 
 
+# The job fields rendered by each mf job list output format.
+_JOB_LIST_FIELDS = {
+    "regular": [
+        "job_id", "pipeline_name", "operator_id", "start_timestamp", "completion_timestamp", "owner", "stage",
+        "status", "exit_reason",
+    ],
+    "full": [
+        "job_id", "tags", "pool", "pipeline_name", "operator_id", "creation_timestamp", "start_timestamp",
+        "completion_timestamp", "owner", "stage", "status", "exit_reason", "output",
+    ],
+    "short": [
+        "job_id", "pipeline_name", "operator_id", "owner", "stage", "status", "exit_reason",
+    ],
+}
+
+
 @job.command(name="list")
 @click.option("--owner", default=core_utils.get_current_user(), help="The owner filter. '*' for all.")
 @click.option("--tag", help="The tag filter.")
 @click.option("--pipeline", help="The pipeline filter.")
 @click.option("--status", help="The status filter.")
 @click.option("--show-hidden", is_flag=True, help="Show the hidden jobs as well.")
+@click.option("--skip-archived", is_flag=True, help="Skip the jobs moved to the job archive.")
 @click.option("-n", type=int, help="Only show the last n jobs.")
 @click.option("-o", "--output", type=click.Choice(['regular', 'full', 'short']), default="regular", help="The output format.")
-def list(owner, tag, pipeline, status, show_hidden, n, output):
+def list(owner, tag, pipeline, status, show_hidden, skip_archived, n, output):
     """
     List jobs.
     """
@@ -446,18 +558,47 @@ def list(owner, tag, pipeline, status, show_hidden, n, output):
 
     model_factory_frontend_client = ModelFactoryFrontendClient()
 
+    # Push all the filters down to the database.
     query_filters = {}
 
+    tags_filter = {}
     if not show_hidden:
-        query_filters["tags"] = {"$nin": ["hide"]}
+        tags_filter["$nin"] = ["hide"]
+    if tag:
+        tags_filter["$in"] = [tag]
+    if tags_filter:
+        query_filters["tags"] = tags_filter
 
     if owner and owner != '*':
         query_filters["owner"] = owner
 
-    jobs_info = model_factory_frontend_client.get_info_for_jobs(
-        query_filters,
-        {"events": 0},
-    )
+    if pipeline:
+        query_filters["pipeline_name"] = pipeline
+
+    if status:
+        query_filters["status"] = status
+
+    # Only fetch the fields rendered by the output format.
+    job_fields = _JOB_LIST_FIELDS[output]
+
+    if n:
+        # Fetch the latest n jobs, and show them from the oldest to the latest.
+        jobs_info = model_factory_frontend_client.get_info_for_jobs(
+            query_filters,
+            job_fields,
+            limit=n,
+            sort_key="creation_timestamp",
+            descending=True,
+            include_archived=not skip_archived,
+        )["jobs"][::-1]
+    else:
+        jobs_info = model_factory_frontend_client.iter_info_for_jobs(
+            query_filters,
+            job_fields,
+            sort_key="creation_timestamp",
+            descending=False,
+            include_archived=not skip_archived,
+        )
 
     for job_info in jobs_info:
         job_id = job_info.get("job_id", None)
@@ -503,20 +644,7 @@ def list(owner, tag, pipeline, status, show_hidden, n, output):
             job_status_with_color = get_colored_text_by_hsv(0, 0.8, v, 'deleted')
         else:
             v = 0.8
-            job_status_with_color = status
-
-        # Filter the jobs.
-        if tag and tag not in tags:
-            continue
-
-        if pipeline and pipeline != pipeline_name:
-            continue
-
-        if owner and owner != job_owner and owner != '*':
-            continue
-
-        if status and job_status != status:
-            continue
+            job_status_with_color = job_status
 
         # Prepare the job table data.
         owner_color = float(crc32(job_owner.encode()) & 0xffffffff) / 2**32
@@ -558,9 +686,9 @@ def list(owner, tag, pipeline, status, show_hidden, n, output):
                 job_status_with_color,
             ])
         else:
-            raise Exception("Unexpected output format {}!".format(fmt))
+            raise Exception("Unexpected output format {}!".format(output))
 
-    print(tabulate.tabulate(table[-n:] if n else table, header, tablefmt="pretty"))
+    print(tabulate.tabulate(table, header, tablefmt="pretty"))
 
 
 @job.command(name="repro")
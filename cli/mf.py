@@ -3,6 +3,7 @@
 import click
 import logging
 
+from cli import admin_commands
 from cli import dev_commands
 from cli import job_commands
 from cli import pipeline_commands
@@ -18,6 +19,7 @@ def main():
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
 
+    main.add_command(admin_commands.admin)
     main.add_command(dev_commands.dev)
     main.add_command(job_commands.job)
     main.add_command(pipeline_commands.pipeline)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+from core import model_transfer
 from core import utils as core_utils
 from core.model_registry import ModelRegistry
 from core.termcolor import get_colored_text_by_hsv
@@ -12,6 +13,7 @@ from treelib import Tree
 from zlib import crc32
 import click
 import collections
+import json
 import pytz
 import re
 import tabulate
@@ -33,13 +35,32 @@ def model():
 @click.option("--show-metadata", is_flag=True, help="Whether to show the model metadata.")
 @click.option("--show-metric", is_flag=True, help="Whether to show the model metric.")
 @click.option("--show-hidden", is_flag=True, help="Whether to show the hidden models.")
-def list_models(tag, model_id, model_name, n, show_metadata, show_metric, show_hidden):
+@click.option("--metadata", "metadata_filters", multiple=True, help="The metadata filter, e.g. --metadata dataset=v2. Can be repeated.")
+def list_models(tag, model_id, model_name, n, show_metadata, show_metric, show_hidden, metadata_filters):
     """
     List all models
     """
+    # Push the model name and the metadata filters down to the database.
+    model_filter = {}
+
+    if model_name:
+        model_filter["model_name"] = model_name
+
+    for metadata_filter in metadata_filters:
+        assert "=" in metadata_filter, "Metadata filters should be formatted as key=value!"
+
+        key, value = metadata_filter.split("=", 1)
+
+        # Values are parsed as json when possible, so that numbers and booleans match.
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+
+        model_filter["metadata.{}".format(key)] = value
 
     model_factory_frontend_client = ModelFactoryFrontendClient()
-    models_info = model_factory_frontend_client.list_models()
+    models_info = model_factory_frontend_client.list_models(model_filter)
     production_models_info = model_factory_frontend_client.list_production_models()
     production_model_ids = {production_model_info["model_id"] for production_model_info in production_models_info}
 
@@ -57,12 +78,13 @@ def list_models(tag, model_id, model_name, n, show_metadata, show_metric, show_h
         header.append("Metadata")
     if show_metric:
         header.append("Metric")
+        latest_metrics = model_factory_frontend_client.get_latest_metrics(
+            [model_info["_id"] for model_info in models_info if model_info.get("_id")]
+        )
 
     model_auto_rollout_deployments = collections.defaultdict(set)
-    for db_trigger_info in TriggerManager.load_info_for_all_triggers():
+    for db_trigger_info in TriggerManager.load_info_for_triggers_by_class(ModelServingRolloutTrigger.__name__):
         trigger = TriggerManager.load_trigger(db_trigger_info)
-        if not isinstance(trigger, ModelServingRolloutTrigger):
-            continue
         model_auto_rollout_deployments[trigger.model_name].add("{}.{}".format(
             trigger.deployment_namespace,
             trigger.deployment_name,
@@ -112,11 +134,16 @@ def list_models(tag, model_id, model_name, n, show_metadata, show_metric, show_h
 
         if show_metadata:
             metadata = model_info.get("metadata", None)
+            if isinstance(metadata, dict):
+                metadata = json.dumps(metadata)
             row.append(
                 get_colored_text_by_hsv(0.35, 0.8, 0.7, metadata),
             )
         if show_metric:
-            metric = model_info.get("metric", None)
+            metric = ", ".join(
+                "{}={}".format(key, latest_metric["value"])
+                for key, latest_metric in sorted(latest_metrics.get(cur_model_id, {}).items())
+            )
             row.append(
                 get_colored_text_by_hsv(0.65, 0.8, 0.7, metric),
             )
@@ -126,6 +153,142 @@ def list_models(tag, model_id, model_name, n, show_metadata, show_metric, show_h
     print(tabulate.tabulate(table[-n:] if n else table, header, tablefmt="pretty"))
 
 
+@model.command(name="top")
+@click.argument("model-name")
+@click.option("--metric", required=True, help="The metric to rank the models by.")
+@click.option("-k", default=10, type=int, show_default=True, help="The number of models to show.")
+@click.option("--by", type=click.Choice(["latest", "best"]), default="latest", show_default=True, help="Rank by the latest or the best value of the metric.")
+@click.option("--ascending", is_flag=True, help="Lower is better, e.g. for a loss.")
+def top(model_name, metric, k, by, ascending):
+    """
+    Show the best models of a model name by a metric.
+    """
+    model_factory_frontend_client = ModelFactoryFrontendClient()
+    leaderboard = model_factory_frontend_client.model_leaderboard(
+        model_name,
+        metric,
+        k=k,
+        by=by,
+        ascending=ascending,
+    )
+    production_model_ids = {
+        production_model_info["model_id"]
+        for production_model_info in model_factory_frontend_client.list_production_models([model_name])
+    }
+
+    header = [
+        "Rank",
+        "Model ID",
+        "Tags",
+        "Job ID",
+        "Production",
+        "Creation Time",
+        "Latest",
+        "Step",
+        "Best",
+    ]
+
+    table = []
+    for rank, entry in enumerate(leaderboard, 1):
+        model_info = entry["model_info"] or {}
+        creation_time = model_info.get("timestamp", None) and datetime.utcfromtimestamp(
+            float(model_info["timestamp"])
+        ).replace(tzinfo=pytz.utc, microsecond=0)
+
+        table.append([
+            get_colored_text_by_hsv(0.1, 0.8, 0.7, rank),
+            get_colored_text_by_hsv(0.4, 0.8, 0.7, entry["model_id"]),
+            get_colored_text_by_hsv(0.55, 0.8, 0.7, ", ".join(model_info.get("tags", []))),
+            get_colored_text_by_hsv(0.15, 0.8, 0.7, model_info.get("job_id", "")),
+            get_colored_text_by_hsv(0.45, 0.8, 0.7, "PROD" if entry["model_id"] in production_model_ids else ""),
+            get_colored_text_by_hsv(0.2, 0.8, 0.7, creation_time),
+            get_colored_text_by_hsv(0.65, 0.8, 0.7, entry["latest"]["value"]),
+            get_colored_text_by_hsv(0.65, 0.8, 0.7, entry["latest"]["step"]),
+            get_colored_text_by_hsv(0.65, 0.8, 0.7, entry["min_value"] if ascending else entry["max_value"]),
+        ])
+
+    print(tabulate.tabulate(table, header, tablefmt="pretty"))
+
+
+@model.command(name="benchmark")
+@click.argument("model-path")
+@click.option("--codecs", default="none,gzip,zstd,lz4", show_default=True, help="Comma separated codecs to benchmark, e.g. zstd:9.")
+def benchmark(model_path, codecs):
+    """
+    Benchmark the compression codecs of model archives on a model.
+    """
+    header = [
+        "Codec",
+        "Raw Size",
+        "Size",
+        "Ratio",
+        "Compress MB/s",
+        "Upload MB/s",
+        "Download MB/s",
+        "Pull (s)",
+        "Decompress (s)",
+    ]
+
+    table = []
+    for result in model_transfer.benchmark_codecs(model_path, codecs.split(",")):
+        table.append([
+            get_colored_text_by_hsv(0.4, 0.8, 0.7, result["codec"]),
+            get_colored_text_by_hsv(0.55, 0.8, 0.7, result["raw_size"]),
+            get_colored_text_by_hsv(0.55, 0.8, 0.7, result["size"]),
+            get_colored_text_by_hsv(0.15, 0.8, 0.7, "{:.2f}x".format(result["ratio"])),
+            get_colored_text_by_hsv(0.65, 0.8, 0.7, "{:.1f}".format(result["compress_throughput"] / 2**20)),
+            get_colored_text_by_hsv(0.65, 0.8, 0.7, "{:.1f}".format(result["upload_throughput"] / 2**20)),
+            get_colored_text_by_hsv(0.65, 0.8, 0.7, "{:.1f}".format(result["download_throughput"] / 2**20)),
+            get_colored_text_by_hsv(0.2, 0.8, 0.7, "{:.1f}".format(result["pull_seconds"])),
+            get_colored_text_by_hsv(0.2, 0.8, 0.7, "{:.1f}".format(result["decompress_seconds"])),
+        ])
+
+    print(tabulate.tabulate(table, header, tablefmt="pretty"))
+
+
+@model.command(name="metric")
+@click.argument("model-id")
+@click.argument("key")
+@click.option("--max-points", type=int, help="Downsample the metric series to at most this many points.")
+@click.option("--by-time", is_flag=True, help="Order the metric series by timestamp instead of step.")
+def metric(model_id, key, max_points, by_time):
+    """
+    Show a metric series of a model.
+    """
+    model_factory_frontend_client = ModelFactoryFrontendClient()
+    metric_series = model_factory_frontend_client.get_metric_series(
+        key,
+        model_id=model_id,
+        max_points=max_points,
+        x_field="timestamp" if by_time else "step",
+    )
+
+    header = ["Step", "Time (UTC)", "Value"]
+    if max_points:
+        header += ["Min", "Max", "Points"]
+
+    table = []
+    for metric_point in metric_series:
+        row = [
+            get_colored_text_by_hsv(0.4, 0.8, 0.7, metric_point.get("step")),
+            get_colored_text_by_hsv(0.2, 0.8, 0.7, datetime.utcfromtimestamp(
+                float(metric_point["timestamp"])
+            ).replace(tzinfo=pytz.utc, microsecond=0)),
+            get_colored_text_by_hsv(0.65, 0.8, 0.7, metric_point["value"]),
+        ]
+
+        if max_points:
+            row += [
+                get_colored_text_by_hsv(0.55, 0.8, 0.7, metric_point["min_value"]),
+                get_colored_text_by_hsv(0.55, 0.8, 0.7, metric_point["max_value"]),
+                get_colored_text_by_hsv(0.15, 0.8, 0.7, metric_point["count"]),
+            ]
+
+        table.append(row)
+
+    print(tabulate.tabulate(table, header, tablefmt="pretty"))
+
+
 @model.command(name="delete")
 @click.argument("model-id")
 def delete(model_id):
@@ -202,6 +365,77 @@ def promote(model_id):
     print("Model {} has been promoted for production usage.".format(model_id))
 
 
+@model.command(name="fleet")
+@click.argument("model-name")
+@click.option("--stale-minutes", default=10, type=int, show_default=True, help="Hosts which have not reported for this long are stale.")
+@click.option("--hosts", is_flag=True, help="Show every host of the fleet.")
+def fleet(model_name, stale_minutes, hosts):
+    """
+    Show the rollout of a production model over the hosts serving it.
+    """
+    model_factory_frontend_client = ModelFactoryFrontendClient()
+    model_fleet = model_factory_frontend_client.model_fleet(
+        model_name,
+        stale_seconds=stale_minutes * 60,
+        include_hosts=hosts,
+    )
+
+    def _format_timestamp(timestamp):
+        return timestamp and datetime.utcfromtimestamp(timestamp).replace(tzinfo=pytz.utc, microsecond=0)
+
+    print("Production model {}: {} of {} live hosts ({} stale)".format(
+        get_colored_text_by_hsv(0.4, 0.8, 0.7, model_fleet["production_model_id"]),
+        get_colored_text_by_hsv(0.1, 0.8, 0.7, model_fleet["production_host_count"]),
+        get_colored_text_by_hsv(0.1, 0.8, 0.7, model_fleet["live_host_count"]),
+        model_fleet["host_count"] - model_fleet["live_host_count"],
+    ))
+
+    header = [
+        "Model ID",
+        "Production",
+        "Live Hosts",
+        "Stale Hosts",
+        "First Update",
+        "Last Update",
+        "Last Seen",
+    ]
+
+    table = []
+    for version in model_fleet["versions"]:
+        table.append([
+            get_colored_text_by_hsv(0.4, 0.8, 0.7, version["model_id"]),
+            get_colored_text_by_hsv(0.45, 0.8, 0.7, "PROD" if version["production"] else ""),
+            get_colored_text_by_hsv(0.1, 0.8, 0.7, version["live_host_count"]),
+            get_colored_text_by_hsv(0.0, 0.8, 0.7, version["host_count"] - version["live_host_count"]),
+            get_colored_text_by_hsv(0.2, 0.8, 0.7, _format_timestamp(version["first_update_timestamp"])),
+            get_colored_text_by_hsv(0.2, 0.8, 0.7, _format_timestamp(version["last_update_timestamp"])),
+            get_colored_text_by_hsv(0.2, 0.8, 0.7, _format_timestamp(version["last_seen_timestamp"])),
+        ])
+
+    print(tabulate.tabulate(table, header, tablefmt="pretty"))
+
+    if hosts:
+        header = [
+            "Hostname",
+            "Model ID",
+            "Previous Model ID",
+            "Updated",
+            "Last Seen",
+        ]
+
+        table = []
+        for host_info in model_fleet["hosts"]:
+            table.append([
+                get_colored_text_by_hsv(0.55, 0.8, 0.7, host_info["hostname"]),
+                get_colored_text_by_hsv(0.4, 0.8, 0.7, host_info["model_id"]),
+                get_colored_text_by_hsv(0.4, 0.5, 0.7, host_info.get("previous_model_id", "")),
+                get_colored_text_by_hsv(0.2, 0.8, 0.7, _format_timestamp(host_info.get("update_timestamp"))),
+                get_colored_text_by_hsv(0.2, 0.8, 0.7, _format_timestamp(host_info.get("last_seen_timestamp"))),
+            ])
+
+        print(tabulate.tabulate(table, header, tablefmt="pretty"))
+
+
 @model.command(name="prod-events")
 @click.argument("model-name")
 @click.option("--event-types")
@@ -0,0 +1,300 @@
+from core import consts
+from core import model_transfer
+from core import mongo
+from core import storage
+from core.config import Config
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+
+
+# The number of artifacts deleted at once when dropping a namespace.
+DROP_BATCH_SIZE = 1000
+
+# Namespaces are part of the storage keys of their artifacts.
+_NAMESPACE_PATTERN = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]*$")
+
+
+class ArtifactStore:
+    """
+    Artifact store keeps named files of pipelines, grouped in namespaces.
+
+    The content of an artifact is stored as a blob in the storage, under a new key on each put:
+
+        model-factory-artifacts/<namespace>/<uuid>
+
+    and its metadata in the artifacts collection, with the json encoded [namespace, name] pair as _id. Since json
+    escapes names character by character, the artifacts of a namespace, and those whose name starts with a prefix,
+    are a contiguous range of _id, so that listings are range scans of the _id index paginated by _id, at the same
+    cost per page no matter how large the namespace is.
+
+    The artifact_namespaces collection keeps the artifact count and total size of each namespace, so that namespaces
+    are listed without scanning their artifacts.
+    """
+
+    @classmethod
+    def init(cls):
+        cls.artifacts = mongo.get_collection(consts.MODEL_FACTORY_ARTIFACTS_COLLECTION_NAME)
+        cls.artifact_namespaces = mongo.get_collection(consts.MODEL_FACTORY_ARTIFACT_NAMESPACES_COLLECTION_NAME)
+
+        # List queries may be served by secondaries, see Config.MONGO_LIST_READ_PREFERENCE.
+        cls.artifacts_list_collection = mongo.get_collection(
+            consts.MODEL_FACTORY_ARTIFACTS_COLLECTION_NAME,
+            for_listing=True,
+        )
+
+    @classmethod
+    def get_artifact_id(cls, namespace, name):
+        return json.dumps([namespace, name])
+
+    @classmethod
+    def get_artifact_id_range(cls, namespace, prefix=""):
+        """
+        Get the _id range of the artifacts of a namespace whose name starts with prefix.
+        """
+        # json.dumps only outputs ascii, so the end of the range is the start with its last character incremented.
+        start = json.dumps([namespace, prefix])[:-len("\"]")]
+
+        return {"$gte": start, "$lt": start[:-1] + chr(ord(start[-1]) + 1)}
+
+    @classmethod
+    def get_artifact_s3_key(cls, namespace):
+        return "{}/{}/{}".format(consts.MODEL_FACTORY_ARTIFACTS_NAMESPACE, namespace, uuid.uuid4())
+
+    @classmethod
+    def put(cls, namespace, name, file_path, metadata=None, job_id=None):
+        """
+        Store a file as the artifact name of namespace, replacing the previous version of the artifact if any.
+
+        Returns the artifact info.
+        """
+        assert _NAMESPACE_PATTERN.match(namespace), (
+            "Invalid artifact namespace {}, expecting letters, digits, _, - and .!".format(namespace)
+        )
+        assert os.path.isfile(file_path), "Missing artifact file at {}".format(file_path)
+
+        s3_key = cls.get_artifact_s3_key(namespace)
+        file_hash = hashlib.sha256()
+
+        with model_transfer.MultipartUploadWriter(s3_key) as writer:
+            try:
+                with open(file_path, "rb") as fp:
+                    for data in iter(lambda: fp.read(Config.MODEL_TRANSFER_PART_SIZE), b""):
+                        file_hash.update(data)
+                        writer.write(data)
+            except:
+                writer.abort()
+                raise
+
+            size = writer.size
+
+        now = time.time()
+        artifact_info = {
+            "_id": cls.get_artifact_id(namespace, name),
+            "namespace": namespace,
+            "name": name,
+            "s3_key": s3_key,
+            "size": size,
+            "sha256": file_hash.hexdigest(),
+            "metadata": metadata or {},
+            "job_id": job_id,
+            "timestamp": now,
+        }
+
+        previous_artifact_info = cls.artifacts.find_one_and_replace(
+            {"_id": artifact_info["_id"]},
+            artifact_info,
+            upsert=True,
+        )
+
+        cls.artifact_namespaces.update_one(
+            {"_id": namespace},
+            {
+                "$inc": {
+                    "artifact_count": 0 if previous_artifact_info else 1,
+                    "size": size - (previous_artifact_info["size"] if previous_artifact_info else 0),
+                },
+                "$set": {"update_timestamp": now},
+                "$setOnInsert": {"creation_timestamp": now},
+            },
+            upsert=True,
+        )
+
+        # The previous version is deleted once no artifact info points to it anymore.
+        if previous_artifact_info:
+            storage.get_storage().delete(previous_artifact_info["s3_key"])
+
+        logging.info("Stored artifact {} of namespace {} ({} bytes) to {}".format(
+            name,
+            namespace,
+            size,
+            storage.get_storage().get_url(s3_key),
+        ))
+
+        return artifact_info
+
+    @classmethod
+    def get(cls, namespace, name, target_path):
+        """
+        Download an artifact to target_path. Returns the artifact info.
+        """
+        artifact_info = cls.get_info(namespace, name)
+
+        if not artifact_info:
+            raise Exception("Artifact {} of namespace {} does not exist!".format(name, namespace))
+
+        target_path = os.path.expanduser(target_path)
+        tmp_path = os.path.join(os.path.dirname(target_path), ".{}.tmp".format(os.path.basename(target_path)))
+        file_hash = hashlib.sha256()
+
+        try:
+            with model_transfer.RangedDownloadReader(artifact_info["s3_key"]) as reader:
+                with open(tmp_path, "wb") as fp:
+                    for data in iter(lambda: reader.read(Config.MODEL_TRANSFER_PART_SIZE), b""):
+                        file_hash.update(data)
+                        fp.write(data)
+
+            if file_hash.hexdigest() != artifact_info["sha256"]:
+                raise Exception("Artifact {} of namespace {} is corrupted!".format(name, namespace))
+
+            os.replace(tmp_path, target_path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+            raise
+
+        return artifact_info
+
+    @classmethod
+    def get_info(cls, namespace, name):
+        return cls.artifacts.find_one({"_id": cls.get_artifact_id(namespace, name)})
+
+    @classmethod
+    def get_page(cls, namespace, prefix="", limit=consts.ARTIFACT_PAGE_SIZE, continuation_token=None):
+        """
+        Get a page of the artifact info of a namespace, ordered by _id, optionally only those whose name starts with
+        prefix.
+
+        Returns a dictionary with the artifacts of the page, and an opaque continuation token to fetch the next page.
+        The continuation token is None on the last page.
+        """
+        assert 0 < limit <= consts.ARTIFACT_MAX_PAGE_SIZE, "The page size should be between 1 and {}!".format(
+            consts.ARTIFACT_MAX_PAGE_SIZE,
+        )
+
+        page = mongo.find_page(
+            cls.artifacts_list_collection,
+            query_filter={"_id": cls.get_artifact_id_range(namespace, prefix or "")},
+            limit=limit,
+            sort_key="_id",
+            descending=False,
+            continuation_token=continuation_token,
+            allowed_sort_keys=("_id",),
+        )
+
+        return {
+            "artifacts": page["documents"],
+            "continuation_token": page["continuation_token"],
+        }
+
+    @classmethod
+    def iter_info(cls, namespace, prefix="", page_size=consts.ARTIFACT_MAX_PAGE_SIZE):
+        """
+        Iterate over the artifact info of a namespace page by page.
+        """
+        continuation_token = None
+
+        while True:
+            page = cls.get_page(namespace, prefix, limit=page_size, continuation_token=continuation_token)
+
+            yield from page["artifacts"]
+
+            continuation_token = page["continuation_token"]
+            if not continuation_token:
+                break
+
+    @classmethod
+    def list_namespaces(cls):
+        return [
+            dict(namespace_info, namespace=namespace_info.pop("_id"))
+            for namespace_info in cls.artifact_namespaces.find().sort("_id", 1)
+        ]
+
+    @classmethod
+    def delete(cls, namespace, name):
+        """
+        Delete an artifact. Returns whether the artifact existed.
+        """
+        artifact_info = cls.artifacts.find_one_and_delete({"_id": cls.get_artifact_id(namespace, name)})
+
+        if not artifact_info:
+            return False
+
+        cls.artifact_namespaces.update_one(
+            {"_id": namespace},
+            {"$inc": {"artifact_count": -1, "size": -artifact_info["size"]}, "$set": {"update_timestamp": time.time()}},
+        )
+
+        storage.get_storage().delete(artifact_info["s3_key"])
+
+        return True
+
+    @classmethod
+    def drop_namespace(cls, namespace):
+        """
+        Delete all the artifacts of a namespace, and the namespace itself, in batches.
+
+        The blobs of a batch are deleted before their artifact info, so that an interrupted drop leaves no blob behind
+        and can be run again. Returns the number of deleted artifacts.
+        """
+        id_range = cls.get_artifact_id_range(namespace)
+        artifact_count = 0
+
+        while True:
+            # Deleted artifacts leave the range, so each batch is the start of the range.
+            artifacts_info = list(
+                cls.artifacts.find({"_id": id_range}, ["s3_key", "size"]).sort("_id", 1).limit(DROP_BATCH_SIZE)
+            )
+
+            if not artifacts_info:
+                break
+
+            failed_s3_keys = set(storage.get_storage().delete_many(
+                artifact_info["s3_key"] for artifact_info in artifacts_info
+            ))
+            artifacts_info = [
+                artifact_info for artifact_info in artifacts_info if artifact_info["s3_key"] not in failed_s3_keys
+            ]
+
+            cls.artifacts.delete_many({"_id": {"$in": [artifact_info["_id"] for artifact_info in artifacts_info]}})
+            cls.artifact_namespaces.update_one(
+                {"_id": namespace},
+                {"$inc": {
+                    "artifact_count": -len(artifacts_info),
+                    "size": -sum(artifact_info["size"] for artifact_info in artifacts_info),
+                }},
+            )
+            artifact_count += len(artifacts_info)
+
+            if failed_s3_keys:
+                raise Exception("Failed to delete {} artifacts of namespace {}, please drop it again!".format(
+                    len(failed_s3_keys),
+                    namespace,
+                ))
+
+        # Artifacts put meanwhile keep the namespace around.
+        if not cls.artifacts.find_one({"_id": id_range}, ["_id"]):
+            cls.artifact_namespaces.delete_one({"_id": namespace})
+
+        logging.info("Dropped {} artifacts of namespace {}".format(artifact_count, namespace))
+
+        return artifact_count
+
+
+ArtifactStore.init()
@@ -0,0 +1,120 @@
+import contextlib
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+# The codecs model archives can be compressed with, and their default levels.
+CODEC_DEFAULT_LEVELS = {
+    "none": None,
+    "gzip": 6,
+    "zstd": 3,
+    "lz4": 0,
+}
+
+
+def parse_codec(codec_spec):
+    """
+    Parse a codec spec formatted as codec[:level], e.g. "none", "gzip", "zstd:9" or "lz4".
+
+    Returns a (codec, level) tuple.
+    """
+    codec, _, level = (codec_spec or "none").partition(":")
+
+    if codec not in CODEC_DEFAULT_LEVELS:
+        raise Exception("Unknown codec {}, expecting one of {}!".format(codec, ", ".join(CODEC_DEFAULT_LEVELS)))
+
+    if codec == "none":
+        assert not level, "Codec none has no level!"
+        return codec, None
+
+    if codec == "zstd" and zstandard is None:
+        raise Exception("Codec zstd needs the zstandard package, please install it with pip3 install zstandard!")
+
+    if codec == "lz4" and lz4 is None:
+        raise Exception("Codec lz4 needs the lz4 package, please install it with pip3 install lz4!")
+
+    return codec, int(level) if level else CODEC_DEFAULT_LEVELS[codec]
+
+
+def get_codec_spec(codec, level):
+    return codec if level is None else "{}:{}".format(codec, level)
+
+
+def open_writer(fileobj, codec, level=None):
+    """
+    Open a writable file object compressing into fileobj. Closing it flushes the compressed stream, but leaves
+    fileobj open.
+    """
+    if codec == "none":
+        return contextlib.nullcontext(fileobj)
+
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=level)
+
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).stream_writer(fileobj, closefd=False)
+
+    if codec == "lz4":
+        return lz4.frame.LZ4FrameFile(fileobj, mode="wb", compression_level=level)
+
+    raise Exception("Unknown codec {}!".format(codec))
+
+
+def open_reader(fileobj, codec):
+    """
+    Open a readable file object decompressing fileobj. Closing it leaves fileobj open.
+    """
+    if codec == "none":
+        return contextlib.nullcontext(fileobj)
+
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+
+    if codec == "lz4":
+        return lz4.frame.LZ4FrameFile(fileobj, mode="rb")
+
+    raise Exception("Unknown codec {}!".format(codec))
+
+
+def compress_bytes(data, codec, level=None):
+    if codec == "none":
+        return data
+
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=level)
+
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    if codec == "lz4":
+        return lz4.frame.compress(data, compression_level=level)
+
+    raise Exception("Unknown codec {}!".format(codec))
+
+
+def decompress_bytes(data, codec):
+    if codec == "none":
+        return data
+
+    if codec == "gzip":
+        return gzip.decompress(data)
+
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    if codec == "lz4":
+        return lz4.frame.decompress(data)
+
+    raise Exception("Unknown codec {}!".format(codec))
@@ -12,6 +12,26 @@ class Config:
     AWS_ACCESS_KEY_ID = None
     AWS_SECRET_ACCESS_KEY = None
     STORAGE_CLASS = None
+    STORAGE_BACKEND = None
+    LOCAL_STORAGE_DIR = None
+    MONGO_MAX_POOL_SIZE = None
+    MONGO_MIN_POOL_SIZE = None
+    MONGO_CONNECT_TIMEOUT_MS = None
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = None
+    MONGO_SOCKET_TIMEOUT_MS = None
+    MONGO_COMPRESSORS = None
+    MONGO_LIST_READ_PREFERENCE = None
+    MODEL_TRANSFER_PART_SIZE = None
+    MODEL_TRANSFER_CONCURRENCY = None
+    MODEL_ARCHIVE_CODEC = None
+    MODEL_ARCHIVE_LAYOUT = None
+    MODEL_CHUNK_STORE_DIR = None
+    MODEL_CHUNK_STORE_MAX_BYTES = None
+    MODEL_CACHE_DIR = None
+    MODEL_CACHE_MAX_BYTES = None
+    MODEL_PUSH_ASYNC_WORKERS = None
+    MODEL_PUSH_ASYNC_MAX_BYTES = None
+    MODEL_PUSH_ASYNC_STAGING_DIR = None
 
     @classmethod
     def init(cls):
@@ -46,6 +66,102 @@ class Config:
             "storage_class",
             "standard",
         )
+        # Where the models, job archive and job logs are stored: "s3" for the s3 bucket, or "local" for a local directory,
+        # to run and benchmark model factory without s3.
+        cls.STORAGE_BACKEND = config_section.get(
+            "storage_backend",
+            "s3",
+        )
+        cls.LOCAL_STORAGE_DIR = config_section.get(
+            "local_storage_dir",
+            "~/.model_factory/storage",
+        )
+        # The mongo client options below keep the pymongo defaults unless they are set.
+        cls.MONGO_MAX_POOL_SIZE = config_section.get(
+            "mongo_max_pool_size",
+        )
+        cls.MONGO_MAX_POOL_SIZE = int(cls.MONGO_MAX_POOL_SIZE) if cls.MONGO_MAX_POOL_SIZE else None
+        cls.MONGO_MIN_POOL_SIZE = config_section.get(
+            "mongo_min_pool_size",
+        )
+        cls.MONGO_MIN_POOL_SIZE = int(cls.MONGO_MIN_POOL_SIZE) if cls.MONGO_MIN_POOL_SIZE else None
+        cls.MONGO_CONNECT_TIMEOUT_MS = config_section.get(
+            "mongo_connect_timeout_ms",
+        )
+        cls.MONGO_CONNECT_TIMEOUT_MS = int(cls.MONGO_CONNECT_TIMEOUT_MS) if cls.MONGO_CONNECT_TIMEOUT_MS else None
+        cls.MONGO_SERVER_SELECTION_TIMEOUT_MS = config_section.get(
+            "mongo_server_selection_timeout_ms",
+        )
+        cls.MONGO_SERVER_SELECTION_TIMEOUT_MS = (
+            int(cls.MONGO_SERVER_SELECTION_TIMEOUT_MS) if cls.MONGO_SERVER_SELECTION_TIMEOUT_MS else None
+        )
+        # No socket timeout by default, since migrations, rebuilds and aggregations can run for long.
+        cls.MONGO_SOCKET_TIMEOUT_MS = config_section.get(
+            "mongo_socket_timeout_ms",
+        )
+        cls.MONGO_SOCKET_TIMEOUT_MS = int(cls.MONGO_SOCKET_TIMEOUT_MS) if cls.MONGO_SOCKET_TIMEOUT_MS else None
+        # Comma separated wire protocol compressors, e.g. "zstd,snappy,zlib".
+        cls.MONGO_COMPRESSORS = config_section.get(
+            "mongo_compressors",
+        )
+        # The read preference of the dashboard and cli list queries, e.g. "secondaryPreferred" to serve them from
+        # secondaries.
+        cls.MONGO_LIST_READ_PREFERENCE = config_section.get(
+            "mongo_list_read_preference",
+            "primary",
+        )
+        # The part size in bytes and the number of concurrent part transfers of model pushes and pulls.
+        cls.MODEL_TRANSFER_PART_SIZE = int(config_section.get(
+            "model_transfer_part_size",
+            32 * 1024 * 1024,
+        ))
+        cls.MODEL_TRANSFER_CONCURRENCY = int(config_section.get(
+            "model_transfer_concurrency",
+            8,
+        ))
+        # The default codec of the pushed models, formatted as codec[:level], e.g. "zstd:3".
+        cls.MODEL_ARCHIVE_CODEC = config_section.get(
+            "model_archive_codec",
+            "none",
+        )
+        # The default layout of the pushed models: "tar" for a single tar, "chunked" for deduplicated chunks, or "files"
+        # for a separate object per file.
+        cls.MODEL_ARCHIVE_LAYOUT = config_section.get(
+            "model_archive_layout",
+            "tar",
+        )
+        # The local store of the chunks of the pulled chunked models, and its size budget in bytes.
+        cls.MODEL_CHUNK_STORE_DIR = config_section.get(
+            "model_chunk_store_dir",
+            "~/.model_factory/chunks",
+        )
+        cls.MODEL_CHUNK_STORE_MAX_BYTES = int(config_section.get(
+            "model_chunk_store_max_bytes",
+            10 * 1024 * 1024 * 1024,
+        ))
+        # The host level cache of the models pulled by the model downloader, and its size budget in bytes.
+        cls.MODEL_CACHE_DIR = config_section.get(
+            "model_cache_dir",
+            "~/.model_factory/model_cache",
+        )
+        cls.MODEL_CACHE_MAX_BYTES = int(config_section.get(
+            "model_cache_max_bytes",
+            50 * 1024 * 1024 * 1024,
+        ))
+        # The background pushes of ModelRegistry.push_async: the number of concurrent pushes, the max bytes of the
+        # models staged for upload, and where they are staged.
+        cls.MODEL_PUSH_ASYNC_WORKERS = int(config_section.get(
+            "model_push_async_workers",
+            1,
+        ))
+        cls.MODEL_PUSH_ASYNC_MAX_BYTES = int(config_section.get(
+            "model_push_async_max_bytes",
+            20 * 1024 * 1024 * 1024,
+        ))
+        cls.MODEL_PUSH_ASYNC_STAGING_DIR = config_section.get(
+            "model_push_async_staging_dir",
+            "~/.model_factory/pushes",
+        )
 
 
 Config.init()
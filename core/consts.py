@@ -9,12 +9,26 @@ MODEL_FACTORY_CONFIG_FILE = "~/.model_factory.ini"
 ################################################################################
 MODEL_FACTORY_PIPELINES_NAMESPACE = "model-factory-pipelines"
 MODEL_FACTORY_MODELS_NAMESPACE = "model-factory-models"
+MODEL_FACTORY_BENCHMARKS_NAMESPACE = "model-factory-benchmarks"
+MODEL_FACTORY_MODEL_CHUNKS_NAMESPACE = "model-factory-model-chunks"
+MODEL_FACTORY_ARTIFACTS_NAMESPACE = "model-factory-artifacts"
 
 MODEL_FACTORY_DB_NAME = "model-factory"
 MODEL_FACTORY_JOB_COLLECTION_NAME = "jobs"
+MODEL_FACTORY_JOB_EVENTS_COLLECTION_NAME = "job_events"
+MODEL_FACTORY_JOB_STATS_COLLECTION_NAME = "job_stats"
+MODEL_FACTORY_JOB_ARCHIVE_SEGMENTS_COLLECTION_NAME = "job_archive_segments"
 MODEL_FACTORY_TRIGGERS_COLLECTION_NAME = "triggers"
 MODEL_FACTORY_MODEL_REGISTRY = "models"
+MODEL_FACTORY_MODEL_METADATA_INDEXES_COLLECTION_NAME = "model_metadata_indexes"
+MODEL_FACTORY_MODEL_METRICS_COLLECTION_NAME = "model_metrics"
+MODEL_FACTORY_MODEL_METRIC_SUMMARIES_COLLECTION_NAME = "model_metric_summaries"
+MODEL_FACTORY_MODEL_CHUNKS_COLLECTION_NAME = "model_chunks"
 MODEL_FACTORY_PROD_MODEL = "production_models"
+MODEL_FACTORY_MODEL_FLEET_COLLECTION_NAME = "model_fleet"
+MODEL_FACTORY_ARTIFACTS_COLLECTION_NAME = "artifacts"
+MODEL_FACTORY_ARTIFACT_NAMESPACES_COLLECTION_NAME = "artifact_namespaces"
+MODEL_FACTORY_MIGRATIONS_COLLECTION_NAME = "migrations"
 
 
 ################################################################################
@@ -32,3 +46,58 @@ DEFAULT_GPU_REQUEST = 0
 DEFAULT_POOL = "any"
 
 TRIGGER_FAILURE_LIMIT = 15
+
+JOB_TERMINAL_STATUSES = ("succeeded", "failed", "deleted")
+
+# How often job watchers poll when change streams are not supported by the mongo server.
+JOB_WATCH_POLL_INTERVAL = 5
+
+# How often joins check the k8s job of the jobs they wait for, so that a pod killed before it could update its job
+# status, e.g. OOM killed or evicted, does not leave its parent waiting until the execution syncer catches up.
+JOB_K8S_STATUS_CHECK_INTERVAL = 60
+
+# How long the tags of the current job are cached, so that fanning out to many child operators, which inherit the
+# tags, does not read them once per child, while tags changed by other processes are picked up soon enough.
+JOB_TAGS_CACHE_SECONDS = 10
+
+# How often production model watchers poll when change streams are not supported by the mongo server.
+PRODUCTION_MODEL_WATCH_POLL_INTERVAL = 5
+
+# The max number of events kept per production model, the oldest ones being dropped.
+PRODUCTION_MODEL_MAX_EVENTS = 1000
+
+# Hosts which have not reported the model they serve for this long are considered gone from the fleet.
+MODEL_FLEET_STALE_SECONDS = 10 * 60
+
+# How often model downloader daemons report the models they serve.
+MODEL_FLEET_HEARTBEAT_INTERVAL = 60
+
+# Jobs and models older than this are hidden by the autohide service.
+AUTOHIDE_AGE_SECONDS = 7 * 24 * 3600
+
+# Hidden models created more than this long ago are garbage collected, unless they were ever in production.
+MODEL_GC_AGE_SECONDS = 30 * 24 * 3600
+
+# Model objects without a model document and unreferenced model chunks are garbage collected once they have been
+# unused for this long, which leaves time to in-flight pushes.
+MODEL_GC_GRACE_SECONDS = 24 * 3600
+
+# Terminal jobs older than this are moved to the job archive by the job archiver.
+JOB_ARCHIVE_AGE_SECONDS = 30 * 24 * 3600
+
+# The max number of jobs per job archive segment.
+JOB_ARCHIVE_SEGMENT_SIZE = 1000
+
+# The number of job archive segments cached in memory by each process.
+JOB_ARCHIVE_SEGMENT_CACHE_SIZE = 16
+
+# The metric logger writes its buffered points once it holds this many points, or every flush interval seconds.
+METRIC_LOGGER_MAX_BUFFERED_POINTS = 10000
+METRIC_LOGGER_FLUSH_INTERVAL = 1.0
+
+# The max number of points the metric logger keeps while its flushes fail, the oldest points are dropped past it.
+METRIC_LOGGER_MAX_RETAINED_POINTS = 100000
+
+# The default and max number of artifacts per page of artifact listings.
+ARTIFACT_PAGE_SIZE = 100
+ARTIFACT_MAX_PAGE_SIZE = 1000
@@ -1,4 +1,86 @@
+from core import consts
+
+import time
+
+
 class ExecutionContext:
     job_id = None
     cpu = 1
     execution_mode = None
+
+    # The fields of the current job which are cached for the lifetime of the process, all of them immutable once the
+    # job is created. Tags can be changed by any process at any time, so they are cached apart, see get_job_tags.
+    CACHED_JOB_FIELDS = [
+        "job_id",
+        "parent_job_id",
+        "pipeline_name",
+        "pipeline_params",
+        "operator_id",
+        "pool",
+        "owner",
+        "docker_image_repo",
+        "docker_image_tag",
+        "docker_image_digest",
+        "execution_mode",
+        "resources",
+        "ttl_after_finished",
+        "creation_timestamp",
+    ]
+
+    _job_info = None
+    _job_tags = None
+    _metric_logger = None
+
+    @classmethod
+    def get_job_info(cls):
+        """
+        Get the cached fields of the current job. The job document is only read once per process.
+        """
+        # Imported here, since tracking depends on the execution context.
+        from core.tracking import Tracking
+
+        if cls._job_info is None or cls._job_info["_id"] != cls.job_id:
+            cls._job_info = Tracking.get_info_for_single_job(cls.job_id, job_fields=cls.CACHED_JOB_FIELDS)
+
+        return cls._job_info
+
+    @classmethod
+    def get_job_tags(cls):
+        """
+        Get the tags of the current job. They are cached for JOB_TAGS_CACHE_SECONDS, and dropped as soon as this
+        process changes them.
+        """
+        from core.tracking import Tracking
+
+        if (
+            cls._job_tags is None or
+            cls._job_tags["job_id"] != cls.job_id or
+            time.time() - cls._job_tags["timestamp"] > consts.JOB_TAGS_CACHE_SECONDS
+        ):
+            job_info = Tracking.get_info_for_single_job(cls.job_id, job_fields=["tags"])
+            cls._job_tags = {"job_id": cls.job_id, "tags": job_info.get("tags", []), "timestamp": time.time()}
+
+        return list(cls._job_tags["tags"])
+
+    @classmethod
+    def invalidate_job_tags(cls, job_id):
+        if cls._job_tags is not None and cls._job_tags["job_id"] == job_id:
+            cls._job_tags = None
+
+    @classmethod
+    def get_metric_logger(cls):
+        """
+        Get the metric logger of the current job, which buffers metric points and writes them in the background.
+        """
+        # Imported here, since the metric logger depends on tracking.
+        from core.metric_logger import MetricLogger
+
+        if cls._metric_logger is None or cls._metric_logger.job_id != cls.job_id:
+            cls._metric_logger = MetricLogger(job_id=cls.job_id)
+
+        return cls._metric_logger
+
+    @classmethod
+    def flush_metric_logger(cls):
+        if cls._metric_logger is not None:
+            cls._metric_logger.flush()
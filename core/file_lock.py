@@ -0,0 +1,21 @@
+import contextlib
+import fcntl
+
+
+@contextlib.contextmanager
+def flock(lock_path, blocking=True):
+    """
+    Hold an exclusive lock on lock_path, shared by all the processes of the host. Yields whether the lock is held,
+    which is only False when not blocking and the lock is busy.
+    """
+    with open(lock_path, "a") as fp:
+        try:
+            fcntl.flock(fp, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
@@ -0,0 +1,356 @@
+from core import consts
+from core import mongo
+from core import storage
+
+import functools
+import gzip
+import json
+import logging
+import time
+import uuid
+
+
+# Marks a field missing from a document, since None is a valid field value.
+_MISSING = object()
+
+
+def _get_field(document, field):
+    value = document
+
+    for part in field.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+
+        value = value[part]
+
+    return value
+
+
+def _equals(value, expected):
+    if value is _MISSING:
+        return expected is None
+
+    # Like mongo, a scalar condition on an array field matches any of its elements.
+    if isinstance(value, list) and not isinstance(expected, list):
+        return expected in value
+
+    return value == expected
+
+
+def _compare(value, expected, operator):
+    values = value if isinstance(value, list) else [value]
+
+    for value in values:
+        if value is _MISSING or value is None:
+            continue
+
+        try:
+            if (
+                (operator == "$gt" and value > expected) or
+                (operator == "$gte" and value >= expected) or
+                (operator == "$lt" and value < expected) or
+                (operator == "$lte" and value <= expected)
+            ):
+                return True
+        except TypeError:
+            continue
+
+    return False
+
+
+def _matches_condition(value, condition):
+    if not isinstance(condition, dict) or not all(key.startswith("$") for key in condition):
+        return _equals(value, condition)
+
+    for operator, expected in condition.items():
+        if operator == "$eq":
+            matched = _equals(value, expected)
+        elif operator == "$ne":
+            matched = not _equals(value, expected)
+        elif operator == "$in":
+            matched = any(_equals(value, element) for element in expected)
+        elif operator == "$nin":
+            matched = not any(_equals(value, element) for element in expected)
+        elif operator == "$all":
+            matched = all(_equals(value, element) for element in expected)
+        elif operator in ("$gt", "$gte", "$lt", "$lte"):
+            matched = _compare(value, expected, operator)
+        elif operator == "$exists":
+            matched = (value is not _MISSING) == bool(expected)
+        else:
+            raise Exception("Query operator {} is not supported on archived jobs!".format(operator))
+
+        if not matched:
+            return False
+
+    return True
+
+
+def matches_filter(document, query_filter):
+    """
+    Evaluate a mongo query filter on a document.
+
+    Only the subset of the query language used on jobs is supported: equality, $eq, $ne, $in, $nin, $all, $gt, $gte,
+    $lt, $lte, $exists, $and, $or and $nor.
+    """
+    for key, condition in (query_filter or {}).items():
+        if key == "$and":
+            matched = all(matches_filter(document, sub_filter) for sub_filter in condition)
+        elif key == "$or":
+            matched = any(matches_filter(document, sub_filter) for sub_filter in condition)
+        elif key == "$nor":
+            matched = not any(matches_filter(document, sub_filter) for sub_filter in condition)
+        elif key.startswith("$"):
+            raise Exception("Query operator {} is not supported on archived jobs!".format(key))
+        else:
+            matched = _matches_condition(_get_field(document, key), condition)
+
+        if not matched:
+            return False
+
+    return True
+
+
+def _project(document, projection, extra_fields=()):
+    """
+    Apply a top level field projection, given as a list of fields or a mongo projection dictionary.
+    """
+    if not projection:
+        return dict(document)
+
+    if not isinstance(projection, dict):
+        projection = {field: 1 for field in projection}
+
+    top_level_projection = {field.split(".")[0]: value for field, value in projection.items()}
+
+    if any(value for field, value in top_level_projection.items() if field != "_id"):
+        fields = [field for field, value in top_level_projection.items() if value] + list(extra_fields)
+
+        if top_level_projection.get("_id", 1):
+            fields.append("_id")
+
+        return {field: document[field] for field in fields if field in document}
+
+    return {
+        field: value for field, value in document.items()
+        if top_level_projection.get(field, 1) or field in extra_fields
+    }
+
+
+def _get_sort_value(document):
+    return (document.get("creation_timestamp") or 0, document["_id"])
+
+
+@functools.lru_cache(maxsize=consts.JOB_ARCHIVE_SEGMENT_CACHE_SIZE)
+def _load_segment(s3_key):
+    # Segments are immutable once written, so they can be cached by key.
+    return [
+        json.loads(line)
+        for line in gzip.decompress(storage.get_storage().get(s3_key)).decode().splitlines()
+        if line
+    ]
+
+
+class JobArchive:
+    """
+    Job archive keeps cold terminal jobs out of the jobs collection.
+
+    Archived jobs are stored in the storage as gzipped json lines segments, partitioned by the creation day of the jobs:
+
+        job_archive/YYYY/MM/DD/<segment_id>.jsonl.gz
+
+    Each segment has a small manifest in the job_archive_segments collection, listing the ids of its jobs together
+    with their creation time range, owners and pipelines, so that lookups only read the segments they need.
+    """
+
+    # Managed indexes. See core.mongo.ensure_indexes for the spec format.
+    SEGMENT_INDEXES = {
+        "job_ids": {"keys": [("job_ids", 1)]},
+        "max_creation_timestamp": {"keys": [("max_creation_timestamp", -1)]},
+        "min_creation_timestamp": {"keys": [("min_creation_timestamp", 1)]},
+    }
+
+    # The fields projected out of the manifests when they are used to locate segments. The job ids of a manifest are
+    # the jobs the segment is authoritative for, since a job archived again moves to a newer segment.
+    SEGMENT_LOOKUP_FIELDS = ["s3_key", "job_ids", "min_creation_timestamp", "max_creation_timestamp"]
+
+    @classmethod
+    def init(cls):
+        cls.segments = mongo.get_collection(consts.MODEL_FACTORY_JOB_ARCHIVE_SEGMENTS_COLLECTION_NAME)
+
+    @classmethod
+    def ensure_indexes(cls):
+        mongo.ensure_indexes(cls.segments, cls.SEGMENT_INDEXES)
+
+    @classmethod
+    def get_segment_s3_key(cls, day, segment_id):
+        return "job_archive/{}/{}.jsonl.gz".format(day.replace("-", "/"), segment_id)
+
+    @classmethod
+    def write_segment(cls, day, jobs_info):
+        """
+        Write the jobs created on the given day (YYYY-MM-DD) to a new segment, and record its manifest.
+        """
+        assert jobs_info, "Cannot write an empty job archive segment!"
+
+        jobs_info = sorted(jobs_info, key=_get_sort_value)
+        segment_id = "s-{}".format(uuid.uuid4())
+        s3_key = cls.get_segment_s3_key(day, segment_id)
+
+        data = "".join(json.dumps(job_info, default=str) + "\n" for job_info in jobs_info).encode()
+        compressed_data = gzip.compress(data)
+
+        storage.get_storage().put(s3_key, compressed_data)
+
+        manifest = {
+            "_id": segment_id,
+            "day": day,
+            "s3_key": s3_key,
+            "job_ids": [job_info["_id"] for job_info in jobs_info],
+            "job_count": len(jobs_info),
+            "min_creation_timestamp": _get_sort_value(jobs_info[0])[0],
+            "max_creation_timestamp": _get_sort_value(jobs_info[-1])[0],
+            "owners": sorted({job_info.get("owner") for job_info in jobs_info if job_info.get("owner")}),
+            "pipeline_names": sorted({
+                job_info.get("pipeline_name") for job_info in jobs_info if job_info.get("pipeline_name")
+            }),
+            "size": len(data),
+            "compressed_size": len(compressed_data),
+            "creation_timestamp": time.time(),
+        }
+        cls.segments.insert_one(manifest)
+
+        logging.info("Archived {} jobs to {} ({} bytes).".format(len(jobs_info), s3_key, len(compressed_data)))
+
+        return manifest
+
+    @classmethod
+    def get_archived_job_ids(cls, job_ids):
+        archived_job_ids = set()
+
+        for manifest in cls.segments.find({"job_ids": {"$in": list(job_ids)}}, ["job_ids"]):
+            archived_job_ids.update(manifest["job_ids"])
+
+        return archived_job_ids & set(job_ids)
+
+    @classmethod
+    def supersede_jobs(cls, job_ids, segment_id):
+        """
+        Remove jobs archived again in the segment segment_id from the manifests of their older segments.
+        """
+        cls.segments.update_many(
+            {"job_ids": {"$in": list(job_ids)}, "_id": {"$ne": segment_id}},
+            {"$pull": {"job_ids": {"$in": list(job_ids)}}},
+        )
+
+    @classmethod
+    def iter_jobs(cls, since_day=None):
+        """
+        Iterate over the archived jobs created since since_day (YYYY-MM-DD), or over all of them, segment by segment.
+        """
+        segment_filter = {"day": {"$gte": since_day}} if since_day else {}
+
+        for manifest in cls.segments.find(segment_filter, ["s3_key", "job_ids"]):
+            manifest_job_ids = set(manifest["job_ids"])
+
+            for job_info in _load_segment(manifest["s3_key"]):
+                if job_info["_id"] in manifest_job_ids:
+                    yield job_info
+
+    @classmethod
+    def get_info_for_single_job(cls, job_id, job_fields=None):
+        manifest = cls.segments.find_one({"job_ids": job_id}, cls.SEGMENT_LOOKUP_FIELDS)
+
+        if not manifest:
+            return None
+
+        for job_info in _load_segment(manifest["s3_key"]):
+            if job_info["_id"] == job_id:
+                return _project(job_info, job_fields)
+
+        return None
+
+    @classmethod
+    def _get_segment_filter(cls, job_filter, descending, after, before):
+        """
+        Narrow down the segments which may hold jobs matching the filter, using their manifests.
+        """
+        segment_filter = {}
+
+        for field, manifest_field in (("owner", "owners"), ("pipeline_name", "pipeline_names")):
+            if isinstance(job_filter.get(field), str):
+                segment_filter[manifest_field] = job_filter[field]
+
+        for field in ("_id", "job_id"):
+            condition = job_filter.get(field)
+
+            if isinstance(condition, str):
+                segment_filter["job_ids"] = condition
+            elif isinstance(condition, dict) and list(condition) == ["$in"]:
+                segment_filter["job_ids"] = {"$in": condition["$in"]}
+
+        # Jobs are sorted by creation time, so the keyset bounds prune segments by their creation time range.
+        if after:
+            segment_filter["min_creation_timestamp" if descending else "max_creation_timestamp"] = {
+                "$lte" if descending else "$gte": after[0],
+            }
+
+        if before:
+            segment_filter["max_creation_timestamp" if descending else "min_creation_timestamp"] = {
+                "$gte" if descending else "$lte": before[0],
+            }
+
+        return segment_filter
+
+    @classmethod
+    def find_jobs(cls, job_filter, job_fields=None, limit=None, descending=True, after=None, before=None):
+        """
+        Find the archived jobs matching job_filter, ordered by (creation_timestamp, _id).
+
+        after and before are optional (creation_timestamp, _id) keyset bounds, both exclusive: only the jobs ordered
+        after `after` and before `before` are returned.
+        """
+        job_filter = job_filter or {}
+
+        def _is_in_range(job_info):
+            sort_value = _get_sort_value(job_info)
+
+            if descending:
+                return (not after or sort_value < after) and (not before or sort_value > before)
+
+            return (not after or sort_value > after) and (not before or sort_value < before)
+
+        manifests = cls.segments.find(
+            cls._get_segment_filter(job_filter, descending, after, before),
+            cls.SEGMENT_LOOKUP_FIELDS,
+        ).sort("max_creation_timestamp" if descending else "min_creation_timestamp", -1 if descending else 1)
+
+        jobs_info = []
+        for manifest in manifests:
+            # Segments come in order of their newest (or oldest) job, so once there are enough jobs, the remaining
+            # segments cannot hold a job ordered before the ones found.
+            if limit and len(jobs_info) >= limit:
+                last_creation_timestamp = _get_sort_value(jobs_info[limit - 1])[0]
+
+                if (
+                    (descending and manifest["max_creation_timestamp"] < last_creation_timestamp) or
+                    (not descending and manifest["min_creation_timestamp"] > last_creation_timestamp)
+                ):
+                    break
+
+            manifest_job_ids = set(manifest["job_ids"])
+            jobs_info.extend(
+                job_info for job_info in _load_segment(manifest["s3_key"])
+                if job_info["_id"] in manifest_job_ids and
+                _is_in_range(job_info) and
+                matches_filter(job_info, job_filter)
+            )
+            jobs_info.sort(key=_get_sort_value, reverse=descending)
+
+        if limit:
+            jobs_info = jobs_info[:limit]
+
+        return [_project(job_info, job_fields, extra_fields=["creation_timestamp"]) for job_info in jobs_info]
+
+
+JobArchive.init()
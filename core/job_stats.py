@@ -0,0 +1,132 @@
+from datetime import datetime
+
+import json
+import math
+
+
+# Durations are counted in log2 buckets: bucket b holds durations within [2^b, 2^(b+1)) seconds, and bucket 0 also
+# holds durations shorter than one second.
+HISTOGRAM_BUCKET_COUNT = 25
+
+# The job fields needed to compute the job stats.
+JOB_STATS_FIELDS = [
+    "pipeline_name",
+    "owner",
+    "pool",
+    "status",
+    "creation_timestamp",
+    "start_timestamp",
+    "completion_timestamp",
+    "exit_reason",
+    "exception",
+]
+
+# The dimensions job stats can be grouped by.
+JOB_STATS_DIMENSIONS = ("day", "pipeline_name", "owner", "pool")
+
+
+def get_histogram_bucket_name(seconds):
+    bucket = int(math.log2(seconds)) if seconds >= 1 else 0
+    return "b{:02d}".format(min(bucket, HISTOGRAM_BUCKET_COUNT - 1))
+
+
+def get_percentile_from_histogram(histogram, percentile):
+    """
+    Estimate a percentile from a log2 histogram, interpolating linearly within the bucket.
+    """
+    total_count = sum(histogram.values())
+
+    if not total_count:
+        return None
+
+    target_count = percentile / 100 * total_count
+    cumulative_count = 0
+
+    for bucket in range(HISTOGRAM_BUCKET_COUNT):
+        bucket_count = histogram.get("b{:02d}".format(bucket), 0)
+
+        if not bucket_count:
+            continue
+
+        if cumulative_count + bucket_count >= target_count:
+            lower_bound = 2 ** bucket if bucket else 0
+            upper_bound = 2 ** (bucket + 1)
+            return lower_bound + (upper_bound - lower_bound) * (target_count - cumulative_count) / bucket_count
+
+        cumulative_count += bucket_count
+
+    return 2 ** HISTOGRAM_BUCKET_COUNT
+
+
+def get_failure_reason(job_info):
+    """
+    Get a short failure reason: the k8s exit reason, or the exception type raised by the operator.
+    """
+    if job_info.get("exit_reason"):
+        reason = job_info["exit_reason"]
+    elif job_info.get("exception"):
+        lines = [line for line in job_info["exception"].strip().splitlines() if line.strip()]
+        reason = lines[-1].split(":")[0] if lines else "unknown"
+    else:
+        reason = "unknown"
+
+    # Failure reasons are used as document keys.
+    return reason.replace(".", "_").replace("$", "_")[:100]
+
+
+def get_summary_key(job_info):
+    """
+    Get the dimensions of the summary document a job is counted in.
+    """
+    return {
+        "day": datetime.utcfromtimestamp(job_info["creation_timestamp"]).strftime("%Y-%m-%d"),
+        "pipeline_name": job_info.get("pipeline_name"),
+        "owner": job_info.get("owner"),
+        "pool": job_info.get("pool"),
+    }
+
+
+def get_summary_id(summary_key):
+    return json.dumps([summary_key[dimension] for dimension in JOB_STATS_DIMENSIONS])
+
+
+def get_summary_increments(job_info):
+    """
+    Get the counters a terminal job adds to its summary document.
+    """
+    status = job_info["status"]
+    increments = {
+        "count": 1,
+        status: 1,
+    }
+
+    start_timestamp = job_info.get("start_timestamp")
+    completion_timestamp = job_info.get("completion_timestamp")
+    creation_timestamp = job_info.get("creation_timestamp")
+
+    if start_timestamp and completion_timestamp:
+        duration = max(completion_timestamp - start_timestamp, 0)
+        increments["duration_sum"] = duration
+        increments["duration_count"] = 1
+        increments["duration_histogram.{}".format(get_histogram_bucket_name(duration))] = 1
+
+    if start_timestamp and creation_timestamp:
+        queue_wait = max(start_timestamp - creation_timestamp, 0)
+        increments["queue_wait_sum"] = queue_wait
+        increments["queue_wait_count"] = 1
+        increments["queue_wait_histogram.{}".format(get_histogram_bucket_name(queue_wait))] = 1
+
+    if status == "failed":
+        increments["failure_reasons.{}".format(get_failure_reason(job_info))] = 1
+
+    return increments
+
+
+def merge_counters(counters_list):
+    merged_counters = {}
+
+    for counters in counters_list:
+        for key, value in (counters or {}).items():
+            merged_counters[key] = merged_counters.get(key, 0) + value
+
+    return merged_counters
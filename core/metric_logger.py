@@ -0,0 +1,132 @@
+from bson.objectid import ObjectId
+from core import consts
+from core.tracking import Tracking
+
+import atexit
+import logging
+import threading
+import time
+
+
+class MetricLogger:
+    """
+    Log metric points from pipeline code without a database round trip per point.
+
+    Points are buffered in memory and written in bulk by a background thread, either every flush_interval seconds or
+    as soon as max_buffered_points points are buffered. Points are coalesced by (model_id, key, step): logging the
+    same key and step twice before a flush only keeps the latest value, so points logged without a step keep the
+    latest value of their key per flush.
+
+    Each point gets its _id when it is logged, so that a flush retried after a partial failure skips the points
+    already written. While flushes fail, at most max_retained_points points are kept, and the oldest ones are dropped.
+
+    Pipeline code should use the metric logger of the execution context:
+
+        metric_logger = ExecutionContext.get_metric_logger()
+        metric_logger.log("loss", loss, step=step)
+    """
+
+    def __init__(
+        self,
+        job_id=None,
+        model_id=None,
+        max_buffered_points=consts.METRIC_LOGGER_MAX_BUFFERED_POINTS,
+        flush_interval=consts.METRIC_LOGGER_FLUSH_INTERVAL,
+        max_retained_points=consts.METRIC_LOGGER_MAX_RETAINED_POINTS,
+    ):
+        assert job_id or model_id, "A metric logger needs a job_id or a model_id!"
+
+        self.job_id = job_id
+        self.model_id = model_id
+        self.max_buffered_points = max_buffered_points
+        self.flush_interval = flush_interval
+        self.max_retained_points = max_retained_points
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._points = {}
+        self._flush_requested = threading.Event()
+        self._closed = False
+        self._dropped_point_count = 0
+
+        self._flush_thread = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flush_thread.start()
+
+        atexit.register(self.close)
+
+    def log(self, key, value, step=None, model_id=None):
+        """
+        Buffer a metric point. model_id defaults to the model of the metric logger.
+        """
+        timestamp = time.time()
+
+        with self._lock:
+            self._points[(model_id or self.model_id, key, step)] = (value, timestamp, str(ObjectId()))
+            self._drop_oldest_points()
+            buffered_point_count = len(self._points)
+
+        # Leave the write to the background thread, so that logging never blocks on the database.
+        if buffered_point_count >= self.max_buffered_points:
+            self._flush_requested.set()
+
+    def flush(self):
+        """
+        Write all the buffered points.
+        """
+        # Serialize flushes, so that the latest value of a point is never overwritten by an older one.
+        with self._flush_lock:
+            with self._lock:
+                points, self._points = self._points, {}
+
+            if not points:
+                return
+
+            try:
+                Tracking.add_metrics([
+                    {
+                        "_id": point_id,
+                        "model_id": model_id,
+                        "job_id": self.job_id,
+                        "key": key,
+                        "value": value,
+                        "step": step,
+                        "timestamp": timestamp,
+                    }
+                    for (model_id, key, step), (value, timestamp, point_id) in points.items()
+                ])
+            except:
+                # Put the points back, unless they were logged again in the meantime, so that the next flush retries.
+                # The points written before the failure are skipped by the retry, since they keep their _id.
+                with self._lock:
+                    points.update(self._points)
+                    self._points = points
+                    self._drop_oldest_points()
+
+                raise
+
+    def _drop_oldest_points(self):
+        # Points are kept in the order they were first buffered, so the first ones are the oldest.
+        while len(self._points) > self.max_retained_points:
+            del self._points[next(iter(self._points))]
+            self._dropped_point_count += 1
+
+            # Warn once per power of ten, rather than once per point, while the database is unavailable.
+            if str(self._dropped_point_count).strip("0") == "1":
+                logging.warning("Dropped {} metric points which could not be written!".format(
+                    self._dropped_point_count
+                ))
+
+    def close(self):
+        self._closed = True
+        self._flush_requested.set()
+        self.flush()
+
+    def _flush_periodically(self):
+        while not self._closed:
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Failed to flush {} buffered metric points!".format(len(self._points)))
@@ -0,0 +1,256 @@
+from core.config import Config
+from core.file_lock import flock
+from core.model_registry import ModelRegistry
+
+import contextlib
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+
+# The size of the reads when hashing files.
+_HASH_READ_SIZE = 4 * 1024 * 1024
+
+
+def _hash_file(file_path):
+    file_hash = hashlib.sha256()
+
+    with open(file_path, "rb") as fp:
+        for data in iter(lambda: fp.read(_HASH_READ_SIZE), b""):
+            file_hash.update(data)
+
+    return file_hash.hexdigest()
+
+
+def _get_file_signature(file_path):
+    # Writing a file changes its modification time, and replacing it its inode. The change time is left out, since
+    # serving the file by a hard link changes it.
+    stat = os.stat(file_path)
+
+    return [stat.st_mtime_ns, stat.st_ino]
+
+
+def _list_files(root_dir):
+    files = []
+
+    for dir_path, _, file_names in os.walk(root_dir):
+        for file_name in file_names:
+            files.append(os.path.relpath(os.path.join(dir_path, file_name), root_dir))
+
+    return sorted(files)
+
+
+def _write_json(file_path, data):
+    # Write to a temporary file first, so that readers never see a partial file.
+    tmp_path = "{}.{}.tmp".format(file_path, uuid.uuid4())
+
+    with open(tmp_path, "w") as fp:
+        json.dump(data, fp)
+
+    os.replace(tmp_path, file_path)
+
+
+class ModelCache:
+    """
+    A host level cache of pulled models, keyed by model id, shared by all the processes of the host through file locks.
+
+        <cache_dir>/entries/<model_id>/       the pulled model
+        <cache_dir>/entries/<model_id>.json   the checksums and signatures of the model files, and the last access
+        <cache_dir>/locks/<model_id>.lock     held while the model is pulled, served or evicted
+
+    A model is pulled into the cache once, and then served by hard links, or copies across file systems. Concurrent
+    pulls of a model on a host wait for the first one instead of downloading the model again. Cached files are made
+    read only, since hard links share their content with the served copies. Once the cache holds more than max_bytes,
+    the least recently used models are evicted.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, verify=False):
+        self.cache_dir = os.path.expanduser(cache_dir or Config.MODEL_CACHE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else Config.MODEL_CACHE_MAX_BYTES
+        self.verify = verify
+
+        for dir_name in ("entries", "locks", "tmp"):
+            os.makedirs(os.path.join(self.cache_dir, dir_name), exist_ok=True)
+
+    def _get_entry_dir(self, model_id):
+        return os.path.join(self.cache_dir, "entries", model_id)
+
+    def _get_entry_path(self, model_id):
+        return os.path.join(self.cache_dir, "entries", "{}.json".format(model_id))
+
+    def _get_lock_path(self, model_id):
+        return os.path.join(self.cache_dir, "locks", "{}.lock".format(model_id))
+
+    def _load_entry(self, model_id):
+        try:
+            with open(self._get_entry_path(model_id)) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def _list_entries(self):
+        entries = []
+
+        for file_name in os.listdir(os.path.join(self.cache_dir, "entries")):
+            if file_name.endswith(".json"):
+                entry = self._load_entry(file_name[:-len(".json")])
+
+                if entry:
+                    entries.append(entry)
+
+        return entries
+
+    def _is_valid(self, entry):
+        """
+        Check the files of a cached model against its entry: their sizes always, and their checksums when verifying or
+        when their signature, i.e. their modification time and inode, changed since they were last checked. The
+        signatures of the files found valid are updated in the entry.
+        """
+        entry_dir = self._get_entry_dir(entry["model_id"])
+
+        for file_info in entry["files"]:
+            relative_path, size, sha256 = file_info[:3]
+            file_path = os.path.join(entry_dir, relative_path)
+
+            if not os.path.isfile(file_path) or os.path.getsize(file_path) != size:
+                return False
+
+            # Entries recorded without signatures are checked once.
+            signature = _get_file_signature(file_path)
+            if self.verify or file_info[3:] != [signature]:
+                if _hash_file(file_path) != sha256:
+                    return False
+
+                file_info[3:] = [signature]
+
+        return True
+
+    def _fill(self, model_id):
+        """
+        Pull a model into the cache, and record its entry once it is complete.
+        """
+        tmp_dir = os.path.join(self.cache_dir, "tmp", "{}-{}".format(model_id, uuid.uuid4()))
+
+        try:
+            model_info = ModelRegistry.pull(model_id, tmp_dir)
+
+            files = []
+            for relative_path in _list_files(tmp_dir):
+                file_path = os.path.join(tmp_dir, relative_path)
+                os.chmod(file_path, 0o444)
+                files.append([
+                    relative_path,
+                    os.path.getsize(file_path),
+                    _hash_file(file_path),
+                    _get_file_signature(file_path),
+                ])
+
+            entry_dir = self._get_entry_dir(model_id)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(tmp_dir, entry_dir)
+        except:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        entry = {
+            "model_id": model_id,
+            "model_name": model_info.get("model_name"),
+            "files": files,
+            "size": sum(file_info[1] for file_info in files),
+            "creation_timestamp": time.time(),
+            "last_access_timestamp": time.time(),
+        }
+        _write_json(self._get_entry_path(model_id), entry)
+
+        return entry
+
+    def _remove_entry(self, model_id):
+        # The entry goes first, so that a partially removed model is never served.
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._get_entry_path(model_id))
+
+        shutil.rmtree(self._get_entry_dir(model_id), ignore_errors=True)
+
+    def _materialize(self, entry, target_dir):
+        entry_dir = self._get_entry_dir(entry["model_id"])
+
+        for relative_path, *_ in entry["files"]:
+            source_path = os.path.join(entry_dir, relative_path)
+            target_path = os.path.join(target_dir, relative_path)
+
+            if os.path.exists(target_path) and os.path.samefile(source_path, target_path):
+                continue
+
+            tmp_path = os.path.join(os.path.dirname(target_path), ".{}.tmp".format(uuid.uuid4()))
+
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+
+            try:
+                os.link(source_path, tmp_path)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+
+                shutil.copyfile(source_path, tmp_path)
+
+            os.replace(tmp_path, target_path)
+
+    def pull(self, model_id, target_dir):
+        """
+        Pull a model to target_dir through the cache. Returns whether the model was served from the cache.
+        """
+        target_dir = os.path.expanduser(target_dir)
+
+        with flock(self._get_lock_path(model_id)):
+            entry = self._load_entry(model_id)
+            hit = bool(entry) and self._is_valid(entry)
+
+            if not hit:
+                if entry:
+                    logging.warning("Cached model {} is corrupted, pulling it again".format(model_id))
+
+                entry = self._fill(model_id)
+            else:
+                entry["last_access_timestamp"] = time.time()
+                _write_json(self._get_entry_path(model_id), entry)
+
+            self._materialize(entry, target_dir)
+
+        logging.info("{} model {} ({} bytes) to {}".format(
+            "Served cached" if hit else "Cached",
+            model_id,
+            entry["size"],
+            target_dir,
+        ))
+
+        if not hit:
+            self.evict()
+
+        return hit
+
+    def evict(self):
+        """
+        Evict the least recently used models until the cache fits in max_bytes. Models being pulled or served are
+        skipped.
+        """
+        with flock(os.path.join(self.cache_dir, "evict.lock")):
+            entries = sorted(self._list_entries(), key=lambda entry: entry["last_access_timestamp"])
+            cache_size = sum(entry["size"] for entry in entries)
+
+            for entry in entries:
+                if cache_size <= self.max_bytes:
+                    break
+
+                with flock(self._get_lock_path(entry["model_id"]), blocking=False) as locked:
+                    if not locked:
+                        continue
+
+                    self._remove_entry(entry["model_id"])
+                    cache_size -= entry["size"]
+
+                    logging.info("Evicted cached model {} ({} bytes)".format(entry["model_id"], entry["size"]))
@@ -0,0 +1,448 @@
+from core import compression
+from core import consts as mf_consts
+from core import model_transfer
+from core import storage
+from core.config import Config
+from core.file_lock import flock
+from core.tracking import Tracking
+
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import tarfile
+import tempfile
+import threading
+import uuid
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Content-defined chunking: a chunk ends wherever the rolling hash of the last CHUNK_HASH_WINDOW bytes hits a target,
+# so chunk boundaries move with the content rather than with offsets, and an insertion only changes the chunks around
+# it. Chunks are at least CHUNK_MIN_SIZE and at most CHUNK_MAX_SIZE bytes, and about CHUNK_MIN_SIZE + 2^CHUNK_HASH_BITS
+# bytes on average.
+CHUNK_HASH_WINDOW = 48
+CHUNK_HASH_BITS = 20
+CHUNK_MIN_SIZE = 256 * 1024
+CHUNK_MAX_SIZE = 4 * 1024 * 1024
+
+# The number of chunks looked up in the chunk collection at once.
+CHUNK_LOOKUP_BATCH_SIZE = 64
+
+# The rolling hash is the sum of a random 64 bits value per byte over the window, mixed by a multiplication so that
+# its top bits depend on all the bytes of the window.
+_GEAR_RANDOM = random.Random(0x6d6f64656c)
+_GEAR = [_GEAR_RANDOM.getrandbits(64) for _ in range(256)]
+_MIX = 0x9e3779b97f4a7c15
+
+_SCAN_BLOCK_SIZE = 1024 * 1024
+
+
+def _find_hash_boundary(data, start, end):
+    window_data = numpy.frombuffer(
+        data,
+        dtype=numpy.uint8,
+        count=end - start + CHUNK_HASH_WINDOW - 1,
+        offset=start - CHUNK_HASH_WINDOW + 1,
+    )
+
+    # Window sums as differences of prefix sums, wrapping around at 64 bits.
+    prefix_sums = numpy.zeros(len(window_data) + 1, dtype=numpy.uint64)
+    numpy.cumsum(_GEAR_ARRAY[window_data], dtype=numpy.uint64, out=prefix_sums[1:])
+    window_hashes = prefix_sums[CHUNK_HASH_WINDOW:] - prefix_sums[:end - start]
+
+    boundaries = numpy.flatnonzero(
+        (window_hashes * numpy.uint64(_MIX)) >> numpy.uint64(64 - CHUNK_HASH_BITS) == 0
+    )
+
+    return start + int(boundaries[0]) + 1 if len(boundaries) else None
+
+
+if numpy is not None:
+    _GEAR_ARRAY = numpy.array(_GEAR, dtype=numpy.uint64)
+
+
+def find_chunk_boundary(data, eof=False):
+    """
+    Get the size of the first chunk of data, or None if more data is needed to find it.
+    """
+    if len(data) <= CHUNK_MIN_SIZE:
+        return len(data) if eof and data else None
+
+    end = min(len(data), CHUNK_MAX_SIZE)
+
+    for start in range(CHUNK_MIN_SIZE, end, _SCAN_BLOCK_SIZE):
+        boundary = _find_hash_boundary(data, start, min(start + _SCAN_BLOCK_SIZE, end))
+
+        if boundary is not None:
+            return boundary
+
+    if len(data) >= CHUNK_MAX_SIZE:
+        return CHUNK_MAX_SIZE
+
+    return len(data) if eof else None
+
+
+def get_chunk_s3_key(chunk_hash, generation=None):
+    """
+    Get the key of a chunk object. Each upload of a chunk is a new generation of it, so that a chunk uploaded again
+    never overwrites the object of its garbage collected generation. Chunks stored before generations have none.
+    """
+    chunk_s3_key = "{}/{}/{}".format(mf_consts.MODEL_FACTORY_MODEL_CHUNKS_NAMESPACE, chunk_hash[:2], chunk_hash)
+
+    return "{}.{}".format(chunk_s3_key, generation) if generation else chunk_s3_key
+
+
+def get_manifest_chunk_hashes(manifest):
+    return {manifest_entry[0] for manifest_entry in manifest}
+
+
+class ChunkingWriter(io.RawIOBase):
+    """
+    A writable file object cutting its content into content-defined chunks, and uploading the chunks not stored yet.
+
+    Chunks are identified by the sha256 of their content, compressed with the codec, and uploaded concurrently. The
+    list of chunks making up the content, as [hash, size, codec, generation] entries, is in manifest once the writer
+    is closed.
+    """
+
+    def __init__(self, codec="none", level=None, concurrency=None):
+        # Hashing every byte in python is too slow for models, so chunking needs numpy.
+        if numpy is None:
+            raise Exception("The chunked layout needs the numpy package, please install it with pip3 install numpy!")
+
+        self.codec = codec
+        self.level = level
+        self.concurrency = concurrency or Config.MODEL_TRANSFER_CONCURRENCY
+
+        self.manifest = None
+        self.raw_size = 0
+        self.new_chunk_count = 0
+        self.new_size = 0
+
+        self._buffer = bytearray()
+        self._chunks = []
+        self._pending_chunks = []
+        self._stored_chunks = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._upload_futures = []
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._aborted = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self.raw_size += len(data)
+
+        while len(self._buffer) >= CHUNK_MAX_SIZE:
+            self._cut_chunk(eof=False)
+
+        return len(data)
+
+    def _cut_chunk(self, eof):
+        chunk_size = find_chunk_boundary(self._buffer, eof=eof)
+        chunk = bytes(self._buffer[:chunk_size])
+        del self._buffer[:chunk_size]
+
+        chunk_hash = hashlib.sha256(chunk).hexdigest()
+        self._chunks.append((chunk_hash, len(chunk)))
+        self._pending_chunks.append((chunk_hash, chunk))
+
+        if len(self._pending_chunks) >= CHUNK_LOOKUP_BATCH_SIZE:
+            self._store_pending_chunks()
+
+    def _store_pending_chunks(self):
+        pending_chunks, self._pending_chunks = self._pending_chunks, []
+
+        # Keep the reused chunks from being garbage collected until the manifest references them.
+        stored_chunks = Tracking.touch_model_chunks(
+            {chunk_hash for chunk_hash, _ in pending_chunks if chunk_hash not in self._stored_chunks}
+        )
+
+        for chunk_hash, chunk in pending_chunks:
+            if chunk_hash in self._stored_chunks:
+                continue
+
+            if chunk_hash in stored_chunks:
+                self._stored_chunks[chunk_hash] = [
+                    stored_chunks[chunk_hash]["codec"],
+                    stored_chunks[chunk_hash].get("generation"),
+                ]
+                continue
+
+            # Fail fast if an earlier chunk failed.
+            for upload_future in self._upload_futures:
+                if upload_future.done() and upload_future.exception():
+                    raise upload_future.exception()
+
+            generation = uuid.uuid4().hex
+            self._stored_chunks[chunk_hash] = [self.codec, generation]
+            self._slots.acquire()
+
+            upload_future = self._executor.submit(self._upload_chunk, chunk_hash, chunk, generation)
+            upload_future.add_done_callback(lambda _: self._slots.release())
+            self._upload_futures.append(upload_future)
+
+    def _upload_chunk(self, chunk_hash, chunk, generation):
+        stored_chunk = compression.compress_bytes(chunk, self.codec, self.level)
+
+        storage.get_storage().put(get_chunk_s3_key(chunk_hash, generation), stored_chunk)
+
+        chunk_info = Tracking.add_model_chunk(chunk_hash, len(chunk), len(stored_chunk), self.codec, generation)
+
+        # A concurrent push stored the chunk first, so its generation is used instead.
+        if chunk_info.get("generation") != generation:
+            storage.get_storage().delete(get_chunk_s3_key(chunk_hash, generation))
+
+            with self._lock:
+                self._stored_chunks[chunk_hash] = [chunk_info["codec"], chunk_info.get("generation")]
+
+            return
+
+        with self._lock:
+            self.new_chunk_count += 1
+            self.new_size += len(stored_chunk)
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            if self._aborted:
+                return
+
+            while self._buffer:
+                self._cut_chunk(eof=True)
+
+            self._store_pending_chunks()
+
+            for upload_future in self._upload_futures:
+                upload_future.result()
+
+            self.manifest = [
+                [chunk_hash, chunk_size, *self._stored_chunks[chunk_hash]]
+                for chunk_hash, chunk_size in self._chunks
+            ]
+        finally:
+            self._executor.shutdown(wait=False)
+            super().close()
+
+    def abort(self):
+        """
+        Abort the push. The chunks already uploaded are left unreferenced, for the garbage collection.
+        """
+        self._aborted = True
+
+        for upload_future in self._upload_futures:
+            upload_future.cancel()
+
+        self._buffer = bytearray()
+        self._pending_chunks = []
+
+
+def push_chunked(manifest_s3_key, source_path, arcname, codec="none", level=None, previous_archive=None):
+    """
+    Tar source_path as arcname into content-defined chunks, upload the chunks not stored yet, and then the manifest
+    listing the chunks of the model.
+
+    previous_archive is the archive info of the model if it was pushed before. The references of a previous chunked
+    archive are released once the new manifest is stored.
+
+    Returns the archive info of the model.
+    """
+    writer = ChunkingWriter(codec=codec, level=level)
+
+    try:
+        model_transfer.write_tar(writer, source_path, arcname)
+    except:
+        writer.abort()
+        raise
+    finally:
+        writer.close()
+
+    chunk_hashes = get_manifest_chunk_hashes(writer.manifest)
+
+    # The previous manifest is read before it is replaced, when it has the same key.
+    previous_chunk_hashes = set()
+    if previous_archive and previous_archive.get("format") == "chunked":
+        previous_chunk_hashes = get_manifest_chunk_hashes(load_manifest(previous_archive["manifest_key"]))
+
+    # References are added before the manifest is stored, so that a chunk is never collected while a manifest
+    # references it, and released if it fails to be stored.
+    Tracking.update_model_chunk_refs(chunk_hashes, 1)
+
+    try:
+        storage.get_storage().put(manifest_s3_key, gzip.compress(json.dumps({"chunks": writer.manifest}).encode()))
+    except:
+        Tracking.update_model_chunk_refs(chunk_hashes, -1)
+        raise
+
+    Tracking.update_model_chunk_refs(previous_chunk_hashes, -1)
+
+    return {
+        "format": "chunked",
+        "codec": codec,
+        "level": level,
+        "manifest_key": manifest_s3_key,
+        "raw_size": writer.raw_size,
+        "chunk_count": len(writer.manifest),
+        "new_chunk_count": writer.new_chunk_count,
+        "size": writer.new_size,
+    }
+
+
+def load_manifest(manifest_s3_key):
+    return json.loads(gzip.decompress(storage.get_storage().get(manifest_s3_key)))["chunks"]
+
+
+class LocalChunkStore:
+    """
+    The chunks already fetched on this host, stored uncompressed by hash, so that pulling a new version of a model
+    only downloads the chunks which changed.
+
+    The modification time of a chunk is its last use. Once the store holds more than max_bytes, the least recently
+    used chunks are evicted, like the models of the model cache.
+    """
+
+    def __init__(self, store_dir=None, max_bytes=None):
+        self.store_dir = os.path.expanduser(store_dir or Config.MODEL_CHUNK_STORE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else Config.MODEL_CHUNK_STORE_MAX_BYTES
+
+    def get_chunk_path(self, chunk_hash):
+        return os.path.join(self.store_dir, chunk_hash[:2], chunk_hash)
+
+    def get(self, chunk_hash):
+        chunk_path = self.get_chunk_path(chunk_hash)
+
+        # The chunk may be evicted meanwhile by another process.
+        try:
+            with open(chunk_path, "rb") as fp:
+                chunk = fp.read()
+
+            os.utime(chunk_path)
+        except FileNotFoundError:
+            return None
+
+        return chunk
+
+    def put(self, chunk_hash, chunk):
+        chunk_path = self.get_chunk_path(chunk_hash)
+        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+
+        # Write to a temporary file first, so that readers never see a partial chunk.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(chunk_path), prefix=".tmp_")
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(chunk)
+
+        os.replace(tmp_path, chunk_path)
+
+    def evict(self):
+        """
+        Evict the least recently used chunks until the store fits in max_bytes.
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        with flock(os.path.join(self.store_dir, "evict.lock")):
+            chunks = []
+
+            for dir_path, _, file_names in os.walk(self.store_dir):
+                for file_name in file_names:
+                    if dir_path == self.store_dir or file_name.startswith(".tmp_"):
+                        continue
+
+                    chunk_path = os.path.join(dir_path, file_name)
+
+                    with contextlib.suppress(FileNotFoundError):
+                        stat = os.stat(chunk_path)
+                        chunks.append((stat.st_mtime, stat.st_size, chunk_path))
+
+            store_size = sum(size for _, size, _ in chunks)
+            evicted_chunk_count = 0
+
+            for _, size, chunk_path in sorted(chunks):
+                if store_size <= self.max_bytes:
+                    break
+
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(chunk_path)
+
+                store_size -= size
+                evicted_chunk_count += 1
+
+        if evicted_chunk_count:
+            logging.info("Evicted {} chunks from {}".format(evicted_chunk_count, self.store_dir))
+
+
+def pull_chunked(manifest_s3_key, target_dir, chunk_store=None):
+    """
+    Fetch the chunks of a model missing from the local chunk store concurrently, and extract the model from them.
+
+    Returns a dictionary with the number of chunks and bytes downloaded and found in the local chunk store.
+    """
+    chunk_store = chunk_store or LocalChunkStore()
+    manifest = load_manifest(manifest_s3_key)
+    stats = {"chunk_count": len(manifest), "downloaded_chunk_count": 0, "downloaded_size": 0}
+    stats_lock = threading.Lock()
+
+    def _fetch_chunk(manifest_entry):
+        # Manifests written before chunk generations have [hash, size, codec] entries.
+        chunk_hash, _, codec, generation = (manifest_entry + [None])[:4]
+
+        chunk = chunk_store.get(chunk_hash)
+        if chunk is not None:
+            return chunk
+
+        stored_chunk = storage.get_storage().get(get_chunk_s3_key(chunk_hash, generation))
+        chunk = compression.decompress_bytes(stored_chunk, codec)
+
+        assert hashlib.sha256(chunk).hexdigest() == chunk_hash, "Chunk {} is corrupted!".format(chunk_hash)
+
+        chunk_store.put(chunk_hash, chunk)
+
+        with stats_lock:
+            stats["downloaded_chunk_count"] += 1
+            stats["downloaded_size"] += len(stored_chunk)
+
+        return chunk
+
+    with model_transfer.PrefetchingReader(manifest, _fetch_chunk) as reader:
+        with tarfile.open(fileobj=reader, mode="r|") as tar:
+            if hasattr(tarfile, "data_filter"):
+                tar.extractall(target_dir, filter="data")
+            else:
+                tar.extractall(target_dir)
+
+    if stats["downloaded_chunk_count"]:
+        chunk_store.evict()
+
+    logging.info("Pulled {} chunks, {} of them ({} bytes) downloaded, the others found in {}.".format(
+        stats["chunk_count"],
+        stats["downloaded_chunk_count"],
+        stats["downloaded_size"],
+        chunk_store.store_dir,
+    ))
+
+    return stats
+
+
+def delete_chunked(manifest_s3_key):
+    """
+    Delete the manifest of a model, and release its references to its chunks. Unreferenced chunks are left to the
+    garbage collection.
+    """
+    manifest = load_manifest(manifest_s3_key)
+
+    storage.get_storage().delete(manifest_s3_key)
+    Tracking.update_model_chunk_refs(get_manifest_chunk_hashes(manifest), -1)
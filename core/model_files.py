@@ -0,0 +1,271 @@
+from core import storage
+from core.config import Config
+
+from concurrent.futures import ThreadPoolExecutor
+import fnmatch
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+
+
+# The size of the reads when hashing files.
+_HASH_READ_SIZE = 4 * 1024 * 1024
+
+
+def _hash_file(file_path):
+    file_hash = hashlib.sha256()
+
+    with open(file_path, "rb") as fp:
+        for data in iter(lambda: fp.read(_HASH_READ_SIZE), b""):
+            file_hash.update(data)
+
+    return file_hash.hexdigest()
+
+
+def _list_files(source_path, arcname):
+    """
+    List the files of source_path as (local path, path in the model) tuples, the paths in the model being relative to
+    the target directory of pulls, like the members of the tar layout. Symbolic links are followed.
+    """
+    assert os.path.exists(source_path), "Missing model file directory at {}".format(source_path)
+
+    if not os.path.isdir(source_path):
+        return [(source_path, arcname)]
+
+    files = []
+    for dir_path, _, file_names in os.walk(source_path, followlinks=True):
+        for file_name in file_names:
+            local_path = os.path.join(dir_path, file_name)
+            relative_path = os.path.relpath(local_path, source_path).replace(os.sep, "/")
+            files.append((local_path, "{}/{}".format(arcname, relative_path)))
+
+    return sorted(files, key=lambda file: file[1])
+
+
+def _get_parts(size, part_size):
+    return [(start, min(start + part_size, size)) for start in range(0, size, part_size)] or [(0, 0)]
+
+
+def _matches_include(path, include):
+    """
+    Match the path of a file against include glob patterns, given relative to the model directory, e.g. "vocab.txt"
+    or "shards/*".
+    """
+    if include is None:
+        return True
+
+    # Paths start with the model directory, except for a model made of a single file.
+    path_in_model = path.split("/", 1)[1] if "/" in path else path
+
+    return any(fnmatch.fnmatchcase(path_in_model, pattern) for pattern in include)
+
+
+class _PartExecutor:
+    """
+    A thread pool running the part transfers of all the files of a model, so that small and large files alike keep
+    all of its threads busy.
+    """
+
+    def __init__(self, concurrency=None):
+        self._executor = ThreadPoolExecutor(max_workers=concurrency or Config.MODEL_TRANSFER_CONCURRENCY)
+        self._futures = []
+
+    def submit(self, fn, *args):
+        future = self._executor.submit(fn, *args)
+        self._futures.append(future)
+        return future
+
+    def wait(self):
+        # Futures may submit more futures, e.g. to complete an upload once its parts are done.
+        index = 0
+        while index < len(self._futures):
+            self._futures[index].result()
+            index += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            for future in self._futures:
+                future.cancel()
+
+        self._executor.shutdown(wait=exc_type is None)
+
+
+def push_files(manifest_s3_key, files_s3_prefix, source_path, arcname):
+    """
+    Upload each file of source_path as its own uncompressed object under files_s3_prefix, then a manifest listing the
+    path, size and sha256 of each file.
+
+    Files larger than a part are uploaded as concurrent multipart uploads. Returns the archive info of the model.
+    """
+    files = _list_files(source_path, arcname)
+    model_storage = storage.get_storage()
+    part_size = Config.MODEL_TRANSFER_PART_SIZE
+
+    def _describe_file(local_path, path):
+        return {"path": path, "size": os.path.getsize(local_path), "sha256": _hash_file(local_path)}
+
+    def _upload_part(local_path, s3_key, upload_id, part_number, start, end):
+        with open(local_path, "rb") as fp:
+            data = os.pread(fp.fileno(), end - start, start)
+
+        if upload_id is None:
+            model_storage.put(s3_key, data)
+            return None
+
+        return model_storage.upload_part(s3_key, upload_id, part_number, data)
+
+    def _complete_upload(s3_key, upload_id, part_futures):
+        model_storage.complete_multipart_upload(
+            s3_key,
+            upload_id,
+            [part_future.result() for part_future in part_futures],
+        )
+
+    upload_ids = {}
+
+    try:
+        with _PartExecutor() as executor:
+            describe_futures = [executor.submit(_describe_file, local_path, path) for local_path, path in files]
+            manifest = [describe_future.result() for describe_future in describe_futures]
+
+            for (local_path, path), file_info in zip(files, manifest):
+                s3_key = files_s3_prefix + path
+                parts = _get_parts(file_info["size"], part_size)
+
+                upload_id = None
+                if len(parts) > 1:
+                    upload_id = model_storage.create_multipart_upload(s3_key)
+                    upload_ids[s3_key] = upload_id
+
+                part_futures = [
+                    executor.submit(_upload_part, local_path, s3_key, upload_id, part_number, start, end)
+                    for part_number, (start, end) in enumerate(parts, start=1)
+                ]
+
+                # Parts are picked in order, so when a worker picks the completion, the parts it waits for are all
+                # running or done already.
+                if upload_id is not None:
+                    executor.submit(_complete_upload, s3_key, upload_id, part_futures)
+
+            executor.wait()
+    except:
+        for s3_key, upload_id in upload_ids.items():
+            try:
+                model_storage.abort_multipart_upload(s3_key, upload_id)
+            except:
+                logging.exception("Failed to abort the multipart upload of {}!".format(s3_key))
+
+        raise
+
+    model_storage.put(manifest_s3_key, gzip.compress(json.dumps({"files": manifest}).encode()))
+
+    size = sum(file_info["size"] for file_info in manifest)
+
+    return {
+        "format": "files",
+        "codec": "none",
+        "level": None,
+        "manifest_key": manifest_s3_key,
+        "files_prefix": files_s3_prefix,
+        "file_count": len(manifest),
+        "size": size,
+        "raw_size": size,
+    }
+
+
+def load_manifest(manifest_s3_key):
+    return json.loads(gzip.decompress(storage.get_storage().get(manifest_s3_key)))["files"]
+
+
+def pull_files(manifest_s3_key, files_s3_prefix, target_dir, include=None, verify=True):
+    """
+    Download the files of a model matching the include glob patterns, or all of them, into target_dir.
+
+    Files are downloaded with concurrent ranged GETs written in place into a temporary file, which is checked against
+    the manifest and then renamed, so that a process mapping the file never sees it partially written. Files are
+    stored uncompressed, so they can be mapped as they land.
+
+    Returns the list of the pulled files from the manifest.
+    """
+    manifest = [file_info for file_info in load_manifest(manifest_s3_key) if _matches_include(file_info["path"], include)]
+
+    if include is not None and not manifest:
+        raise Exception("No file of the model matches {}!".format(", ".join(include)))
+
+    model_storage = storage.get_storage()
+    part_size = Config.MODEL_TRANSFER_PART_SIZE
+    remaining_parts = {}
+    remaining_parts_lock = threading.Lock()
+
+    def _get_file_paths(file_info):
+        file_path = os.path.join(target_dir, *file_info["path"].split("/"))
+        return file_path, os.path.join(os.path.dirname(file_path), ".{}.tmp".format(os.path.basename(file_path)))
+
+    def _finish_file(file_info):
+        file_path, tmp_path = _get_file_paths(file_info)
+
+        if verify and _hash_file(tmp_path) != file_info["sha256"]:
+            raise Exception("File {} of the model is corrupted!".format(file_info["path"]))
+
+        os.replace(tmp_path, file_path)
+
+    def _download_part(file_info, start, end):
+        _, tmp_path = _get_file_paths(file_info)
+
+        if end > start:
+            data = model_storage.get_range(files_s3_prefix + file_info["path"], start, end)
+
+            with open(tmp_path, "r+b") as fp:
+                os.pwrite(fp.fileno(), data, start)
+
+        with remaining_parts_lock:
+            remaining_parts[file_info["path"]] -= 1
+            is_last_part = remaining_parts[file_info["path"]] == 0
+
+        if is_last_part:
+            _finish_file(file_info)
+
+    try:
+        with _PartExecutor() as executor:
+            for file_info in manifest:
+                file_path, tmp_path = _get_file_paths(file_info)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+                # Allocate the file, so that parts are written in place as they come.
+                with open(tmp_path, "wb") as fp:
+                    fp.truncate(file_info["size"])
+
+                parts = _get_parts(file_info["size"], part_size)
+                remaining_parts[file_info["path"]] = len(parts)
+
+                for start, end in parts:
+                    executor.submit(_download_part, file_info, start, end)
+
+            executor.wait()
+    except:
+        for file_info in manifest:
+            _, tmp_path = _get_file_paths(file_info)
+
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        raise
+
+    return manifest
+
+
+def delete_files(manifest_s3_key, files_s3_prefix):
+    """
+    Delete the files of a model and its manifest.
+    """
+    manifest = load_manifest(manifest_s3_key)
+
+    storage.get_storage().delete_many(
+        [files_s3_prefix + file_info["path"] for file_info in manifest] + [manifest_s3_key]
+    )
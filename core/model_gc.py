@@ -0,0 +1,161 @@
+from core import consts
+from core import model_chunks
+from core import storage
+from core.tracking import Tracking
+
+import collections
+import logging
+import time
+
+
+# The number of models or chunks looked up or deleted at once.
+DELETE_OBJECTS_BATCH_SIZE = 1000
+
+
+def _get_model_id(s3_key):
+    """
+    Get the model id of an object of the models namespace: <model_id>.tar, <model_id>.manifest.json.gz or
+    <model_id>/files/<path>.
+    """
+    return s3_key[len(consts.MODEL_FACTORY_MODELS_NAMESPACE) + 1:].split("/")[0].split(".")[0]
+
+
+def delete_objects(s3_keys):
+    """
+    Delete objects in batches. Returns the keys which failed to be deleted.
+    """
+    failed_s3_keys = storage.get_storage().delete_many(s3_keys)
+
+    for s3_key in failed_s3_keys:
+        logging.error("Failed to delete {}!".format(s3_key))
+
+    return failed_s3_keys
+
+
+def collect_models(age_seconds=consts.MODEL_GC_AGE_SECONDS, dry_run=False):
+    """
+    Garbage collect the models hidden and created more than age_seconds ago, unless they were ever promoted or are
+    referenced by production models, together with the model objects left without a model document.
+
+    Objects are found by listing the models namespace, so that the report has their actual sizes. Returns the list
+    of the collected models, with the number and the total size of their objects.
+    """
+    # Models promoted before promotions were recorded on the models would be collected otherwise.
+    if not Tracking.is_migration_applied(Tracking.MODEL_PROMOTIONS_MIGRATION):
+        raise Exception(
+            "The model promotions are not migrated yet, please run mf admin migrate-model-promotions first!"
+        )
+
+    now = time.time()
+
+    objects_by_model_id = collections.defaultdict(list)
+    for s3_key, size, last_modified in storage.get_storage().list(consts.MODEL_FACTORY_MODELS_NAMESPACE + "/"):
+        objects_by_model_id[_get_model_id(s3_key)].append((s3_key, size, last_modified))
+
+    reclaimable_models_info = Tracking.get_reclaimable_models(
+        hidden_before=now - age_seconds,
+        excluded_model_ids=Tracking.get_referenced_model_ids(),
+    )
+
+    # Objects without a model document were left behind by deletions or failed pushes. Recent ones may belong to
+    # models being registered.
+    existing_model_ids = set()
+    listed_model_ids = list(objects_by_model_id)
+    for start in range(0, len(listed_model_ids), DELETE_OBJECTS_BATCH_SIZE):
+        existing_model_ids |= Tracking.get_existing_model_ids(listed_model_ids[start:start + DELETE_OBJECTS_BATCH_SIZE])
+
+    orphan_model_ids = [
+        model_id for model_id, s3_objects in objects_by_model_id.items()
+        if model_id not in existing_model_ids and
+        all(last_modified < now - consts.MODEL_GC_GRACE_SECONDS for _, _, last_modified in s3_objects)
+    ]
+
+    collected_models = [
+        {
+            "model_id": model_info["_id"],
+            "model_name": model_info.get("model_name"),
+            "reason": "hidden",
+            "archive": model_info.get("archive") or {},
+        }
+        for model_info in reclaimable_models_info
+    ] + [
+        {"model_id": model_id, "model_name": None, "reason": "orphan", "archive": {}}
+        for model_id in orphan_model_ids
+    ]
+
+    for collected_model in collected_models:
+        s3_objects = objects_by_model_id.get(collected_model["model_id"], [])
+        collected_model["s3_keys"] = [s3_key for s3_key, _, _ in s3_objects]
+        collected_model["object_count"] = len(s3_objects)
+        collected_model["size"] = sum(size for _, size, _ in s3_objects)
+
+    if dry_run or not collected_models:
+        return collected_models
+
+    # The chunks of chunked models are read from their manifests before anything is deleted.
+    chunk_ref_counts = collections.Counter()
+    for collected_model in collected_models:
+        if collected_model["archive"].get("format") == "chunked":
+            chunk_ref_counts.update(model_chunks.get_manifest_chunk_hashes(
+                model_chunks.load_manifest(collected_model["archive"]["manifest_key"])
+            ))
+
+    # Documents go first: if the collection stops halfway, objects are left behind, and collected as orphans later.
+    Tracking.delete_models([
+        collected_model["model_id"] for collected_model in collected_models if collected_model["reason"] == "hidden"
+    ])
+
+    chunk_hashes_by_ref_count = collections.defaultdict(set)
+    for chunk_hash, ref_count in chunk_ref_counts.items():
+        chunk_hashes_by_ref_count[ref_count].add(chunk_hash)
+
+    for ref_count, chunk_hashes in chunk_hashes_by_ref_count.items():
+        Tracking.update_model_chunk_refs(chunk_hashes, -ref_count)
+
+    delete_objects(s3_key for collected_model in collected_models for s3_key in collected_model["s3_keys"])
+
+    return collected_models
+
+
+def collect_model_chunks(dry_run=False):
+    """
+    Garbage collect the chunks no model references, and no push used for a while.
+
+    Returns the number and the total stored size of the collected chunks.
+    """
+    used_before = time.time() - consts.MODEL_GC_GRACE_SECONDS
+    chunk_count = 0
+    size = 0
+    after = None
+
+    while True:
+        chunks_info = Tracking.get_unreferenced_model_chunks(used_before, after=after, limit=DELETE_OBJECTS_BATCH_SIZE)
+
+        if not chunks_info:
+            break
+
+        after = chunks_info[-1]["_id"]
+
+        if not dry_run:
+            # Chunks are marked first, so that pushes upload them again under a new generation rather than reuse them
+            # while their objects are deleted. Chunks used meanwhile are not marked, and kept. The documents go last,
+            # so that a chunk whose object failed to be deleted is collected again by the next run.
+            chunks_info = Tracking.mark_model_chunks_deleting(
+                [chunk_info["_id"] for chunk_info in chunks_info],
+                used_before,
+            )
+            failed_s3_keys = set(delete_objects(
+                model_chunks.get_chunk_s3_key(chunk_info["_id"], chunk_info.get("generation"))
+                for chunk_info in chunks_info
+            ))
+
+            chunks_info = [
+                chunk_info for chunk_info in chunks_info
+                if model_chunks.get_chunk_s3_key(chunk_info["_id"], chunk_info.get("generation")) not in failed_s3_keys
+            ]
+            Tracking.delete_model_chunks(chunks_info)
+
+        chunk_count += len(chunks_info)
+        size += sum(chunk_info["stored_size"] for chunk_info in chunks_info)
+
+    return {"chunk_count": chunk_count, "size": size}
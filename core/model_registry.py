@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 
+from core import compression
 from core import consts as mf_consts
-from core import utils
+from core import model_chunks
+from core import model_files
+from core import model_transfer
+from core import storage
 from core.config import Config
 from core.tracking import Tracking
 
-import boto3
+from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
 import logging
 import os
+import shutil
+import tempfile
+import threading
 import time
 import uuid
 
@@ -17,6 +25,12 @@ class ModelRegistry:
     Model registry provides a centralized management for model factory produced models.
     """
 
+    # The background pushes of push_async.
+    _push_executor = None
+    _push_budget = None
+    _push_futures = []
+    _push_lock = threading.Lock()
+
     @classmethod
     def register(cls, model_name, job_id, tags=[], metadata={}):
         model_id = "m-{}".format(uuid.uuid4())
@@ -39,76 +53,227 @@ class ModelRegistry:
         cls,
         model_id,
         model_path,
+        codec=None,
+        layout=None,
     ):
         """
         Push a model to model registry.
+
+        The model is packed in-process and streamed into a concurrent multipart upload, so no local tar file is
+        written. codec is formatted as codec[:level], among none, gzip, zstd and lz4, and defaults to the
+        model_archive_codec config. It is recorded in the model document, so that pull decodes the model accordingly.
+
+        layout is "tar", "chunked" or "files", and defaults to the model_archive_layout config. A chunked model is cut
+        into content-defined chunks stored once by hash, so that only the chunks which changed since an earlier
+        version are uploaded. A files model stores each file as its own uncompressed object, so that its files can be
+        pulled selectively, and the codec is ignored.
         """
         assert os.path.exists(model_path), "Missing model file directory at {}".format(model_path)
 
-        model_s3_key = cls.get_model_s3_key(model_id)
-        model_s3_path = cls.get_model_s3_path(model_id)
-        model_name = Tracking.get_info_for_single_model(model_id)["model_name"]
-        packed_model_path = "{}.tar".format(model_name)
+        codec, level = compression.parse_codec(codec or Config.MODEL_ARCHIVE_CODEC)
+        layout = layout or Config.MODEL_ARCHIVE_LAYOUT
+        model_info = Tracking.get_info_for_single_model(model_id)
+        model_name = model_info["model_name"]
+
+        if layout == "tar":
+            model_s3_path = cls.get_model_s3_path(model_id)
+        elif layout in ("chunked", "files"):
+            model_s3_path = cls.get_model_manifest_s3_path(model_id)
+        else:
+            raise Exception("Unknown model archive layout {}, expecting tar, chunked or files!".format(layout))
 
-        logging.info("Start committing model {} from {} to {}".format(
+        logging.info("Start committing model {} from {} to {} with codec {}".format(
             model_id,
             model_path,
             model_s3_path,
+            compression.get_codec_spec(codec, level),
         ))
 
-        # Pack the target model.
-        cls._pack_model(model_path, model_name, packed_model_path)
-
-        # Upload the packed model to s3.
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
-            endpoint_url=Config.S3_ENDPOINT,
-        )
+        start_time = time.time()
+        if layout == "tar":
+            sizes = model_transfer.upload_tar(
+                cls.get_model_s3_key(model_id),
+                model_path,
+                arcname=model_name,
+                codec=codec,
+                level=level,
+            )
+
+            archive = {
+                "format": "tar",
+                "codec": codec,
+                "level": level,
+                "size": sizes["size"],
+                "raw_size": sizes["raw_size"],
+            }
+        elif layout == "chunked":
+            archive = model_chunks.push_chunked(
+                cls.get_model_manifest_s3_key(model_id),
+                model_path,
+                arcname=model_name,
+                codec=codec,
+                level=level,
+                previous_archive=model_info.get("archive"),
+            )
+        else:
+            archive = model_files.push_files(
+                cls.get_model_manifest_s3_key(model_id),
+                cls.get_model_files_s3_prefix(model_id),
+                model_path,
+                arcname=model_name,
+            )
 
-        s3_client.upload_file(
-            packed_model_path,
-            Config.S3_BUCKET,
-            model_s3_key,
-        )
+        Tracking.update_model_archive(model_id, archive)
 
-        logging.info("Finished committing model {} from {} to {}".format(
+        logging.info("Finished committing model {} from {} to {} ({} bytes, {} bytes uncompressed, in {:.1f}s)".format(
             model_id,
             model_path,
             model_s3_path,
+            archive["size"],
+            archive["raw_size"],
+            time.time() - start_time,
         ))
 
-        # Clean up
-        os.remove(packed_model_path)
+        if layout == "chunked":
+            logging.info("Uploaded {} new chunks out of {}".format(archive["new_chunk_count"], archive["chunk_count"]))
 
     @classmethod
-    def pull(cls, model_id, target_dir):
+    def push_async(
+        cls,
+        model_id,
+        model_path,
+        codec=None,
+        layout=None,
+    ):
+        """
+        Push a model to model registry in the background, and return a concurrent.futures.Future of the push.
+
+        The model is copied to a staging directory first, so that model_path can be overwritten as soon as push_async
+        returns, e.g. by the next checkpoint. Staged models count against the model_push_async_max_bytes budget, and
+        push_async blocks while the budget is used up, so that checkpoints cannot fill up the disk. The operator
+        executor waits for the pushes of a job with wait_for_pushes before marking it as succeeded.
+        """
+        assert os.path.exists(model_path), "Missing model file directory at {}".format(model_path)
+
+        with cls._push_lock:
+            if cls._push_executor is None:
+                cls._push_executor = ThreadPoolExecutor(
+                    max_workers=Config.MODEL_PUSH_ASYNC_WORKERS,
+                    thread_name_prefix="model_push",
+                )
+                cls._push_budget = model_transfer.ByteBudget(Config.MODEL_PUSH_ASYNC_MAX_BYTES)
+
+        size = model_transfer.get_path_size(model_path)
+        cls._push_budget.acquire(size)
+
+        staging_root_dir = os.path.expanduser(Config.MODEL_PUSH_ASYNC_STAGING_DIR)
+        os.makedirs(staging_root_dir, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix="{}_".format(model_id), dir=staging_root_dir)
+        staged_model_path = os.path.join(staging_dir, "model")
+
+        try:
+            if os.path.isdir(model_path):
+                shutil.copytree(model_path, staged_model_path)
+            else:
+                shutil.copyfile(model_path, staged_model_path)
+        except:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            cls._push_budget.release(size)
+            raise
+
+        def _push():
+            try:
+                cls.push(model_id, staged_model_path, codec=codec, layout=layout)
+            except:
+                logging.exception("Failed to push model {}!".format(model_id))
+                raise
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                cls._push_budget.release(size)
+
+        push_future = cls._push_executor.submit(_push)
+
+        with cls._push_lock:
+            cls._push_futures.append(push_future)
+
+        return push_future
+
+    @classmethod
+    def wait_for_pushes(cls, timeout=None):
+        """
+        Wait for the outstanding pushes of push_async, and raise the first push failure.
+        """
+        with cls._push_lock:
+            push_futures, cls._push_futures = cls._push_futures, []
+
+        if not push_futures:
+            return
+
+        logging.info("Waiting for {} model pushes...".format(len(push_futures)))
+
+        _, pending_push_futures = concurrent.futures.wait(push_futures, timeout=timeout)
+
+        if pending_push_futures:
+            with cls._push_lock:
+                cls._push_futures.extend(pending_push_futures)
+
+            raise Exception("{} model pushes are still running after {}s!".format(len(pending_push_futures), timeout))
+
+        for push_future in push_futures:
+            push_future.result()
+
+    @classmethod
+    def pull(cls, model_id, target_dir, include=None):
         """
         Pull a model from model registry to the target directory on your local file system.
+
+        The model is downloaded with concurrent ranged GETs streamed into the extraction, so no local tar file is
+        written. Only the chunks of a chunked model missing from the local chunk store are downloaded.
+
+        include is a list of glob patterns of the files to pull, relative to the model directory, e.g. ["vocab.txt"].
+        It needs a model pushed with the files layout.
         """
         model_info = Tracking.get_info_for_single_model(model_id)
 
         assert model_info, "Model {} not found!".format(model_id)
 
+        # Models pushed before archives were recorded are plain tars.
+        archive = model_info.get("archive") or {}
+
+        if include is not None and archive.get("format") != "files":
+            raise Exception("Model {} was not pushed with the files layout, and can only be pulled whole!".format(
+                model_id,
+            ))
+
         target_model_dir = os.path.expanduser(target_dir)
         os.makedirs(target_model_dir, exist_ok=True)
 
         logging.info("Loading model {} from {} to {}".format(
             model_id,
-            cls.get_model_s3_path(model_id),
+            cls.get_model_manifest_s3_path(model_id) if "manifest_key" in archive else cls.get_model_s3_path(model_id),
             target_model_dir,
         ))
 
-        target_model_tar_file = os.path.join(target_model_dir, "model.tar")
-        s3_client = boto3.client('s3')
-        s3_client.download_file(
-            Bucket=Config.S3_BUCKET,
-            Key=cls.get_model_s3_key(model_id),
-            Filename=target_model_tar_file,
-        )
+        start_time = time.time()
+        if archive.get("format") == "chunked":
+            size = model_chunks.pull_chunked(archive["manifest_key"], target_model_dir)["downloaded_size"]
+        elif archive.get("format") == "files":
+            pulled_files = model_files.pull_files(
+                archive["manifest_key"],
+                archive["files_prefix"],
+                target_model_dir,
+                include=include,
+            )
+            size = sum(file_info["size"] for file_info in pulled_files)
+        else:
+            size = model_transfer.download_tar(
+                cls.get_model_s3_key(model_id),
+                target_model_dir,
+                codec=archive.get("codec", "none"),
+            )
+
+        logging.info("Loaded model {} ({} bytes in {:.1f}s)".format(model_id, size, time.time() - start_time))
 
-        cls._unpack_model(target_model_tar_file, target_dir)
         return model_info
 
     @classmethod
@@ -116,13 +281,21 @@ class ModelRegistry:
         """
         Delete a model from model registry.
         """
-        # Upload the packed model to s3.
-        s3_client = boto3.client('s3')
-        s3_client.delete_object(
-            Bucket=Config.S3_BUCKET,
-            Key=cls.get_model_s3_key(model_id),
-        )
-        logging.info("Deleted {} from s3".format(cls.get_model_s3_path(model_id)))
+        model_info = Tracking.get_info_for_single_model(model_id) or {}
+
+        archive = model_info.get("archive") or {}
+
+        if archive.get("format") == "chunked":
+            # The chunks shared with other models are kept, and the unreferenced ones are left to garbage collection.
+            model_chunks.delete_chunked(archive["manifest_key"])
+            logging.info("Deleted {}".format(cls.get_model_manifest_s3_path(model_id)))
+        elif archive.get("format") == "files":
+            model_files.delete_files(archive["manifest_key"], archive["files_prefix"])
+            logging.info("Deleted {} and its files".format(cls.get_model_manifest_s3_path(model_id)))
+        else:
+            # Delete the packed model from the storage.
+            storage.get_storage().delete(cls.get_model_s3_key(model_id))
+            logging.info("Deleted {}".format(cls.get_model_s3_path(model_id)))
 
         # Registry the model on the tracking db.
         Tracking.delete_model(
@@ -130,6 +303,9 @@ class ModelRegistry:
         )
         logging.info("Deleted metadata for {} from db".format(model_id))
 
+        Tracking.delete_model_metrics(model_id)
+        logging.info("Deleted metrics for {} from db".format(model_id))
+
     @classmethod
     def tag_model(cls, model_id, tag):
         Tracking.tag_model(model_id, tag)
@@ -142,6 +318,39 @@ class ModelRegistry:
     def update_model_metadata(cls, model_id, metadata):
         return Tracking.update_model_metadata(model_id, metadata)
 
+    @classmethod
+    def add_metric(cls, model_id, key, value, timestamp=None, step=None):
+        model_info = Tracking.get_info_for_single_model(model_id)
+
+        assert model_info, "Model {} not found!".format(model_id)
+
+        Tracking.add_metric(model_id, key, value, timestamp=timestamp, step=step, job_id=model_info["job_id"])
+
+    @classmethod
+    def get_metric_series(cls, model_id, key, max_points=None, x_field="step"):
+        return Tracking.get_metric_series(key, model_id=model_id, max_points=max_points, x_field=x_field)
+
+    @classmethod
+    def get_latest_metrics(cls, model_ids):
+        return Tracking.get_latest_metrics(model_ids)
+
+    @classmethod
+    def get_model_leaderboard(cls, model_name, key, k=10, by="latest", ascending=False):
+        """
+        Get the top k models of a model name by a metric, joined with their model info.
+        """
+        leaderboard = Tracking.get_model_leaderboard(model_name, key, k=k, by=by, ascending=ascending)
+
+        models_info = {
+            model_info["_id"]: model_info
+            for model_info in Tracking.get_info_for_multi_models([entry["model_id"] for entry in leaderboard])
+        }
+
+        return [
+            dict(entry, model_info=models_info.get(entry["model_id"]))
+            for entry in leaderboard
+        ]
+
     @classmethod
     def promote_model(cls, model_id):
         # Promote model.
@@ -157,6 +366,18 @@ class ModelRegistry:
     def list_production_models(cls, model_names):
         return Tracking.list_production_models(model_names)
 
+    @classmethod
+    def watch_production_models(cls, model_names):
+        return Tracking.watch_production_models(model_names)
+
+    @classmethod
+    def update_model_fleet_state(cls, model_name, hostname, model_id, metadata=None):
+        return Tracking.update_model_fleet_state(model_name, hostname, model_id, metadata=metadata)
+
+    @classmethod
+    def get_model_fleet(cls, model_name, stale_seconds, include_hosts=False):
+        return Tracking.get_model_fleet(model_name, stale_seconds=stale_seconds, include_hosts=include_hosts)
+
     @classmethod
     def get_info_for_model(cls, model_id):
         return Tracking.get_info_for_single_model(model_id)
@@ -196,33 +417,22 @@ class ModelRegistry:
 
     @classmethod
     def get_model_s3_path(cls, model_id):
-        return "s3://{}/{}".format(
-            Config.S3_BUCKET,
-            cls.get_model_s3_key(model_id),
-        )
+        return storage.get_storage().get_url(cls.get_model_s3_key(model_id))
 
     @classmethod
-    def _pack_model(cls, model_path, model_name, tar_path):
-        model_path_basename = os.path.basename(model_path)
+    def get_model_manifest_s3_key(cls, model_id):
+        return "{}/{}.manifest.json.gz".format(
+            mf_consts.MODEL_FACTORY_MODELS_NAMESPACE,
+            model_id,
+        )
 
-        if model_path_basename == model_name:
-            utils.system("tar -cvf {} {}".format(
-                tar_path,
-                model_path,
-            ))
-        else:
-            utils.system("ln -s {} {} && tar cvfh {} {} && rm {}".format(
-                model_path,
-                model_name,
-                tar_path,
-                model_name,
-                model_name,
-            ))
+    @classmethod
+    def get_model_files_s3_prefix(cls, model_id):
+        return "{}/{}/files/".format(
+            mf_consts.MODEL_FACTORY_MODELS_NAMESPACE,
+            model_id,
+        )
 
     @classmethod
-    def _unpack_model(cls, model_tar_file, target_model_dir):
-        utils.system("tar xvf {} -C {} && rm {}".format(
-            model_tar_file,
-            target_model_dir,
-            model_tar_file,
-        ))
+    def get_model_manifest_s3_path(cls, model_id):
+        return storage.get_storage().get_url(cls.get_model_manifest_s3_key(model_id))
@@ -0,0 +1,387 @@
+from core import compression
+from core import consts as mf_consts
+from core import storage
+from core.config import Config
+
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import io
+import logging
+import os
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+
+
+class MultipartUploadWriter(io.RawIOBase):
+    """
+    A writable file object uploading its content to the storage as it is written.
+
+    Written data is cut into parts of part_size bytes, which are uploaded concurrently as the parts of a multipart
+    upload. At most concurrency parts are uploaded at a time, and writes block when all of them are busy, so memory
+    stays bounded by about (concurrency + 1) * part_size. Content smaller than a part is uploaded with a single put.
+    """
+
+    def __init__(self, s3_key, part_size=None, concurrency=None):
+        self.s3_key = s3_key
+        self.part_size = part_size or Config.MODEL_TRANSFER_PART_SIZE
+        self.concurrency = concurrency or Config.MODEL_TRANSFER_CONCURRENCY
+        self.size = 0
+
+        self._storage = storage.get_storage()
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._executor = None
+        self._part_futures = []
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._aborted = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self.size += len(data)
+
+        while len(self._buffer) >= self.part_size:
+            part_data = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+
+            self._submit_part(part_data)
+
+        return len(data)
+
+    def _submit_part(self, part_data):
+        if self._upload_id is None:
+            self._upload_id = self._storage.create_multipart_upload(self.s3_key)
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+        # Fail fast if an earlier part failed.
+        for part_future in self._part_futures:
+            if part_future.done() and part_future.exception():
+                raise part_future.exception()
+
+        self._slots.acquire()
+
+        part_number = len(self._part_futures) + 1
+        part_future = self._executor.submit(self._upload_part, part_number, part_data)
+        part_future.add_done_callback(lambda _: self._slots.release())
+        self._part_futures.append(part_future)
+
+    def _upload_part(self, part_number, part_data):
+        return self._storage.upload_part(self.s3_key, self._upload_id, part_number, part_data)
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            if not self._aborted:
+                self._complete()
+        except:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            super().close()
+
+            if self._executor:
+                self._executor.shutdown(wait=False)
+
+    def _complete(self):
+        if self._upload_id is None:
+            self._storage.put(self.s3_key, bytes(self._buffer))
+            return
+
+        if self._buffer:
+            self._submit_part(bytes(self._buffer))
+
+        parts = [part_future.result() for part_future in self._part_futures]
+
+        self._storage.complete_multipart_upload(self.s3_key, self._upload_id, parts)
+
+    def abort(self):
+        """
+        Abort the upload, so that nothing is written to the storage and the uploaded parts are not kept around.
+        """
+        self._aborted = True
+
+        if self._upload_id is None:
+            return
+
+        for part_future in self._part_futures:
+            part_future.cancel()
+
+        try:
+            self._storage.abort_multipart_upload(self.s3_key, self._upload_id)
+        except:
+            logging.exception("Failed to abort the multipart upload of {}!".format(self.s3_key))
+
+        self._upload_id = None
+
+
+class PrefetchingReader(io.RawIOBase):
+    """
+    A readable file object concatenating parts fetched concurrently.
+
+    fetch_part is called with each of the parts, in a thread pool, keeping up to concurrency parts in flight ahead of
+    the reader. The fetched bytes are returned in the order of the parts.
+    """
+
+    def __init__(self, parts, fetch_part, concurrency=None):
+        self.concurrency = concurrency or Config.MODEL_TRANSFER_CONCURRENCY
+
+        self._parts = collections.deque(parts)
+        self._fetch_part = fetch_part
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._part_futures = collections.deque()
+        self._buffer = b""
+        self._buffer_offset = 0
+
+        for _ in range(self.concurrency):
+            self._submit_next_part()
+
+    def readable(self):
+        return True
+
+    def _submit_next_part(self):
+        if not self._parts:
+            return
+
+        self._part_futures.append(self._executor.submit(self._fetch_part, self._parts.popleft()))
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+
+        chunks = []
+
+        while size < 0 or size > 0:
+            if self._buffer_offset >= len(self._buffer):
+                if not self._part_futures:
+                    break
+
+                self._buffer = self._part_futures.popleft().result()
+                self._buffer_offset = 0
+                self._submit_next_part()
+
+            end = len(self._buffer) if size < 0 else min(len(self._buffer), self._buffer_offset + size)
+            chunks.append(self._buffer[self._buffer_offset:end])
+
+            if size > 0:
+                size -= end - self._buffer_offset
+
+            self._buffer_offset = end
+
+        return b"".join(chunks)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        for part_future in self._part_futures:
+            part_future.cancel()
+
+        self._executor.shutdown(wait=False)
+        super().close()
+
+
+class RangedDownloadReader(PrefetchingReader):
+    """
+    A readable file object downloading an object of the storage with concurrent ranged GETs of part_size bytes.
+    """
+
+    def __init__(self, s3_key, part_size=None, concurrency=None):
+        self.s3_key = s3_key
+        self.part_size = part_size or Config.MODEL_TRANSFER_PART_SIZE
+
+        self._storage = storage.get_storage()
+        self.size = self._storage.get_size(s3_key)
+
+        super().__init__(
+            [
+                (start, min(start + self.part_size, self.size))
+                for start in range(0, self.size, self.part_size)
+            ],
+            self._download_part,
+            concurrency=concurrency,
+        )
+
+    def _download_part(self, part):
+        start, end = part
+
+        return self._storage.get_range(self.s3_key, start, end)
+
+
+class ByteBudget:
+    """
+    A semaphore counting bytes: acquiring blocks while the bytes in use would exceed max_bytes. A single acquisition
+    larger than max_bytes is let through once nothing else is in use, so that it cannot block forever.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+
+        self._condition = threading.Condition()
+
+    def acquire(self, size):
+        with self._condition:
+            self._condition.wait_for(lambda: self.used_bytes == 0 or self.used_bytes + size <= self.max_bytes)
+            self.used_bytes += size
+
+    def release(self, size):
+        with self._condition:
+            self.used_bytes -= size
+            self._condition.notify_all()
+
+
+def get_path_size(path):
+    """
+    Get the size of a file, or the total size of the files of a directory, following symbolic links.
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+
+    return sum(
+        os.path.getsize(os.path.join(dir_path, file_name))
+        for dir_path, _, file_names in os.walk(path, followlinks=True)
+        for file_name in file_names
+    )
+
+
+class CountingWriter(io.RawIOBase):
+    """
+    A writable file object counting the bytes written through it to fileobj, or discarding them if fileobj is None.
+    """
+
+    def __init__(self, fileobj=None):
+        self.fileobj = fileobj
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.size += len(data)
+
+        if self.fileobj is not None:
+            self.fileobj.write(data)
+
+        return len(data)
+
+
+def write_tar(fileobj, source_path, arcname, codec="none", level=None):
+    """
+    Tar source_path as arcname into fileobj, compressed with the codec. Returns the size of the uncompressed tar.
+
+    Symbolic links are followed, so that the archive holds the files they point to.
+    """
+    assert os.path.exists(source_path), "Missing model file directory at {}".format(source_path)
+
+    with compression.open_writer(fileobj, codec, level) as compressed_writer:
+        tar_writer = CountingWriter(compressed_writer)
+
+        with tarfile.open(fileobj=tar_writer, mode="w|", dereference=True) as tar:
+            tar.add(source_path, arcname=arcname)
+
+    return tar_writer.size
+
+
+def upload_tar(s3_key, source_path, arcname, codec="none", level=None):
+    """
+    Tar source_path as arcname and upload it to s3_key, streaming the tar into the upload without a local tar file.
+
+    Returns a dictionary with the size of the uploaded object and the raw size of the tar.
+    """
+    with MultipartUploadWriter(s3_key) as writer:
+        try:
+            raw_size = write_tar(writer, source_path, arcname, codec=codec, level=level)
+        except:
+            writer.abort()
+            raise
+
+        size = writer.size
+
+    return {"size": size, "raw_size": raw_size}
+
+
+def download_tar(s3_key, target_dir, codec="none"):
+    """
+    Download the tar at s3_key and extract it into target_dir, streaming the download into the extraction.
+
+    Returns the size of the downloaded object.
+    """
+    with RangedDownloadReader(s3_key) as reader:
+        with compression.open_reader(reader, codec) as compressed_reader:
+            with tarfile.open(fileobj=compressed_reader, mode="r|") as tar:
+                # Only extract regular files and directories inside of the target directory, when the python version
+                # supports extraction filters.
+                if hasattr(tarfile, "data_filter"):
+                    tar.extractall(target_dir, filter="data")
+                else:
+                    tar.extractall(target_dir)
+
+        size = reader.size
+
+    return size
+
+
+def benchmark_codecs(source_path, codec_specs):
+    """
+    Measure the trade-off of each codec on a model: compression ratio, compress, upload, download and decompress
+    throughput.
+
+    Each codec is measured in four passes: packing and compressing to nowhere, a push, a raw download, and a pull
+    with decompression and extraction. Throughputs are in raw (uncompressed) bytes per second, so that codecs can be
+    compared on the time they take to move the same model. The benchmark objects are deleted afterwards.
+    """
+    results = []
+
+    for codec_spec in codec_specs:
+        codec, level = compression.parse_codec(codec_spec)
+        s3_key = "{}/{}".format(mf_consts.MODEL_FACTORY_BENCHMARKS_NAMESPACE, uuid.uuid4())
+
+        try:
+            start_time = time.time()
+            sink = CountingWriter()
+            raw_size = write_tar(sink, source_path, "model", codec=codec, level=level)
+            compress_seconds = time.time() - start_time
+
+            start_time = time.time()
+            size = upload_tar(s3_key, source_path, "model", codec=codec, level=level)["size"]
+            upload_seconds = time.time() - start_time
+
+            start_time = time.time()
+            with RangedDownloadReader(s3_key) as reader:
+                while reader.read(Config.MODEL_TRANSFER_PART_SIZE):
+                    pass
+            download_seconds = time.time() - start_time
+
+            with tempfile.TemporaryDirectory(prefix="model_factory_benchmark_") as target_dir:
+                start_time = time.time()
+                download_tar(s3_key, target_dir, codec=codec)
+                pull_seconds = time.time() - start_time
+        finally:
+            storage.get_storage().delete(s3_key)
+
+        results.append({
+            "codec": compression.get_codec_spec(codec, level),
+            "raw_size": raw_size,
+            "size": size,
+            "ratio": raw_size / max(size, 1),
+            "compress_throughput": raw_size / max(compress_seconds, 1e-6),
+            "upload_seconds": upload_seconds,
+            "upload_throughput": raw_size / max(upload_seconds, 1e-6),
+            "download_seconds": download_seconds,
+            "download_throughput": raw_size / max(download_seconds, 1e-6),
+            "pull_seconds": pull_seconds,
+            # Decompressing and extracting overlap with the download in a pull, so this is the extra time they cost.
+            "decompress_seconds": max(pull_seconds - download_seconds, 0),
+        })
+
+    return results
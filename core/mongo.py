@@ -0,0 +1,462 @@
+from core import consts
+from core.config import Config
+from pymongo import IndexModel, MongoClient, ReadPreference
+from pymongo.errors import BulkWriteError, OperationFailure
+
+import atexit
+import base64
+import json
+import logging
+import pymongo
+import threading
+import time
+
+
+_READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+_mongo_client = None
+_mongo_client_lock = threading.Lock()
+
+
+def get_mongo_client():
+    """
+    Get the mongo client shared by the whole process.
+
+    The client is created on first use, and only connects to the server when the first operation is issued, so
+    importing model factory modules does not open any connection.
+    """
+    global _mongo_client
+
+    if _mongo_client is None:
+        with _mongo_client_lock:
+            if _mongo_client is None:
+                # Options which are not configured are left out, so that they keep the pymongo defaults.
+                options = {
+                    option: value for option, value in (
+                        ("maxPoolSize", Config.MONGO_MAX_POOL_SIZE),
+                        ("minPoolSize", Config.MONGO_MIN_POOL_SIZE),
+                        ("connectTimeoutMS", Config.MONGO_CONNECT_TIMEOUT_MS),
+                        ("serverSelectionTimeoutMS", Config.MONGO_SERVER_SELECTION_TIMEOUT_MS),
+                        ("socketTimeoutMS", Config.MONGO_SOCKET_TIMEOUT_MS),
+                    )
+                    if value is not None
+                }
+                options["connect"] = False
+
+                if Config.MONGO_COMPRESSORS:
+                    options["compressors"] = Config.MONGO_COMPRESSORS
+
+                _mongo_client = MongoClient(Config.MONGO_DB_ENDPOINT, **options)
+
+    return _mongo_client
+
+
+def get_collection(collection_name, for_listing=False):
+    """
+    Get a model factory collection from the shared client.
+
+    Collections for listing use the configured list read preference, so that list queries can be served by
+    secondaries.
+    """
+    collection = get_mongo_client()[consts.MODEL_FACTORY_DB_NAME][collection_name]
+
+    if for_listing:
+        assert Config.MONGO_LIST_READ_PREFERENCE in _READ_PREFERENCES, "Unknown read preference {}!".format(
+            Config.MONGO_LIST_READ_PREFERENCE
+        )
+        collection = collection.with_options(read_preference=_READ_PREFERENCES[Config.MONGO_LIST_READ_PREFERENCE])
+
+    return collection
+
+
+# All indexes managed by model factory are prefixed with this name, so that the
+# index migration never touches indexes created manually by an operator.
+MANAGED_INDEX_PREFIX = "mf_"
+
+
+def ensure_indexes(collection, index_specs):
+    """
+    Create or migrate the managed indexes of a collection.
+
+    index_specs is a dictionary mapping an index name (without the managed prefix) to a dictionary with
+    * keys: a list of (field, direction) tuples.
+    * options (optional): extra pymongo create_index options, e.g. {"unique": True}.
+
+    The function is idempotent: indexes that already match are left untouched, indexes whose definition changed are
+    dropped and recreated, and managed indexes that are no longer declared are dropped.
+    """
+    existing_indexes = collection.index_information()
+
+    index_models = []
+    for name, index_spec in index_specs.items():
+        index_name = MANAGED_INDEX_PREFIX + name
+        keys = [tuple(key) for key in index_spec["keys"]]
+        options = index_spec.get("options", {})
+
+        existing_index = existing_indexes.get(index_name)
+        if existing_index:
+            if (
+                [tuple(key) for key in existing_index["key"]] == keys and
+                all(existing_index.get(k) == v for k, v in options.items())
+            ):
+                continue
+
+            logging.info("Index {}.{} changed, recreating it.".format(collection.name, index_name))
+            collection.drop_index(index_name)
+
+        index_models.append(IndexModel(keys, name=index_name, **options))
+
+    for index_name in existing_indexes:
+        if not index_name.startswith(MANAGED_INDEX_PREFIX):
+            continue
+
+        if index_name[len(MANAGED_INDEX_PREFIX):] not in index_specs:
+            logging.info("Index {}.{} is no longer managed, dropping it.".format(collection.name, index_name))
+            collection.drop_index(index_name)
+
+    if index_models:
+        logging.info("Creating indexes {} on {}.".format(
+            ", ".join(index_model.document["name"] for index_model in index_models),
+            collection.name,
+        ))
+        collection.create_indexes(index_models)
+
+    return [index_model.document["name"] for index_model in index_models]
+
+
+def _get_plan_stages(plan):
+    stages = [plan["stage"]]
+
+    for child_key in ["inputStage", "queryPlan"]:
+        if child_key in plan:
+            stages += _get_plan_stages(plan[child_key])
+
+    for child_plan in plan.get("inputStages", []):
+        stages += _get_plan_stages(child_plan)
+
+    return stages
+
+
+def _get_plan_index_names(plan):
+    index_names = [plan["indexName"]] if "indexName" in plan else []
+
+    for child_key in ["inputStage", "queryPlan"]:
+        if child_key in plan:
+            index_names += _get_plan_index_names(plan[child_key])
+
+    for child_plan in plan.get("inputStages", []):
+        index_names += _get_plan_index_names(child_plan)
+
+    return index_names
+
+
+def explain_query(collection, query_filter, sort=None, limit=None):
+    """
+    Explain a find query, and summarize whether it is answered by a collection scan or by an index.
+    """
+    cursor = collection.find(query_filter)
+
+    if sort:
+        cursor = cursor.sort(sort)
+
+    if limit:
+        cursor = cursor.limit(limit)
+
+    explanation = cursor.explain()
+
+    winning_plan = explanation["queryPlanner"]["winningPlan"]
+    execution_stats = explanation.get("executionStats", {})
+    stages = _get_plan_stages(winning_plan)
+
+    return {
+        "collection": collection.name,
+        "collection_scan": "COLLSCAN" in stages,
+        "in_memory_sort": "SORT" in stages,
+        "stages": stages,
+        "index_names": _get_plan_index_names(winning_plan),
+        "docs_examined": execution_stats.get("totalDocsExamined"),
+        "keys_examined": execution_stats.get("totalKeysExamined"),
+        "docs_returned": execution_stats.get("nReturned"),
+        "execution_time_ms": execution_stats.get("executionTimeMillis"),
+    }
+
+
+def encode_continuation_token(sort_key, descending, last_document):
+    """
+    Encode the position after last_document into an opaque continuation token.
+    """
+    token = {
+        "sort_key": sort_key,
+        "descending": descending,
+        "last_value": last_document.get(sort_key),
+        "last_id": last_document["_id"],
+    }
+
+    return base64.urlsafe_b64encode(json.dumps(token).encode()).decode()
+
+
+def decode_continuation_token(continuation_token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(continuation_token.encode()))
+    except ValueError:
+        raise Exception("Invalid continuation token \"{}\"!".format(continuation_token))
+
+
+def _add_fields_to_projection(projection, fields):
+    if not projection:
+        return projection
+
+    if isinstance(projection, (list, tuple)):
+        return list(projection) + [field for field in fields if field not in projection]
+
+    projection = dict(projection)
+    is_inclusion = any(value for key, value in projection.items() if key != "_id")
+
+    for field in fields:
+        if is_inclusion or field == "_id":
+            projection[field] = 1
+        else:
+            projection.pop(field, None)
+
+    return projection
+
+
+def find_page(
+    collection,
+    query_filter,
+    projection=None,
+    limit=100,
+    sort_key="_id",
+    descending=True,
+    continuation_token=None,
+    allowed_sort_keys=None,
+):
+    """
+    Get a page of documents with keyset pagination.
+
+    Documents are ordered by (sort_key, _id), and a page resumes right after the last document of the previous page,
+    so fetching a page costs the same no matter how deep it is. When a continuation token is given, its sort key and
+    order take precedence over the sort_key and descending arguments.
+
+    Returns a dictionary with
+    * documents: the documents of the page.
+    * continuation_token: the token to fetch the next page, or None if this is the last page.
+    """
+    assert limit > 0, "The page size should be positive!"
+
+    if continuation_token:
+        token = decode_continuation_token(continuation_token)
+
+        sort_key = token["sort_key"]
+        descending = token["descending"]
+
+        range_operator = "$lt" if descending else "$gt"
+        if sort_key == "_id":
+            keyset_filter = {"_id": {range_operator: token["last_id"]}}
+        else:
+            keyset_filter = {"$or": [
+                {sort_key: {range_operator: token["last_value"]}},
+                {sort_key: token["last_value"], "_id": {range_operator: token["last_id"]}},
+            ]}
+
+        query_filter = {"$and": [query_filter, keyset_filter]} if query_filter else keyset_filter
+
+    assert not allowed_sort_keys or sort_key in allowed_sort_keys, "Documents can only be sorted by {}!".format(
+        ", ".join(allowed_sort_keys)
+    )
+
+    direction = pymongo.DESCENDING if descending else pymongo.ASCENDING
+    sort = [(sort_key, direction)] if sort_key == "_id" else [(sort_key, direction), ("_id", direction)]
+
+    # Fetch one extra document to know whether there is a next page.
+    documents = list(collection.find(
+        query_filter,
+        _add_fields_to_projection(projection, [sort_key, "_id"]),
+    ).sort(sort).limit(limit + 1))
+
+    has_next_page = len(documents) > limit
+    documents = documents[:limit]
+
+    return {
+        "documents": documents,
+        "continuation_token": (
+            encode_continuation_token(sort_key, descending, documents[-1]) if has_next_page else None
+        ),
+    }
+
+
+def _prefix_filter(query_filter, prefix):
+    prefixed_filter = {}
+
+    for key, value in query_filter.items():
+        if key in ("$and", "$or", "$nor"):
+            prefixed_filter[key] = [_prefix_filter(sub_filter, prefix) for sub_filter in value]
+        else:
+            prefixed_filter[prefix + key] = value
+
+    return prefixed_filter
+
+
+def watch(collection, query_filter, poll_interval=5.0):
+    """
+    Watch the documents matching query_filter.
+
+    The generator first yields all the matching documents, then yields every matching document again whenever it is
+    inserted, updated or replaced. None is yielded after the initial documents, and then every poll_interval seconds
+    when nothing changed, so that callers can check their own exit conditions.
+
+    Change streams are used when the server supports them. On a standalone server, the collection is polled instead.
+    A change stream which is invalidated, e.g. when the collection is dropped, or closed by the server, is opened
+    again, and the matching documents are yielded again, since changes may be missed in between.
+    """
+    while True:
+        try:
+            change_stream = collection.watch(
+                [{"$match": dict(
+                    operationType={"$in": ["insert", "update", "replace"]},
+                    **_prefix_filter(query_filter, "fullDocument."),
+                )}],
+                full_document="updateLookup",
+                max_await_time_ms=int(poll_interval * 1000),
+            )
+        except OperationFailure:
+            logging.info("Change streams are not supported by the server. Polling {} instead.".format(collection.name))
+            yield from _poll(collection, query_filter, poll_interval)
+            return
+
+        with change_stream:
+            # The change stream is opened before reading the current documents, so no change is missed in between.
+            yield from collection.find(query_filter)
+            yield None
+
+            while change_stream.alive:
+                change = change_stream.try_next()
+
+                if change is None:
+                    yield None
+                elif change.get("fullDocument") is not None:
+                    yield change["fullDocument"]
+
+        logging.warning("The change stream on {} was closed. Watching it again.".format(collection.name))
+        time.sleep(poll_interval)
+
+
+def _poll(collection, query_filter, poll_interval):
+    last_seen_documents = {}
+
+    while True:
+        for document in collection.find(query_filter):
+            if last_seen_documents.get(document["_id"]) == document:
+                continue
+
+            last_seen_documents[document["_id"]] = document
+            yield document
+
+        yield None
+
+        time.sleep(poll_interval)
+
+
+# The error code of the writes rejected by a unique index.
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+
+def insert_many_ignoring_duplicates(collection, documents):
+    """
+    Insert documents with an unordered bulk insert, skipping the ones whose _id already exists, so that retrying
+    an insert is idempotent when the documents have deterministic _ids.
+
+    Returns the documents actually inserted.
+    """
+    documents = list(documents)
+
+    if not documents:
+        return []
+
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+
+        # Documents inserted by a previous attempt are duplicates, anything else is a real failure.
+        if e.details.get("writeConcernErrors") or any(
+            write_error["code"] != DUPLICATE_KEY_ERROR_CODE for write_error in write_errors
+        ):
+            raise
+
+        duplicate_indexes = {write_error["index"] for write_error in write_errors}
+        documents = [document for index, document in enumerate(documents) if index not in duplicate_indexes]
+
+    return documents
+
+
+class BulkWriter:
+    """
+    Buffer write operations for a collection, and flush them with unordered bulk writes.
+
+    The buffer is flushed once it holds max_buffered_ops operations, by a background thread once its oldest operation
+    is older than max_buffered_seconds, and when the process exits.
+    """
+
+    def __init__(self, collection, max_buffered_ops=100, max_buffered_seconds=1.0):
+        self.collection = collection
+        self.max_buffered_ops = max_buffered_ops
+        self.max_buffered_seconds = max_buffered_seconds
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._ops = []
+        self._oldest_op_time = None
+        self._flush_thread = None
+
+        atexit.register(self.flush)
+
+    def add(self, op):
+        with self._lock:
+            self._ops.append(op)
+
+            if self._oldest_op_time is None:
+                self._oldest_op_time = time.time()
+
+            should_flush = len(self._ops) >= self.max_buffered_ops
+
+            if self._flush_thread is None:
+                self._flush_thread = threading.Thread(target=self._flush_periodically, daemon=True)
+                self._flush_thread.start()
+
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        # Serialize flushes, so that operations are written in the order they were buffered.
+        with self._flush_lock:
+            with self._lock:
+                ops, self._ops = self._ops, []
+                self._oldest_op_time = None
+
+            if ops:
+                self.collection.bulk_write(ops, ordered=False)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.max_buffered_seconds)
+
+            with self._lock:
+                should_flush = (
+                    self._oldest_op_time is not None and
+                    time.time() - self._oldest_op_time >= self.max_buffered_seconds
+                )
+
+            if not should_flush:
+                continue
+
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Failed to flush buffered writes to {}!".format(self.collection.name))
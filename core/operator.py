@@ -8,7 +8,6 @@ from typing import Optional
 import importlib
 import json
 import logging
-import time
 
 
 @dataclass
@@ -46,8 +45,9 @@ class Operator:
 
         operator = PipelineManager.get_operator_by_id(operator_id)
 
-        # Get the current operator job.
-        current_job_info = Tracking.get_info_for_single_job(ExecutionContext.job_id)
+        # Get the current operator job. Its immutable fields and, for a short while, its tags are cached, so fanning
+        # out to many children does not read it once per child.
+        current_job_info = ExecutionContext.get_job_info()
 
         # Create child job for the target operator.
         # When creating the job, the following configs are inherited from its parent (current) operator.
@@ -58,7 +58,6 @@ class Operator:
         # * owner
         # * tags
         # * ttl_after_finished
-        # * notification_channel
         job_id = utils.create_job(
             execution_mode=execution_mode,
             pipeline_name=current_job_info["pipeline_name"],
@@ -68,13 +67,12 @@ class Operator:
             docker_image_digest=current_job_info["docker_image_digest"],
             operator_id=operator_id,
             owner=current_job_info["owner"],
-            tags=current_job_info["tags"],
+            tags=ExecutionContext.get_job_tags(),
             cpu_request=utils.get_first_available_value([cpu_request, operator.cpu_request]),
             memory_request=utils.get_first_available_value([memory_request, operator.memory_request]),
             storage_request=utils.get_first_available_value([storage_request, operator.storage_request]),
             gpu_request=utils.get_first_available_value([gpu_request, operator.gpu_request]),
             ttl_after_finished=current_job_info["ttl_after_finished"],
-            notification_channel=current_job_info["notification_channel"],
             parent_job_id=ExecutionContext.job_id,
         )
 
@@ -87,14 +85,26 @@ class Operator:
         logging.info("Waiting for sub job {}".format(job_id))
 
         while True:
-            k8s_job = KubernetesProxy.get_job(job_id)
-
-            if k8s_job.status.succeeded:
-                return True
-            elif k8s_job.status.failed:
-                raise Exception("Job {} failed!".format(job_id))
-
-            time.sleep(60)
+            try:
+                job_info = Tracking.wait_for_jobs([job_id], timeout=consts.JOB_K8S_STATUS_CHECK_INTERVAL)[job_id]
+            except TimeoutError:
+                # Fall back to the k8s job status, in case the pod died without updating the job status.
+                try:
+                    k8s_job = KubernetesProxy.get_job(job_id)
+                except IndexError:
+                    continue
+
+                if k8s_job.status.succeeded:
+                    return True
+                elif k8s_job.status.failed:
+                    raise Exception("Job {} failed!".format(job_id))
+
+                continue
+
+            if job_info["status"] != "succeeded":
+                raise Exception("Job {} {}!".format(job_id, job_info["status"]))
+
+            return True
 
     @staticmethod
     def _get_operator_job_output(job_id):
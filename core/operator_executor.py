@@ -1,6 +1,7 @@
 from core import consts
 from core import utils as core_utils
 from core.execution_context import ExecutionContext
+from core.model_registry import ModelRegistry
 from core.pipeline_manager import PipelineManager
 from core.tracking import Tracking
 import click
@@ -10,7 +11,6 @@ import logging
 import os
 import socket
 import sys
-import time
 import traceback
 
 
@@ -50,16 +50,11 @@ def execute_pipeline_operator(job_id, operator_path, operator_params, cpu, execu
         hostname = socket.gethostname()
         local_ip = socket.gethostbyname(hostname)
 
-        # Init tracking db.
-        Tracking.update_job_stage("STARTED")
-        Tracking.update_pod_name(socket.gethostname())
-        Tracking.update_job_fields(
+        # Mark the job as running.
+        Tracking.start_job(
             job_id=job_id,
-            fields={
-                "status": "running",
-                "start_timestamp": time.time(),
-                "ip_addr": local_ip,
-            },
+            pod_name=hostname,
+            ip_addr=local_ip,
         )
 
         # Get the operator.
@@ -71,38 +66,30 @@ def execute_pipeline_operator(job_id, operator_path, operator_params, cpu, execu
             json.loads(operator_params),
         )
 
-        # Update the start time.
         logging.info("Executing operator {} with params \"{}\"".format(operator_path, params))
 
         output = operator(params)
 
-        # Update the job output.
-        if output is not None:
-            Tracking.update_job_output(output)
-
-        # Update the job stage.
-        Tracking.update_job_stage("DONE")
-
         logging.info("Finish executing job {}".format(job_id))
 
-        # Update the end time.
-        Tracking.update_job_fields(
-            job_id=job_id,
-            fields={
-                "completion_timestamp": time.time(),
-                "status": "succeeded",
-            },
-        )
+        # Make sure all the metrics logged and the models pushed by the operator are written before the job is marked
+        # as succeeded.
+        ExecutionContext.flush_metric_logger()
+        ModelRegistry.wait_for_pushes()
+
+        # Mark the job as succeeded, together with its output.
+        Tracking.complete_job(job_id=job_id, output=output)
     except:
-        Tracking.update_job_fields(
-            job_id=job_id,
-            fields={
-                "completion_timestamp": time.time(),
-                "status": "failed",
-                "exception": traceback.format_exc(),
-            },
-        )
+        Tracking.fail_job(job_id=job_id, exception=traceback.format_exc())
         raise
+    finally:
+        # Make sure all the buffered metrics and job events are written before the job exits.
+        try:
+            ExecutionContext.flush_metric_logger()
+        except:
+            logging.exception("Failed to flush the metrics of job {}!".format(job_id))
+
+        Tracking.flush_job_events()
 
 
 if __name__ == '__main__':
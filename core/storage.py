@@ -0,0 +1,271 @@
+from core.config import Config
+
+import os
+import shutil
+import threading
+import uuid
+
+try:
+    import boto3
+    import botocore.config
+except ImportError:
+    boto3 = None
+
+
+class S3Storage:
+    """
+    Object storage on the model factory s3 bucket, through one client per process. boto3 clients are thread safe, and
+    the connection pool of the client is sized for the concurrent part transfers of models.
+    """
+
+    def __init__(self, bucket=None):
+        if boto3 is None:
+            raise Exception("The s3 storage backend needs the boto3 package, please install it with pip3 install boto3!")
+
+        self.bucket = bucket or Config.S3_BUCKET
+        self.client = boto3.client(
+            's3',
+            aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
+            endpoint_url=Config.S3_ENDPOINT,
+            config=botocore.config.Config(max_pool_connections=Config.MODEL_TRANSFER_CONCURRENCY * 2),
+        )
+
+    def get_url(self, key):
+        return "s3://{}/{}".format(self.bucket, key)
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def open(self, key):
+        """
+        Open an object as a readable file object, streaming its content.
+        """
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+
+    def get_range(self, key, start, end):
+        """
+        Read the bytes of an object from start, inclusive, to end, exclusive.
+        """
+        if end <= start:
+            return b""
+
+        return self.client.get_object(
+            Bucket=self.bucket,
+            Key=key,
+            Range="bytes={}-{}".format(start, end - 1),
+        )["Body"].read()
+
+    def get_size(self, key):
+        return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def list(self, prefix):
+        """
+        List the objects under prefix as (key, size, last modified timestamp) tuples, page by page.
+        """
+        paginator = self.client.get_paginator("list_objects_v2")
+
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for s3_object in page.get("Contents", []):
+                yield s3_object["Key"], s3_object["Size"], s3_object["LastModified"].timestamp()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def delete_many(self, keys):
+        """
+        Delete objects in batches. Returns the keys which failed to be deleted.
+        """
+        keys = list(keys)
+        failed_keys = []
+
+        # delete_objects takes at most 1000 keys.
+        for start in range(0, len(keys), 1000):
+            response = self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True},
+            )
+            failed_keys.extend(error["Key"] for error in response.get("Errors", []))
+
+        return failed_keys
+
+    def create_multipart_upload(self, key):
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=key)["UploadId"]
+
+    def upload_part(self, key, upload_id, part_number, data):
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort_multipart_upload(self, key, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+
+class LocalStorage:
+    """
+    Object storage in a local directory, with the interface of S3Storage, so that models and logs can be pushed,
+    pulled and benchmarked without s3.
+
+    Objects are files named by their key under root_dir. Writes go to a temporary file first, and multipart uploads
+    keep their parts aside until they are completed, so that readers never see a partial object.
+    """
+
+    # The directory of the temporary files and of the parts of multipart uploads, under root_dir.
+    TMP_DIR_NAME = ".tmp"
+
+    def __init__(self, root_dir=None):
+        self.root_dir = os.path.abspath(os.path.expanduser(root_dir or Config.LOCAL_STORAGE_DIR))
+        os.makedirs(os.path.join(self.root_dir, self.TMP_DIR_NAME), exist_ok=True)
+
+    def _get_path(self, key):
+        path = os.path.abspath(os.path.join(self.root_dir, *key.split("/")))
+
+        assert path.startswith(self.root_dir + os.sep), "Invalid storage key {}!".format(key)
+
+        return path
+
+    def _get_tmp_path(self):
+        return os.path.join(self.root_dir, self.TMP_DIR_NAME, str(uuid.uuid4()))
+
+    def get_url(self, key):
+        return "file://{}".format(self._get_path(key))
+
+    def get(self, key):
+        with self.open(key) as fp:
+            return fp.read()
+
+    def open(self, key):
+        return open(self._get_path(key), "rb")
+
+    def get_range(self, key, start, end):
+        if end <= start:
+            return b""
+
+        with self.open(key) as fp:
+            return os.pread(fp.fileno(), end - start, start)
+
+    def get_size(self, key):
+        return os.path.getsize(self._get_path(key))
+
+    def put(self, key, data):
+        tmp_path = self._get_tmp_path()
+
+        with open(tmp_path, "wb") as fp:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                fp.write(data)
+            else:
+                shutil.copyfileobj(data, fp)
+
+        self._commit(tmp_path, key)
+
+    def _commit(self, tmp_path, key):
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def list(self, prefix):
+        """
+        List the objects under prefix as (key, size, last modified timestamp) tuples, ordered by key like s3.
+        """
+        keys = []
+
+        for dir_path, dir_names, file_names in os.walk(self.root_dir):
+            if dir_path == self.root_dir:
+                dir_names.remove(self.TMP_DIR_NAME)
+
+            for file_name in file_names:
+                key = os.path.relpath(os.path.join(dir_path, file_name), self.root_dir).replace(os.sep, "/")
+
+                if key.startswith(prefix):
+                    keys.append(key)
+
+        for key in sorted(keys):
+            stat = os.stat(self._get_path(key))
+            yield key, stat.st_size, stat.st_mtime
+
+    def delete(self, key):
+        try:
+            os.remove(self._get_path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+        return []
+
+    def _get_upload_dir(self, upload_id):
+        return os.path.join(self.root_dir, self.TMP_DIR_NAME, upload_id)
+
+    def create_multipart_upload(self, key):
+        upload_id = "upload-{}".format(uuid.uuid4())
+        os.makedirs(self._get_upload_dir(upload_id))
+
+        return upload_id
+
+    def upload_part(self, key, upload_id, part_number, data):
+        with open(os.path.join(self._get_upload_dir(upload_id), str(part_number)), "wb") as fp:
+            fp.write(data)
+
+        return {"PartNumber": part_number}
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        upload_dir = self._get_upload_dir(upload_id)
+        tmp_path = self._get_tmp_path()
+
+        with open(tmp_path, "wb") as fp:
+            for part in sorted(parts, key=lambda part: part["PartNumber"]):
+                with open(os.path.join(upload_dir, str(part["PartNumber"])), "rb") as part_fp:
+                    shutil.copyfileobj(part_fp, fp)
+
+        self._commit(tmp_path, key)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    def abort_multipart_upload(self, key, upload_id):
+        shutil.rmtree(self._get_upload_dir(upload_id), ignore_errors=True)
+
+
+STORAGE_BACKENDS = {
+    "s3": S3Storage,
+    "local": LocalStorage,
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """
+    Get the storage shared by the process, on the backend of the storage_backend config.
+    """
+    global _storage
+
+    with _storage_lock:
+        if _storage is None:
+            if Config.STORAGE_BACKEND not in STORAGE_BACKENDS:
+                raise Exception("Unknown storage backend {}, expecting one of {}!".format(
+                    Config.STORAGE_BACKEND,
+                    ", ".join(STORAGE_BACKENDS),
+                ))
+
+            _storage = STORAGE_BACKENDS[Config.STORAGE_BACKEND]()
+
+    return _storage
@@ -1,8 +1,13 @@
 from bson.objectid import ObjectId
+from datetime import datetime, timezone
 from core import consts
-from core.config import Config
+from core.artifact_store import ArtifactStore
 from core.execution_context import ExecutionContext
-from pymongo import MongoClient
+from core.job_archive import JobArchive
+from core import job_stats
+from core import mongo
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
 
 import json
 import logging
@@ -11,12 +16,311 @@ import time
 
 
 class Tracking:
+    # Managed indexes. See core.mongo.ensure_indexes for the spec format.
+    JOB_INDEXES = {
+        "owner_creation_timestamp": {"keys": [("owner", 1), ("creation_timestamp", -1), ("_id", -1)]},
+        "tags_creation_timestamp": {"keys": [("tags", 1), ("creation_timestamp", -1), ("_id", -1)]},
+        "owner_pipeline_name_creation_timestamp": {
+            "keys": [("owner", 1), ("pipeline_name", 1), ("creation_timestamp", -1), ("_id", -1)],
+        },
+        "pipeline_name_creation_timestamp": {"keys": [("pipeline_name", 1), ("creation_timestamp", -1), ("_id", -1)]},
+        "execution_mode_status": {"keys": [("execution_mode", 1), ("status", 1)]},
+        "parent_job_id": {"keys": [("parent_job_id", 1)]},
+        "creation_timestamp": {"keys": [("creation_timestamp", -1), ("_id", -1)]},
+        "stats_recorded_status": {"keys": [("stats_recorded", 1), ("status", 1)]},
+    }
+    MODEL_INDEXES = {
+        "model_name_timestamp": {"keys": [("model_name", 1), ("timestamp", -1)]},
+        "tags": {"keys": [("tags", 1)]},
+        "timestamp": {"keys": [("timestamp", -1)]},
+    }
+    JOB_EVENT_INDEXES = {
+        "job_id_timestamp": {"keys": [("job_id", 1), ("timestamp", 1)]},
+    }
+    MODEL_METRIC_INDEXES = {
+        "model_id_key_step": {"keys": [("model_id", 1), ("key", 1), ("step", 1), ("timestamp", 1)]},
+        "job_id_key_step": {"keys": [("job_id", 1), ("key", 1), ("step", 1), ("timestamp", 1)]},
+        "model_id_key_timestamp": {"keys": [("model_id", 1), ("key", 1), ("timestamp", 1), ("step", 1)]},
+        "job_id_key_timestamp": {"keys": [("job_id", 1), ("key", 1), ("timestamp", 1), ("step", 1)]},
+    }
+    MODEL_METRIC_SUMMARY_INDEXES = {
+        "model_id_key": {"keys": [("model_id", 1), ("key", 1)], "options": {"unique": True}},
+        "model_name_key_latest_value": {"keys": [("model_name", 1), ("key", 1), ("latest.value", -1)]},
+        "model_name_key_max_value": {"keys": [("model_name", 1), ("key", 1), ("max_value", -1)]},
+        "model_name_key_min_value": {"keys": [("model_name", 1), ("key", 1), ("min_value", 1)]},
+    }
+    MODEL_CHUNK_INDEXES = {
+        "refs_last_use_timestamp": {"keys": [("refs", 1), ("last_use_timestamp", 1)]},
+    }
+    JOB_STATS_INDEXES = {
+        "day_pipeline_name": {"keys": [("day", 1), ("pipeline_name", 1)]},
+    }
+    PROD_MODEL_INDEXES = {}
+    MODEL_FLEET_INDEXES = {
+        "model_name_hostname": {"keys": [("model_name", 1), ("hostname", 1)], "options": {"unique": True}},
+    }
+
+    # The job fields which can be used as the sort key of a page of jobs.
+    JOB_PAGINATION_SORT_KEYS = ("creation_timestamp", "_id")
+
+    # The migration backfilling the promotion timestamps of the models promoted before they were recorded.
+    MODEL_PROMOTIONS_MIGRATION = "model_promotions"
+
+    # The job lifecycle state machine: the statuses a job can transition to a status from.
+    JOB_STATUS_TRANSITIONS = {
+        "running": ("pending",),
+        "succeeded": ("running",),
+        "failed": ("pending", "running"),
+    }
+
     @classmethod
     def init(cls):
-        cls.mongo_client = MongoClient(Config.MONGO_DB_ENDPOINT)
-        cls.jobs_collection = cls.mongo_client[consts.MODEL_FACTORY_DB_NAME][consts.MODEL_FACTORY_JOB_COLLECTION_NAME]
-        cls.models = cls.mongo_client[consts.MODEL_FACTORY_DB_NAME][consts.MODEL_FACTORY_MODEL_REGISTRY]
-        cls.prod_models = cls.mongo_client[consts.MODEL_FACTORY_DB_NAME][consts.MODEL_FACTORY_PROD_MODEL]
+        cls.mongo_client = mongo.get_mongo_client()
+        cls.jobs_collection = mongo.get_collection(consts.MODEL_FACTORY_JOB_COLLECTION_NAME)
+        cls.job_events = mongo.get_collection(consts.MODEL_FACTORY_JOB_EVENTS_COLLECTION_NAME)
+        cls.job_stats = mongo.get_collection(consts.MODEL_FACTORY_JOB_STATS_COLLECTION_NAME)
+        cls.models = mongo.get_collection(consts.MODEL_FACTORY_MODEL_REGISTRY)
+        cls.model_metrics = mongo.get_collection(consts.MODEL_FACTORY_MODEL_METRICS_COLLECTION_NAME)
+        cls.model_metric_summaries = mongo.get_collection(consts.MODEL_FACTORY_MODEL_METRIC_SUMMARIES_COLLECTION_NAME)
+        cls.prod_models = mongo.get_collection(consts.MODEL_FACTORY_PROD_MODEL)
+        cls.model_fleet = mongo.get_collection(consts.MODEL_FACTORY_MODEL_FLEET_COLLECTION_NAME)
+        cls.model_chunks = mongo.get_collection(consts.MODEL_FACTORY_MODEL_CHUNKS_COLLECTION_NAME)
+        cls.model_metadata_indexes = mongo.get_collection(consts.MODEL_FACTORY_MODEL_METADATA_INDEXES_COLLECTION_NAME)
+        cls.migrations = mongo.get_collection(consts.MODEL_FACTORY_MIGRATIONS_COLLECTION_NAME)
+
+        # List queries may be served by secondaries, see Config.MONGO_LIST_READ_PREFERENCE.
+        cls.jobs_list_collection = mongo.get_collection(consts.MODEL_FACTORY_JOB_COLLECTION_NAME, for_listing=True)
+        cls.models_list_collection = mongo.get_collection(consts.MODEL_FACTORY_MODEL_REGISTRY, for_listing=True)
+
+        # Job events are append only, so they are buffered and written in batches.
+        cls.job_events_writer = mongo.BulkWriter(cls.job_events)
+
+    @classmethod
+    def ensure_indexes(cls):
+        mongo.ensure_indexes(cls.jobs_collection, cls.JOB_INDEXES)
+        mongo.ensure_indexes(cls.job_events, cls.JOB_EVENT_INDEXES)
+        mongo.ensure_indexes(cls.job_stats, cls.JOB_STATS_INDEXES)
+        cls.ensure_model_indexes()
+        mongo.ensure_indexes(cls.model_metrics, cls.MODEL_METRIC_INDEXES)
+        mongo.ensure_indexes(cls.model_metric_summaries, cls.MODEL_METRIC_SUMMARY_INDEXES)
+        mongo.ensure_indexes(cls.model_chunks, cls.MODEL_CHUNK_INDEXES)
+        mongo.ensure_indexes(cls.prod_models, cls.PROD_MODEL_INDEXES)
+        mongo.ensure_indexes(cls.model_fleet, cls.MODEL_FLEET_INDEXES)
+        JobArchive.ensure_indexes()
+
+    @classmethod
+    def ensure_model_indexes(cls):
+        """
+        Create the model indexes, together with the declared model metadata indexes.
+
+        A metadata index is declared per model name and metadata key. It is a partial index on the models of that
+        name, so models without such metadata do not pay for it.
+        """
+        model_index_specs = dict(cls.MODEL_INDEXES)
+
+        for metadata_index in cls.model_metadata_indexes.find():
+            model_index_specs[metadata_index["index_name"]] = {
+                "keys": [("model_name", 1), ("metadata.{}".format(metadata_index["key"]), 1)],
+                "options": {"partialFilterExpression": {"model_name": metadata_index["model_name"]}},
+            }
+
+        return mongo.ensure_indexes(cls.models, model_index_specs)
+
+    @classmethod
+    def declare_model_metadata_index(cls, model_name, key):
+        cls.model_metadata_indexes.update_one(
+            {"_id": json.dumps([model_name, key])},
+            {"$set": {
+                "model_name": model_name,
+                "key": key,
+                "index_name": "metadata_{}_{}".format(model_name, key),
+            }},
+            upsert=True,
+        )
+
+        return cls.ensure_model_indexes()
+
+    @classmethod
+    def drop_model_metadata_index(cls, model_name, key):
+        cls.model_metadata_indexes.delete_one({"_id": json.dumps([model_name, key])})
+
+        return cls.ensure_model_indexes()
+
+    @classmethod
+    def list_model_metadata_indexes(cls):
+        return list(cls.model_metadata_indexes.find({}, {"_id": 0}))
+
+    @classmethod
+    def get_canonical_queries(cls):
+        """
+        The queries issued by the cli, the services and the triggers on the tracking collections.
+
+        They are used to verify that every hot query is answered by an index.
+        """
+        now = time.time()
+        terminal_statuses = list(consts.JOB_TERMINAL_STATUSES)
+
+        return [
+            {
+                "name": "cli: mf job list",
+                "collection": cls.jobs_collection,
+                "filter": {"tags": {"$nin": ["hide"]}, "owner": "owner"},
+                "sort": [("creation_timestamp", -1), ("_id", -1)],
+                "limit": 20,
+            },
+            {
+                "name": "cli: mf job list --pipeline",
+                "collection": cls.jobs_collection,
+                "filter": {"tags": {"$nin": ["hide"]}, "owner": "owner", "pipeline_name": "pipeline"},
+                "sort": [("creation_timestamp", -1), ("_id", -1)],
+                "limit": 20,
+            },
+            {
+                "name": "cli: mf job list --owner '*' --pipeline",
+                "collection": cls.jobs_collection,
+                "filter": {"tags": {"$nin": ["hide"]}, "pipeline_name": "pipeline"},
+                "sort": [("creation_timestamp", -1), ("_id", -1)],
+                "limit": 20,
+            },
+            {
+                "name": "cli: mf job delete",
+                "collection": cls.jobs_collection,
+                "filter": {"parent_job_id": "j-parent"},
+            },
+            {
+                "name": "cli: mf trigger delete",
+                "collection": cls.jobs_collection,
+                "filter": {"tags": {"$all": ["trigger", "trigger_job"], "$nin": ["hide"]}},
+            },
+            {
+                "name": "cli: mf job events",
+                "collection": cls.job_events,
+                "filter": {"job_id": "j-job", "timestamp": {"$gte": now - 24 * 3600}},
+                "sort": [("timestamp", 1)],
+            },
+            {
+                "name": "syncer: sync_job_metadata",
+                "collection": cls.jobs_collection,
+                "filter": {
+                    "execution_mode": consts.EXECUTION_MODE_K8S,
+                    "status": {"$nin": terminal_statuses},
+                },
+            },
+            {
+                "name": "job archiver: archive_jobs",
+                "collection": cls.jobs_collection,
+                "filter": {
+                    "status": {"$in": terminal_statuses},
+                    "creation_timestamp": {"$lt": now - consts.JOB_ARCHIVE_AGE_SECONDS},
+                    "stats_recorded": {"$ne": False},
+                },
+                "sort": [("creation_timestamp", 1)],
+                "limit": consts.JOB_ARCHIVE_SEGMENT_SIZE,
+            },
+            {
+                "name": "tracking: get_info_for_single_job on archived jobs",
+                "collection": JobArchive.segments,
+                "filter": {"job_ids": "j-archived"},
+            },
+            {
+                "name": "syncer: sync_job_stats",
+                "collection": cls.jobs_collection,
+                "filter": {
+                    "stats_recorded": False,
+                    "status": {"$in": terminal_statuses},
+                    "creation_timestamp": {"$ne": None},
+                },
+                "limit": 1000,
+            },
+            {
+                "name": "autohide: autohide_job",
+                "collection": cls.jobs_collection,
+                "filter": {
+                    "tags": {"$nin": ["hide"]},
+                    "creation_timestamp": {"$lt": now - consts.AUTOHIDE_AGE_SECONDS},
+                },
+            },
+            {
+                "name": "trigger: ActiveTagJobTrigger",
+                "collection": cls.jobs_collection,
+                "filter": {
+                    "status": {"$nin": terminal_statuses},
+                    "tags": "active_tag",
+                    "execution_mode": consts.EXECUTION_MODE_K8S,
+                },
+            },
+            {
+                "name": "cli: mf model list --model_name",
+                "collection": cls.models,
+                "filter": {"model_name": "model"},
+                "sort": [("timestamp", -1)],
+            },
+            {
+                "name": "cli: mf model list --tag",
+                "collection": cls.models,
+                "filter": {"tags": "tag"},
+            },
+            {
+                "name": "cli: mf model metric",
+                "collection": cls.model_metrics,
+                "filter": {"model_id": "m-model", "key": "loss"},
+                "sort": [("step", 1), ("timestamp", 1)],
+            },
+            {
+                "name": "cli: mf model list --show-metric",
+                "collection": cls.model_metric_summaries,
+                "filter": {"model_id": {"$in": ["m-model"]}},
+            },
+            {
+                "name": "cli: mf model top",
+                "collection": cls.model_metric_summaries,
+                "filter": {"model_name": "model", "key": "auc"},
+                "sort": [("latest.value", -1)],
+                "limit": 10,
+            },
+            {
+                "name": "cli: mf model top --by best --ascending",
+                "collection": cls.model_metric_summaries,
+                "filter": {"model_name": "model", "key": "loss"},
+                "sort": [("min_value", 1)],
+                "limit": 10,
+            },
+            {
+                "name": "cli: mf model fleet",
+                "collection": cls.model_fleet,
+                "filter": {"model_name": "model"},
+            },
+            {
+                "name": "model gc: get_reclaimable_models",
+                "collection": cls.models,
+                "filter": {
+                    "tags": "hide",
+                    "timestamp": {"$lt": now - consts.MODEL_GC_AGE_SECONDS},
+                    "promotion_timestamp": {"$exists": False},
+                },
+            },
+            {
+                "name": "model gc: get_unreferenced_model_chunks",
+                "collection": cls.model_chunks,
+                "filter": {"refs": {"$lte": 0}, "last_use_timestamp": {"$lt": now - consts.MODEL_GC_GRACE_SECONDS}},
+                "limit": 1000,
+            },
+            {
+                "name": "frontend: list_artifacts",
+                "collection": ArtifactStore.artifacts,
+                "filter": {"_id": ArtifactStore.get_artifact_id_range("namespace", "prefix")},
+                "sort": [("_id", 1)],
+                "limit": consts.ARTIFACT_PAGE_SIZE,
+            },
+            {
+                "name": "autohide: autohide_model",
+                "collection": cls.models,
+                "filter": {
+                    "tags": {"$nin": ["hide"]},
+                    "timestamp": {"$lt": now - consts.AUTOHIDE_AGE_SECONDS},
+                },
+            },
+        ]
 
     @classmethod
     def create_job(
@@ -68,7 +372,6 @@ class Tracking:
                 "storage_request": storage_request,
                 "gpu_request": gpu_request,
             },
-            "events": [],
             "creation_timestamp": time.time(),
             "start_timestamp": None,
             "completion_timestamp": None,
@@ -78,14 +381,22 @@ class Tracking:
             "exception": None,
             "archived": False,  # check if a job is archived or not
             "exception": None,
+            "stats_recorded": False,  # check if a job is counted in the job stats summaries
         })
 
     @classmethod
-    def get_info_for_single_job(cls, job_id):
-        return cls.jobs_collection.find_one(
+    def get_info_for_single_job(cls, job_id, job_fields=None):
+        job_info = cls.jobs_collection.find_one(
             {"job_id": job_id},
+            job_fields,
         )
 
+        # Fall back to the job archive for cold jobs.
+        if job_info is None:
+            job_info = JobArchive.get_info_for_single_job(job_id, job_fields)
+
+        return job_info
+
     @classmethod
     def get_info_for_multi_jobs(cls, job_ids):
         return cls.jobs_collection.find(
@@ -93,21 +404,454 @@ class Tracking:
         )
 
     @classmethod
-    def get_info_for_all_visiable_jobs(cls):
-        return list(cls.jobs_collection.find(
-            {"tags": {"$nin": ["hide"]}},
-        ))
+    def get_info_for_all_visiable_jobs(cls, created_before=None):
+        job_filter = {"tags": {"$nin": ["hide"]}}
+
+        if created_before is not None:
+            job_filter["creation_timestamp"] = {"$lt": created_before}
+
+        return list(cls.jobs_collection.find(job_filter))
 
     @classmethod
     def get_info_for_all_jobs(cls):
         return cls.jobs_collection.find()
 
     @classmethod
-    def get_info_for_jobs(cls, job_filter, job_fields=None):
+    def get_info_for_jobs(cls, job_filter, job_fields=None, include_archived=False):
         """
         Get job info, passing filter json dictionary in.
+
+        With include_archived, the jobs matching the filter in the job archive are returned as well.
+        """
+        # Services, e.g. the execution syncer and the triggers, act on these jobs, so they are read from the primary.
+        jobs_info = list(cls.jobs_collection.find(job_filter, job_fields))
+
+        if include_archived:
+            hot_job_ids = {job_info["_id"] for job_info in jobs_info}
+            jobs_info.extend(
+                job_info for job_info in JobArchive.find_jobs(job_filter, job_fields)
+                if job_info["_id"] not in hot_job_ids
+            )
+
+        return jobs_info
+
+    @classmethod
+    def get_page_of_jobs(
+        cls,
+        job_filter,
+        job_fields=None,
+        limit=100,
+        sort_key="creation_timestamp",
+        descending=True,
+        continuation_token=None,
+        include_archived=False,
+    ):
+        """
+        Get a page of job info with keyset pagination.
+
+        Returns a dictionary with the jobs of the page, and an opaque continuation token to fetch the next page. The
+        continuation token is None on the last page.
+
+        With include_archived, the page is merged from the jobs collection and the job archive, which requires jobs to
+        be sorted by creation_timestamp. The job archive is only read when some of its segments may hold jobs ordered
+        before the last job of the page found in the jobs collection.
+        """
+        page = mongo.find_page(
+            cls.jobs_list_collection,
+            query_filter=job_filter or {},
+            projection=job_fields,
+            limit=limit,
+            sort_key=sort_key,
+            descending=descending,
+            continuation_token=continuation_token,
+            allowed_sort_keys=cls.JOB_PAGINATION_SORT_KEYS,
+        )
+
+        if not include_archived:
+            return {
+                "jobs": page["documents"],
+                "continuation_token": page["continuation_token"],
+            }
+
+        after = None
+        if continuation_token:
+            token = mongo.decode_continuation_token(continuation_token)
+            sort_key = token["sort_key"]
+            descending = token["descending"]
+            after = (token["last_value"], token["last_id"])
+
+        assert sort_key == "creation_timestamp", "Archived jobs can only be paginated by creation_timestamp!"
+
+        def _get_sort_value(job_info):
+            return (job_info.get("creation_timestamp") or 0, job_info["_id"])
+
+        # If the page is full, only the archived jobs ordered before its last job can make it to the page.
+        before = _get_sort_value(page["documents"][-1]) if page["continuation_token"] else None
+
+        hot_job_ids = {job_info["_id"] for job_info in page["documents"]}
+        archived_jobs_info = [
+            job_info for job_info in JobArchive.find_jobs(
+                job_filter,
+                job_fields,
+                limit=limit + 1,
+                descending=descending,
+                after=after,
+                before=before,
+            )
+            if job_info["_id"] not in hot_job_ids
+        ]
+
+        jobs_info = sorted(page["documents"] + archived_jobs_info, key=_get_sort_value, reverse=descending)
+        has_next_page = bool(page["continuation_token"]) or len(jobs_info) > limit
+        jobs_info = jobs_info[:limit]
+
+        return {
+            "jobs": jobs_info,
+            "continuation_token": (
+                mongo.encode_continuation_token(sort_key, descending, jobs_info[-1]) if has_next_page else None
+            ),
+        }
+
+    @classmethod
+    def watch(cls, job_filter, poll_interval=consts.JOB_WATCH_POLL_INTERVAL):
+        """
+        Watch the jobs matching job_filter. See core.mongo.watch for the semantics.
+        """
+        return mongo.watch(cls.jobs_collection, job_filter, poll_interval=poll_interval)
+
+    @classmethod
+    def wait_for_jobs(cls, job_ids, timeout=None, on_job_done=None, poll_interval=consts.JOB_WATCH_POLL_INTERVAL):
+        """
+        Block until all the jobs reach a terminal status, with a single watch on all of them.
+
+        on_job_done is called with the job info of each job once it is done. Returns a dictionary from job id to the
+        final job info.
+        """
+        pending_job_ids = set(job_ids)
+        seen_job_ids = set()
+        done_jobs_info = {}
+        deadline = timeout and time.time() + timeout
+
+        if not pending_job_ids:
+            return done_jobs_info
+
+        for job_info in cls.watch({"_id": {"$in": list(pending_job_ids)}}, poll_interval=poll_interval):
+            if job_info is None:
+                # The initial snapshot is done, so any job not seen yet is either archived, hence done, or does not
+                # exist.
+                missing_job_ids = pending_job_ids - seen_job_ids
+                for job_id in JobArchive.get_archived_job_ids(missing_job_ids) if missing_job_ids else []:
+                    job_info = JobArchive.get_info_for_single_job(job_id)
+                    seen_job_ids.add(job_id)
+                    pending_job_ids.remove(job_id)
+                    done_jobs_info[job_id] = job_info
+
+                    if on_job_done:
+                        on_job_done(job_info)
+
+                missing_job_ids = pending_job_ids - seen_job_ids
+                assert not missing_job_ids, "Jobs not found: {}".format(", ".join(sorted(missing_job_ids)))
+
+                if not pending_job_ids:
+                    break
+
+                if deadline and time.time() > deadline:
+                    raise TimeoutError("Timed out waiting for jobs: {}".format(", ".join(sorted(pending_job_ids))))
+
+                continue
+
+            job_id = job_info["_id"]
+            seen_job_ids.add(job_id)
+
+            if job_id not in pending_job_ids or job_info.get("status") not in consts.JOB_TERMINAL_STATUSES:
+                continue
+
+            pending_job_ids.remove(job_id)
+            done_jobs_info[job_id] = job_info
+
+            if on_job_done:
+                on_job_done(job_info)
+
+            if not pending_job_ids:
+                break
+
+        # The watch only ends by itself if it fails, which must not pass for the jobs being done.
+        if pending_job_ids:
+            raise Exception("Stopped watching jobs before they were done: {}!".format(
+                ", ".join(sorted(pending_job_ids)),
+            ))
+
+        return done_jobs_info
+
+    @classmethod
+    def get_jobs_pending_stats(cls, limit=1000):
+        """
+        Get terminal jobs which are not counted in the job stats summaries yet.
+
+        Jobs without a creation timestamp, e.g. inplace jobs, have no day to be counted in, and are left out.
+        """
+        return list(cls.jobs_collection.find(
+            {
+                "stats_recorded": False,
+                "status": {"$in": list(consts.JOB_TERMINAL_STATUSES)},
+                "creation_timestamp": {"$ne": None},
+            },
+            job_stats.JOB_STATS_FIELDS,
+        ).limit(limit))
+
+    @classmethod
+    def record_job_stats(cls, jobs_info):
+        """
+        Count terminal jobs in their job stats summary documents. Returns the number of jobs counted.
+
+        Jobs are claimed first, by replacing their stats_recorded flag with a claim id, so that concurrent runs never
+        count a job twice, and only the jobs claimed by this run are counted and then marked as recorded. Jobs claimed
+        by a run which failed before recording them are counted again by mf admin rebuild-job-stats.
+        """
+        jobs_info = [job_info for job_info in jobs_info if job_info.get("creation_timestamp") is not None]
+
+        if not jobs_info:
+            return 0
+
+        claim_id = str(ObjectId())
+        job_ids = [job_info["_id"] for job_info in jobs_info]
+
+        cls.jobs_collection.update_many(
+            {"_id": {"$in": job_ids}, "stats_recorded": False},
+            {"$set": {"stats_recorded": claim_id}},
+        )
+        claimed_job_ids = {
+            job_info["_id"]
+            for job_info in cls.jobs_collection.find({"_id": {"$in": job_ids}, "stats_recorded": claim_id}, ["_id"])
+        }
+
+        if not claimed_job_ids:
+            return 0
+
+        cls._increment_job_stats([job_info for job_info in jobs_info if job_info["_id"] in claimed_job_ids])
+
+        cls.jobs_collection.update_many(
+            {"_id": {"$in": list(claimed_job_ids)}, "stats_recorded": claim_id},
+            {"$set": {"stats_recorded": True}},
+        )
+
+        return len(claimed_job_ids)
+
+    @classmethod
+    def _increment_job_stats(cls, jobs_info):
+        summaries = {}
+        for job_info in jobs_info:
+            summary_key = job_stats.get_summary_key(job_info)
+            summary_id = job_stats.get_summary_id(summary_key)
+
+            if summary_id not in summaries:
+                summaries[summary_id] = (summary_key, [])
+
+            summaries[summary_id][1].append(job_stats.get_summary_increments(job_info))
+
+        if summaries:
+            cls.job_stats.bulk_write([
+                UpdateOne(
+                    {"_id": summary_id},
+                    {"$set": summary_key, "$inc": job_stats.merge_counters(increments_list)},
+                    upsert=True,
+                )
+                for summary_id, (summary_key, increments_list) in summaries.items()
+            ], ordered=False)
+
+    @classmethod
+    def get_jobs_to_archive(cls, archived_before, limit=consts.JOB_ARCHIVE_SEGMENT_SIZE):
+        """
+        Get the oldest terminal jobs created before archived_before, once they are counted in the job stats.
+        """
+        return list(cls.jobs_collection.find(
+            {
+                "status": {"$in": list(consts.JOB_TERMINAL_STATUSES)},
+                "creation_timestamp": {"$lt": archived_before},
+                "stats_recorded": {"$ne": False},
+            },
+        ).sort("creation_timestamp", pymongo.ASCENDING).limit(limit))
+
+    @classmethod
+    def archive_jobs(cls, jobs_info):
+        """
+        Move jobs from the jobs collection to the job archive, one segment per creation day.
+
+        Jobs are removed from the jobs collection only once their segment is written, and only if they are unchanged
+        since they were read, so that e.g. a tag added meanwhile is not lost. Changed jobs are archived again on the
+        next run, in a newer segment superseding the older one. Jobs already found unchanged in the job archive, e.g.
+        after an interrupted run, are not archived twice.
+        """
+        archived_job_ids = JobArchive.get_archived_job_ids([job_info["_id"] for job_info in jobs_info])
+
+        jobs_info_by_day = {}
+        for job_info in jobs_info:
+            archived_job_info = dict(job_info, archived=True)
+
+            # Segments are json, so the jobs are compared the way they would be stored.
+            if (
+                job_info["_id"] in archived_job_ids and
+                JobArchive.get_info_for_single_job(job_info["_id"]) == json.loads(
+                    json.dumps(archived_job_info, default=str)
+                )
+            ):
+                continue
+
+            day = datetime.utcfromtimestamp(job_info["creation_timestamp"]).strftime("%Y-%m-%d")
+            jobs_info_by_day.setdefault(day, []).append(archived_job_info)
+
+        for day, day_jobs_info in sorted(jobs_info_by_day.items()):
+            manifest = JobArchive.write_segment(day, day_jobs_info)
+
+            superseded_job_ids = [job_id for job_id in manifest["job_ids"] if job_id in archived_job_ids]
+            if superseded_job_ids:
+                JobArchive.supersede_jobs(superseded_job_ids, manifest["_id"])
+
+        if jobs_info:
+            cls.jobs_collection.bulk_write([
+                DeleteOne({"_id": job_info["_id"], "$expr": {"$eq": ["$$ROOT", {"$literal": job_info}]}})
+                for job_info in jobs_info
+            ], ordered=False)
+
+    @classmethod
+    def migrate_job_stats(cls):
+        """
+        Mark the jobs created before the job stats, including the ones still running, as not counted yet, so that the
+        execution syncer counts them once they are terminal.
+
+        Jobs counted already, or marked by an earlier run, have the field, so the migration can be run again safely.
+        Jobs without a creation timestamp, e.g. inplace jobs, have no day to be counted in, and are left unmarked.
+        """
+        return cls.jobs_collection.update_many(
+            {"stats_recorded": {"$exists": False}, "creation_timestamp": {"$ne": None}},
+            {"$set": {"stats_recorded": False}},
+        ).modified_count
+
+    @classmethod
+    def rebuild_job_stats(cls, since_day=None, batch_size=1000):
+        """
+        Recompute the job stats summaries from the jobs created since since_day (YYYY-MM-DD), or from all the jobs,
+        including the archived ones.
+
+        The jobs of the jobs collection are marked as not counted yet first, which keeps the job archiver from moving
+        them, and fails the deletion of those it is archiving. The archived jobs no longer in the jobs collection are
+        then counted from the job archive, and the others by the execution syncer logic.
+        """
+        job_filter = {"creation_timestamp": {"$ne": None}}
+        summary_filter = {}
+
+        if since_day:
+            job_filter["creation_timestamp"] = {
+                "$gte": datetime.strptime(since_day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp(),
+            }
+            summary_filter["day"] = {"$gte": since_day}
+
+        cls.job_stats.delete_many(summary_filter)
+        cls.jobs_collection.update_many(job_filter, {"$set": {"stats_recorded": False}})
+
+        recorded_job_count = 0
+        archived_jobs_info = []
+        for job_info in JobArchive.iter_jobs(since_day):
+            archived_jobs_info.append(job_info)
+
+            if len(archived_jobs_info) >= batch_size:
+                recorded_job_count += cls._record_archived_job_stats(archived_jobs_info)
+                archived_jobs_info = []
+
+        recorded_job_count += cls._record_archived_job_stats(archived_jobs_info)
+
+        while True:
+            jobs_info = cls.get_jobs_pending_stats(limit=batch_size)
+
+            if not jobs_info:
+                break
+
+            recorded_job_count += cls.record_job_stats(jobs_info)
+            logging.info("Recorded stats of {} jobs.".format(recorded_job_count))
+
+        return recorded_job_count
+
+    @classmethod
+    def _record_archived_job_stats(cls, jobs_info):
+        """
+        Count archived jobs in the job stats summaries, unless they are still in the jobs collection. Returns the
+        number of jobs counted.
+        """
+        job_ids = [job_info["_id"] for job_info in jobs_info]
+        unarchived_job_ids = {
+            job_info["_id"] for job_info in cls.jobs_collection.find({"_id": {"$in": job_ids}}, ["_id"])
+        }
+        jobs_info = [job_info for job_info in jobs_info if job_info["_id"] not in unarchived_job_ids]
+
+        cls._increment_job_stats(jobs_info)
+        logging.info("Recorded stats of {} archived jobs.".format(len(jobs_info)))
+
+        return len(jobs_info)
+
+    @classmethod
+    def get_job_stats(cls, group_by, start_day=None, end_day=None, pipeline_name=None, owner=None, pool=None):
         """
-        return list(cls.jobs_collection.find(job_filter, job_fields))
+        Aggregate the job stats summaries by the group_by dimensions, within the [start_day, end_day] range.
+        """
+        for dimension in group_by:
+            assert dimension in job_stats.JOB_STATS_DIMENSIONS, "Job stats can not be grouped by {}!".format(dimension)
+
+        summary_filter = {}
+
+        if start_day or end_day:
+            summary_filter["day"] = {}
+            if start_day:
+                summary_filter["day"]["$gte"] = start_day
+            if end_day:
+                summary_filter["day"]["$lte"] = end_day
+
+        for dimension, value in [("pipeline_name", pipeline_name), ("owner", owner), ("pool", pool)]:
+            if value is not None:
+                summary_filter[dimension] = value
+
+        groups = cls.job_stats.aggregate([
+            {"$match": summary_filter},
+            {"$group": {
+                "_id": {dimension: "${}".format(dimension) for dimension in group_by} or None,
+                "count": {"$sum": "$count"},
+                "succeeded": {"$sum": "$succeeded"},
+                "failed": {"$sum": "$failed"},
+                "deleted": {"$sum": "$deleted"},
+                "duration_sum": {"$sum": "$duration_sum"},
+                "duration_count": {"$sum": "$duration_count"},
+                "queue_wait_sum": {"$sum": "$queue_wait_sum"},
+                "queue_wait_count": {"$sum": "$queue_wait_count"},
+                "duration_histograms": {"$push": "$duration_histogram"},
+                "queue_wait_histograms": {"$push": "$queue_wait_histogram"},
+                "failure_reasons": {"$push": "$failure_reasons"},
+            }},
+            {"$sort": {"_id": 1}},
+        ])
+
+        stats = []
+        for group in groups:
+            duration_histogram = job_stats.merge_counters(group["duration_histograms"])
+            queue_wait_histogram = job_stats.merge_counters(group["queue_wait_histograms"])
+
+            stats.append(dict(
+                group["_id"] or {},
+                count=group["count"],
+                succeeded=group["succeeded"],
+                failed=group["failed"],
+                deleted=group["deleted"],
+                success_rate=group["succeeded"] / group["count"] if group["count"] else None,
+                avg_duration=group["duration_sum"] / group["duration_count"] if group["duration_count"] else None,
+                p50_duration=job_stats.get_percentile_from_histogram(duration_histogram, 50),
+                p95_duration=job_stats.get_percentile_from_histogram(duration_histogram, 95),
+                avg_queue_wait=(
+                    group["queue_wait_sum"] / group["queue_wait_count"] if group["queue_wait_count"] else None
+                ),
+                p50_queue_wait=job_stats.get_percentile_from_histogram(queue_wait_histogram, 50),
+                p95_queue_wait=job_stats.get_percentile_from_histogram(queue_wait_histogram, 95),
+                failure_reasons=job_stats.merge_counters(group["failure_reasons"]),
+            ))
+
+        return stats
 
     @classmethod
     def get_job_stage(cls, job_id):
@@ -126,6 +870,66 @@ class Tracking:
 
         cls.add_job_event("update_stage", {"stage_name": stage_name})
 
+    @classmethod
+    def transition_job(cls, job_id, status, stage=None, fields=None):
+        """
+        Apply a job lifecycle transition with a single write, without reading the job document back.
+
+        The status, the stage and the other fields are set together, and only if the job is currently in a status
+        allowed by JOB_STATUS_TRANSITIONS. A job which was never registered, e.g. an inplace job, is created. The
+        transition is recorded as a job event. Returns whether the transition was applied.
+        """
+        update_fields = dict(fields or {}, status=status)
+        if stage is not None:
+            update_fields["stage"] = stage
+
+        try:
+            cls.jobs_collection.update_one(
+                {"_id": job_id, "status": {"$in": list(cls.JOB_STATUS_TRANSITIONS[status])}},
+                {"$set": update_fields, "$setOnInsert": {"job_id": job_id}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # The job exists, but its current status does not allow this transition.
+            logging.warning("Job {} can not transition to status {} from its current status.".format(job_id, status))
+            return False
+
+        cls.add_job_event("update_status", {"status": status, "stage_name": stage}, job_id=job_id)
+
+        return True
+
+    @classmethod
+    def start_job(cls, job_id, pod_name, ip_addr):
+        return cls.transition_job(
+            job_id,
+            status="running",
+            stage="STARTED",
+            fields={
+                "pod_name": pod_name,
+                "ip_addr": ip_addr,
+                "start_timestamp": time.time(),
+            },
+        )
+
+    @classmethod
+    def complete_job(cls, job_id, output=None):
+        fields = {"completion_timestamp": time.time()}
+        if output is not None:
+            fields["output"] = output
+
+        return cls.transition_job(job_id, status="succeeded", stage="DONE", fields=fields)
+
+    @classmethod
+    def fail_job(cls, job_id, exception):
+        return cls.transition_job(
+            job_id,
+            status="failed",
+            fields={
+                "completion_timestamp": time.time(),
+                "exception": exception,
+            },
+        )
+
     @classmethod
     def update_job_fields(cls, job_id, fields):
         cls.jobs_collection.find_one_and_update(
@@ -142,21 +946,27 @@ class Tracking:
             upsert=True
         )
 
+    @classmethod
+    def _update_job_tags(cls, job_id, update):
+        """
+        Update the tags of a job of the jobs collection. Archived jobs are immutable, so their tags cannot be changed.
+        """
+        job_info = cls.jobs_collection.find_one_and_update({"_id": job_id}, update, projection=["_id"])
+        ExecutionContext.invalidate_job_tags(job_id)
+
+        if job_info is None:
+            if JobArchive.get_archived_job_ids([job_id]):
+                raise Exception("Job {} is archived, and the tags of archived jobs cannot be changed!".format(job_id))
+
+            raise Exception("Job {} does not exist!".format(job_id))
+
     @classmethod
     def tag_job(cls, job_id, tag):
-        cls.jobs_collection.find_one_and_update(
-            {"_id" : job_id},
-            {"$addToSet": {"tags": tag}},
-            upsert=True
-        )
+        cls._update_job_tags(job_id, {"$addToSet": {"tags": tag}})
 
     @classmethod
     def untag_job(cls, job_id, tag):
-        cls.jobs_collection.find_one_and_update(
-            {"_id" : job_id},
-            {"$pull": {"tags": tag}},
-            upsert=True
-        )
+        cls._update_job_tags(job_id, {"$pull": {"tags": tag}})
 
     @classmethod
     def update_job_output(cls, output):
@@ -167,18 +977,82 @@ class Tracking:
         )
 
     @classmethod
-    def add_job_event(cls, event_type, event_metadata):
-        cls.jobs_collection.find_one_and_update(
-            {"_id" : ExecutionContext.job_id},
-            {"$push": {
-                "events": {
-                    "timestamp": time.time(),
-                    "type": event_type,
-                    "metadata": event_metadata,
+    def add_job_event(cls, event_type, event_metadata, job_id=None):
+        """
+        Buffer a job event. Events are written to the job events collection in batches.
+        """
+        cls.job_events_writer.add(InsertOne({
+            "job_id": job_id or ExecutionContext.job_id,
+            "timestamp": time.time(),
+            "type": event_type,
+            "metadata": event_metadata,
+        }))
+
+    @classmethod
+    def flush_job_events(cls):
+        cls.job_events_writer.flush()
+
+    @classmethod
+    def get_job_events(cls, job_id, start_timestamp=None, end_timestamp=None, event_types=None):
+        """
+        Get the events of a job within [start_timestamp, end_timestamp), ordered by timestamp.
+        """
+        event_filter = {"job_id": job_id}
+
+        if start_timestamp is not None or end_timestamp is not None:
+            event_filter["timestamp"] = {}
+            if start_timestamp is not None:
+                event_filter["timestamp"]["$gte"] = start_timestamp
+            if end_timestamp is not None:
+                event_filter["timestamp"]["$lt"] = end_timestamp
+
+        if event_types:
+            event_filter["type"] = {"$in": event_types}
+
+        return list(cls.job_events.find(
+            event_filter,
+            {"_id": 0},
+        ).sort("timestamp", pymongo.ASCENDING))
+
+    @classmethod
+    def migrate_job_events(cls, batch_size=1000):
+        """
+        Move the events embedded in job documents into the job events collection.
+        """
+        migrated_job_count = 0
+
+        while True:
+            jobs_info = list(cls.jobs_collection.find(
+                {"events": {"$exists": True}},
+                {"events": 1},
+            ).limit(batch_size))
+
+            if not jobs_info:
+                break
+
+            # The events get deterministic _ids, so that the events copied by an interrupted run are skipped when the
+            # migration is run again.
+            mongo.insert_many_ignoring_duplicates(cls.job_events, [
+                {
+                    "_id": "{}-{}".format(job_info["_id"], index),
+                    "job_id": job_info["_id"],
+                    "timestamp": event["timestamp"],
+                    "type": event["type"],
+                    "metadata": event["metadata"],
                 }
-            }},
-            upsert=True
-        )
+                for job_info in jobs_info
+                for index, event in enumerate(job_info["events"] or [])
+            ])
+
+            cls.jobs_collection.update_many(
+                {"_id": {"$in": [job_info["_id"] for job_info in jobs_info]}},
+                {"$unset": {"events": ""}},
+            )
+
+            migrated_job_count += len(jobs_info)
+            logging.info("Migrated events of {} jobs.".format(migrated_job_count))
+
+        return migrated_job_count
 
     @classmethod
     def create_model(
@@ -196,8 +1070,7 @@ class Tracking:
             "job_id": job_id,
             "timestamp": timestamp,
             "tags": tags,
-            "metadata": json.dumps(metadata),
-            "metric": {},
+            "metadata": metadata,
         })
 
     @classmethod
@@ -210,10 +1083,194 @@ class Tracking:
     def update_model_metadata(cls, model_id, metadata):
         return cls.models.find_one_and_update(
             {"_id" : model_id},
-            {"$set": {"metadata": json.dumps(metadata)}},
+            {"$set": {"metadata": metadata}},
             upsert=True
         )
 
+    @classmethod
+    def update_model_archive(cls, model_id, archive):
+        """
+        Record how the model is stored: its archive format, codec and sizes.
+        """
+        cls.models.update_one(
+            {"_id": model_id},
+            {"$set": {"archive": archive}},
+        )
+
+    @classmethod
+    def get_model_chunks(cls, chunk_hashes):
+        """
+        Get the stored model chunks among chunk_hashes, as a dictionary from chunk hash to chunk info. Chunks being
+        garbage collected are left out.
+        """
+        return {
+            chunk_info["_id"]: chunk_info
+            for chunk_info in cls.model_chunks.find({"_id": {"$in": list(chunk_hashes)}, "deleting": {"$ne": True}})
+        }
+
+    @classmethod
+    def add_model_chunk(cls, chunk_hash, size, stored_size, codec, generation):
+        """
+        Record a model chunk once its object is stored under generation, replacing the chunk if it is being garbage
+        collected. Chunks are created without references, which are added once the model manifest referencing them is
+        stored.
+
+        Returns the recorded chunk info, which is another generation of the chunk if a concurrent push recorded it
+        first.
+        """
+        chunk_info = {
+            "size": size,
+            "stored_size": stored_size,
+            "codec": codec,
+            "generation": generation,
+            "refs": 0,
+            "creation_timestamp": time.time(),
+            "last_use_timestamp": time.time(),
+        }
+
+        try:
+            cls.model_chunks.update_one(
+                {"_id": chunk_hash, "deleting": True},
+                {"$set": chunk_info, "$unset": {"deleting": ""}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return cls.model_chunks.find_one({"_id": chunk_hash})
+
+        return dict(chunk_info, _id=chunk_hash)
+
+    @classmethod
+    def touch_model_chunks(cls, chunk_hashes):
+        """
+        Mark stored chunks as used by a push in progress, so that the garbage collection keeps them even if they are
+        not referenced yet. Returns the stored chunks among chunk_hashes, like get_model_chunks.
+        """
+        if not chunk_hashes:
+            return {}
+
+        cls.model_chunks.update_many(
+            {"_id": {"$in": list(chunk_hashes)}, "deleting": {"$ne": True}},
+            {"$set": {"last_use_timestamp": time.time()}},
+        )
+
+        # Chunks are read back after they are touched, so that a chunk found here is not being collected.
+        return cls.get_model_chunks(chunk_hashes)
+
+    @classmethod
+    def update_model_chunk_refs(cls, chunk_hashes, increment):
+        if not chunk_hashes:
+            return
+
+        cls.model_chunks.update_many(
+            {"_id": {"$in": list(chunk_hashes)}},
+            {"$inc": {"refs": increment}, "$set": {"last_use_timestamp": time.time()}},
+        )
+
+    @classmethod
+    def get_unreferenced_model_chunks(cls, used_before, after=None, limit=1000):
+        """
+        Get the chunks no model references, and no push used since used_before, by pages of limit chunks ordered by
+        hash. after is the last hash of the previous page.
+        """
+        chunk_filter = {"refs": {"$lte": 0}, "last_use_timestamp": {"$lt": used_before}}
+
+        if after is not None:
+            chunk_filter["_id"] = {"$gt": after}
+
+        return list(cls.model_chunks.find(chunk_filter, ["stored_size", "generation"]).sort("_id", 1).limit(limit))
+
+    @classmethod
+    def mark_model_chunks_deleting(cls, chunk_hashes, used_before):
+        """
+        Mark unreferenced chunks as being garbage collected, unless they were used since used_before, so that pushes
+        no longer reuse them. Returns the info of the chunks marked, including those marked by an earlier run.
+        """
+        chunk_hashes = list(chunk_hashes)
+
+        cls.model_chunks.update_many(
+            {"_id": {"$in": chunk_hashes}, "refs": {"$lte": 0}, "last_use_timestamp": {"$lt": used_before}},
+            {"$set": {"deleting": True}},
+        )
+
+        return list(cls.model_chunks.find(
+            {"_id": {"$in": chunk_hashes}, "deleting": True},
+            ["stored_size", "generation"],
+        ))
+
+    @classmethod
+    def delete_model_chunks(cls, chunks_info):
+        """
+        Delete the documents of chunks marked as being garbage collected, once their objects are deleted. Chunks
+        stored again by a push meanwhile are kept.
+        """
+        if not chunks_info:
+            return
+
+        cls.model_chunks.bulk_write([
+            DeleteOne({"_id": chunk_info["_id"], "deleting": True, "generation": chunk_info.get("generation")})
+            for chunk_info in chunks_info
+        ], ordered=False)
+
+    @classmethod
+    def migrate_model_metadata(cls, batch_size=1000):
+        """
+        Convert the json string metadata of the models into subdocuments.
+        """
+        migrated_model_count = 0
+
+        while True:
+            models_info = list(cls.models.find(
+                {"metadata": {"$type": "string"}},
+                {"metadata": 1},
+            ).limit(batch_size))
+
+            if not models_info:
+                break
+
+            updates = []
+            for model_info in models_info:
+                try:
+                    metadata = json.loads(model_info["metadata"]) if model_info["metadata"] else {}
+                except ValueError:
+                    logging.warning("Model {} has malformed metadata, keeping it as a raw value.".format(
+                        model_info["_id"],
+                    ))
+                    metadata = {"raw": model_info["metadata"]}
+
+                if not isinstance(metadata, dict):
+                    metadata = {"raw": metadata}
+
+                updates.append(UpdateOne({"_id": model_info["_id"]}, {"$set": {"metadata": metadata}}))
+
+            cls.models.bulk_write(updates, ordered=False)
+
+            migrated_model_count += len(models_info)
+            logging.info("Migrated metadata of {} models.".format(migrated_model_count))
+
+        return migrated_model_count
+
+    @classmethod
+    def get_all_artifact_namespaces(cls):
+        return ArtifactStore.list_namespaces()
+
+    @classmethod
+    def get_page_of_artifacts(
+        cls,
+        artifact_namespace,
+        prefix=None,
+        limit=consts.ARTIFACT_PAGE_SIZE,
+        continuation_token=None,
+    ):
+        return ArtifactStore.get_page(artifact_namespace, prefix or "", limit, continuation_token)
+
+    @classmethod
+    def del_artifact(cls, artifact_namespace, artifact_name):
+        return ArtifactStore.delete(artifact_namespace, artifact_name)
+
+    @classmethod
+    def drop_artifact_namespace(cls, artifact_namespace):
+        return ArtifactStore.drop_namespace(artifact_namespace)
+
     @classmethod
     def get_info_for_single_model(cls, model_id):
         return cls.models.find_one(
@@ -261,12 +1318,12 @@ class Tracking:
 
         """
         if query_filter:
-            mongo_qs = cls.models.find(
+            mongo_qs = cls.models_list_collection.find(
                 query_filter,
                 fields,
             )
         else:
-            mongo_qs = cls.models.find(
+            mongo_qs = cls.models_list_collection.find(
                 query_filter
             )
 
@@ -300,6 +1357,10 @@ class Tracking:
     @classmethod
     def promote_model(cls, model_id):
         model_info = cls.get_info_for_single_model(model_id)
+
+        # Promoted models are never garbage collected.
+        cls.models.update_one({"_id": model_id}, {"$set": {"promotion_timestamp": time.time()}})
+
         return cls.prod_models.find_one_and_update(
             {"_id" : model_info["model_name"]},
             {"$set": {"model_id": model_id}},
@@ -308,18 +1369,62 @@ class Tracking:
 
     @classmethod
     def add_production_model_event(cls, model_name, event_type, event_metadata):
+        events_push = {
+            "$each": [{
+                "timestamp": time.time(),
+                "type": event_type,
+                "metadata": event_metadata,
+            }],
+        }
+
+        # Only the latest events are kept, so that the document stays small, once the promote events are no longer the
+        # only record of the legacy promotions.
+        if cls.is_migration_applied(cls.MODEL_PROMOTIONS_MIGRATION):
+            events_push["$slice"] = -consts.PRODUCTION_MODEL_MAX_EVENTS
+
         cls.prod_models.find_one_and_update(
             {"_id" : model_name},
-            {"$push": {
-                "events": {
-                    "timestamp": time.time(),
-                    "type": event_type,
-                    "metadata": event_metadata,
-                }
-            }},
+            {"$push": {"events": events_push}},
             upsert=True
         )
 
+    @classmethod
+    def is_migration_applied(cls, migration):
+        return cls.migrations.find_one({"_id": migration}, ["_id"]) is not None
+
+    @classmethod
+    def migrate_model_promotions(cls):
+        """
+        Backfill the promotion timestamp of the models promoted before it was recorded, from the promote events of the
+        production models, and record that the migration was applied.
+
+        Only models without a promotion timestamp are updated, so the migration can be run again safely.
+        """
+        promotions = cls.prod_models.aggregate([
+            {"$project": {"events": 1}},
+            {"$unwind": "$events"},
+            {"$match": {"events.type": "promote", "events.metadata.model_id": {"$exists": True}}},
+            {"$group": {"_id": "$events.metadata.model_id", "timestamp": {"$min": "$events.timestamp"}}},
+        ], allowDiskUse=True)
+
+        updates = [
+            UpdateOne(
+                {"_id": promotion["_id"], "promotion_timestamp": {"$exists": False}},
+                {"$set": {"promotion_timestamp": promotion["timestamp"]}},
+            )
+            for promotion in promotions
+        ]
+
+        migrated_model_count = cls.models.bulk_write(updates, ordered=False).modified_count if updates else 0
+
+        cls.migrations.update_one(
+            {"_id": cls.MODEL_PROMOTIONS_MIGRATION},
+            {"$set": {"timestamp": time.time()}},
+            upsert=True,
+        )
+
+        return migrated_model_count
+
     @classmethod
     def list_production_models(cls, model_names):
         if model_names:
@@ -330,17 +1435,424 @@ class Tracking:
             return list(cls.prod_models.find())
 
     @classmethod
-    def add_metric(cls, model_id, key, value, timestamp=None):
-        if not timestamp:
-            timestamp = time.time()
-        metric_val = {
+    def update_model_fleet_state(cls, model_name, hostname, model_id, metadata=None):
+        """
+        Record the model a host serves for a model name, with one document per host. Hosts report on every download,
+        and periodically while they run, so that the hosts gone from the fleet can be told apart by last_seen_timestamp.
+        metadata replaces the metadata of the host when given.
+        """
+        now = time.time()
+        is_same_model = {"$eq": ["$model_id", model_id]}
+
+        # An update pipeline, so that the previous model and the time of the update only change with the model.
+        cls.model_fleet.update_one(
+            {"model_name": model_name, "hostname": hostname},
+            [{"$set": {
+                "previous_model_id": {"$cond": [is_same_model, "$previous_model_id", "$model_id"]},
+                "update_timestamp": {"$cond": [is_same_model, "$update_timestamp", now]},
+                "model_id": model_id,
+                "last_seen_timestamp": now,
+                "metadata": "$metadata" if metadata is None else {"$literal": metadata},
+            }}],
+            upsert=True,
+        )
+
+    @classmethod
+    def get_model_fleet(cls, model_name, stale_seconds=consts.MODEL_FLEET_STALE_SECONDS, include_hosts=False):
+        """
+        Summarize the rollout of a model name over the fleet: the number of hosts serving each model, aggregated by
+        the server.
+
+        Hosts which have not reported for stale_seconds are counted apart as stale.
+        """
+        now = time.time()
+        production_model = cls.prod_models.find_one({"_id": model_name}, ["model_id"]) or {}
+
+        versions = list(cls.model_fleet.aggregate([
+            {"$match": {"model_name": model_name}},
+            {"$group": {
+                "_id": "$model_id",
+                "host_count": {"$sum": 1},
+                "live_host_count": {"$sum": {"$cond": [{"$gte": ["$last_seen_timestamp", now - stale_seconds]}, 1, 0]}},
+                "first_update_timestamp": {"$min": "$update_timestamp"},
+                "last_update_timestamp": {"$max": "$update_timestamp"},
+                "last_seen_timestamp": {"$max": "$last_seen_timestamp"},
+            }},
+            {"$sort": {"last_update_timestamp": -1}},
+        ]))
+
+        for version in versions:
+            version["model_id"] = version.pop("_id")
+            version["production"] = version["model_id"] == production_model.get("model_id")
+
+        fleet = {
+            "model_name": model_name,
+            "production_model_id": production_model.get("model_id"),
+            "host_count": sum(version["host_count"] for version in versions),
+            "live_host_count": sum(version["live_host_count"] for version in versions),
+            "production_host_count": sum(version["live_host_count"] for version in versions if version["production"]),
+            "versions": versions,
+        }
+
+        if include_hosts:
+            fleet["hosts"] = list(cls.model_fleet.find({"model_name": model_name}, {"_id": 0}).sort("hostname", 1))
+
+        return fleet
+
+    @classmethod
+    def watch_production_models(cls, model_names, poll_interval=consts.PRODUCTION_MODEL_WATCH_POLL_INTERVAL):
+        """
+        Watch the production models of the given model names. See core.mongo.watch for the semantics.
+        """
+        return mongo.watch(cls.prod_models, {"_id": {"$in": list(model_names)}}, poll_interval=poll_interval)
+
+    @classmethod
+    def add_metric(cls, model_id, key, value, timestamp=None, step=None, job_id=None):
+        cls.add_metrics([{
+            "model_id": model_id,
+            "job_id": job_id,
+            "key": key,
             "value": value,
+            "step": step,
             "timestamp": timestamp,
+        }])
+
+    @classmethod
+    def add_metrics(cls, metrics):
+        """
+        Add metric points in bulk.
+
+        Each metric point is a dictionary with
+        * model_id and/or job_id: the model or the job the metric belongs to.
+        * key: the metric name, e.g. "loss".
+        * value: the metric value.
+        * step (optional): the training step, e.g. the epoch or the batch number.
+        * timestamp (optional): defaults to now.
+        * _id (optional): makes adding the point idempotent, points whose _id was already added are skipped.
+
+        Only the points added are folded into the summaries. Returns the number of points added.
+        """
+        now = time.time()
+        metric_points = []
+
+        for metric in metrics:
+            assert metric.get("model_id") or metric.get("job_id"), "A metric needs a model_id or a job_id!"
+
+            metric_point = {
+                "model_id": metric.get("model_id"),
+                "job_id": metric.get("job_id"),
+                "key": metric["key"],
+                "value": metric["value"],
+                "step": metric.get("step"),
+                "timestamp": metric.get("timestamp") or now,
+            }
+
+            if metric.get("_id"):
+                metric_point["_id"] = metric["_id"]
+
+            metric_points.append(metric_point)
+
+        metric_points = mongo.insert_many_ignoring_duplicates(cls.model_metrics, metric_points)
+        cls._update_model_metric_summaries(metric_points)
+
+        return len(metric_points)
+
+    @classmethod
+    def _update_model_metric_summaries(cls, metric_points):
+        """
+        Fold metric points into the per (model, key) summaries: the latest point, the best values and the count.
+
+        The latest point is the one with the highest (step, timestamp), which is what $max picks when comparing the
+        {step, timestamp, value} subdocuments, so out of order writes are handled.
+        """
+        def _get_point_order(metric_point):
+            return (metric_point["step"] is not None, metric_point["step"] or 0, metric_point["timestamp"])
+
+        summaries = {}
+        for metric_point in metric_points:
+            if not metric_point["model_id"]:
+                continue
+
+            summary_key = (metric_point["model_id"], metric_point["key"])
+            summary = summaries.get(summary_key)
+
+            if summary is None:
+                summaries[summary_key] = summary = {
+                    "latest": metric_point,
+                    "max_value": metric_point["value"],
+                    "min_value": metric_point["value"],
+                    "count": 0,
+                }
+
+            if _get_point_order(metric_point) > _get_point_order(summary["latest"]):
+                summary["latest"] = metric_point
+
+            summary["max_value"] = max(summary["max_value"], metric_point["value"])
+            summary["min_value"] = min(summary["min_value"], metric_point["value"])
+            summary["count"] += 1
+
+        if not summaries:
+            return
+
+        model_names = {
+            model_info["_id"]: model_info["model_name"]
+            for model_info in cls.models.find(
+                {"_id": {"$in": list({model_id for model_id, _ in summaries})}},
+                {"model_name": 1},
+            )
         }
-        cls.models.find_one_and_update(
-            {"_id": model_id},
-            {"$addToSet": {"metric.{}".format(key): metric_val}},
-        )
 
+        cls.model_metric_summaries.bulk_write([
+            UpdateOne(
+                {"model_id": model_id, "key": key},
+                {
+                    "$set": {"model_name": model_names.get(model_id)},
+                    "$max": {
+                        "latest": {
+                            "step": summary["latest"]["step"],
+                            "timestamp": summary["latest"]["timestamp"],
+                            "value": summary["latest"]["value"],
+                        },
+                        "max_value": summary["max_value"],
+                    },
+                    "$min": {"min_value": summary["min_value"]},
+                    "$inc": {"count": summary["count"]},
+                },
+                upsert=True,
+            )
+            for (model_id, key), summary in summaries.items()
+        ], ordered=False)
+
+    @classmethod
+    def rebuild_model_metric_summaries(cls):
+        """
+        Recompute the model metric summaries from the model metrics collection.
+        """
+        cls.model_metric_summaries.delete_many({})
+
+        model_names = {
+            model_info["_id"]: model_info["model_name"]
+            for model_info in cls.models.find({}, {"model_name": 1})
+        }
+
+        summaries = cls.model_metrics.aggregate([
+            {"$match": {"model_id": {"$ne": None}}},
+            {"$sort": {"model_id": 1, "key": 1, "step": 1, "timestamp": 1}},
+            {"$group": {
+                "_id": {"model_id": "$model_id", "key": "$key"},
+                "latest": {"$last": {"step": "$step", "timestamp": "$timestamp", "value": "$value"}},
+                "max_value": {"$max": "$value"},
+                "min_value": {"$min": "$value"},
+                "count": {"$sum": 1},
+            }},
+        ], allowDiskUse=True)
+
+        summary_count = 0
+        summaries_batch = []
+        for summary in summaries:
+            summary_id = summary.pop("_id")
+
+            summaries_batch.append(dict(
+                summary,
+                model_id=summary_id["model_id"],
+                model_name=model_names.get(summary_id["model_id"]),
+                key=summary_id["key"],
+            ))
+
+            if len(summaries_batch) >= 1000:
+                cls.model_metric_summaries.insert_many(summaries_batch, ordered=False)
+                summary_count += len(summaries_batch)
+                summaries_batch = []
+
+        if summaries_batch:
+            cls.model_metric_summaries.insert_many(summaries_batch, ordered=False)
+            summary_count += len(summaries_batch)
+
+        return summary_count
+
+    @classmethod
+    def get_referenced_model_ids(cls):
+        """
+        Get the ids of the models production models reference: the current production models, the models of their
+        events, e.g. former production models, and the models served by the fleet.
+        """
+        model_ids = set()
+
+        for prod_model_info in cls.prod_models.find({}, ["model_id", "events.metadata"]):
+            model_ids.add(prod_model_info.get("model_id"))
+
+            for event in prod_model_info.get("events", []):
+                for field in ("model_id", "old_model_id", "new_model_id"):
+                    model_ids.add((event.get("metadata") or {}).get(field))
+
+        for host_info in cls.model_fleet.find({}, ["model_id", "previous_model_id"]):
+            model_ids.add(host_info.get("model_id"))
+            model_ids.add(host_info.get("previous_model_id"))
+
+        model_ids.discard(None)
+
+        return model_ids
+
+    @classmethod
+    def get_reclaimable_models(cls, hidden_before, excluded_model_ids=()):
+        """
+        Get the models which can be garbage collected: hidden, created before hidden_before, and never promoted.
+        """
+        return list(cls.models.find(
+            {
+                "tags": "hide",
+                "timestamp": {"$lt": hidden_before},
+                "promotion_timestamp": {"$exists": False},
+                "_id": {"$nin": list(excluded_model_ids)},
+            },
+            ["model_name", "timestamp", "archive"],
+        ))
+
+    @classmethod
+    def get_existing_model_ids(cls, model_ids):
+        return {model_info["_id"] for model_info in cls.models.find({"_id": {"$in": list(model_ids)}}, ["_id"])}
+
+    @classmethod
+    def delete_models(cls, model_ids):
+        """
+        Delete models with their metrics in bulk.
+        """
+        model_ids = list(model_ids)
+
+        cls.models.delete_many({"_id": {"$in": model_ids}})
+        cls.model_metrics.delete_many({"model_id": {"$in": model_ids}})
+        cls.model_metric_summaries.delete_many({"model_id": {"$in": model_ids}})
+
+    @classmethod
+    def delete_model_metrics(cls, model_id):
+        cls.model_metrics.delete_many({"model_id": model_id})
+        cls.model_metric_summaries.delete_many({"model_id": model_id})
+
+    @classmethod
+    def get_model_leaderboard(cls, model_name, key, k=10, by="latest", ascending=False):
+        """
+        Get the top k models of a model name, ranked by the latest or the best value of a metric.
+
+        The best value is the max value, or the min value when ascending, e.g. for a loss. Each entry has the model
+        id, the latest point and the max and min values of the metric.
+        """
+        assert by in ("latest", "best"), "Models can only be ranked by the latest or the best value of a metric!"
+
+        if by == "latest":
+            sort_field = "latest.value"
+        else:
+            sort_field = "min_value" if ascending else "max_value"
+
+        return list(cls.model_metric_summaries.find(
+            {"model_name": model_name, "key": key, sort_field: {"$ne": None}},
+            {"_id": 0},
+        ).sort(sort_field, pymongo.ASCENDING if ascending else pymongo.DESCENDING).limit(k))
+
+    @classmethod
+    def _get_metric_filter(cls, model_id=None, job_id=None):
+        assert model_id or job_id, "Either model_id or job_id is needed!"
+
+        return {"model_id": model_id} if model_id else {"job_id": job_id}
+
+    @classmethod
+    def get_metric_series(cls, key, model_id=None, job_id=None, max_points=None, x_field="step"):
+        """
+        Get a metric series of a model or a job, ordered by x_field ("step" or "timestamp").
+
+        With max_points, the series is downsampled on the server into at most max_points buckets of consecutive
+        points. Each bucket reports the mean, min and max value, the last x of the bucket and its number of points.
+        Series without steps are bucketed by timestamp.
+        """
+        assert x_field in ("step", "timestamp"), "Metric series can only be ordered by step or timestamp!"
+
+        metric_filter = dict(cls._get_metric_filter(model_id, job_id), key=key)
+
+        if not max_points:
+            # Points with the same x are ordered by the other field.
+            tie_field = "timestamp" if x_field == "step" else "step"
+
+            return list(cls.model_metrics.find(
+                metric_filter,
+                {"_id": 0, "step": 1, "timestamp": 1, "value": 1},
+            ).sort([(x_field, pymongo.ASCENDING), (tie_field, pymongo.ASCENDING)]))
+
+        # Points logged without a step, e.g. legacy points, would all fall in the same bucket.
+        if x_field == "step" and not cls.model_metrics.find_one(dict(metric_filter, step={"$ne": None}), ["_id"]):
+            x_field = "timestamp"
+
+        buckets = cls.model_metrics.aggregate([
+            {"$match": metric_filter},
+            {"$bucketAuto": {
+                "groupBy": "${}".format(x_field),
+                "buckets": max_points,
+                "output": {
+                    "value": {"$avg": "$value"},
+                    "min_value": {"$min": "$value"},
+                    "max_value": {"$max": "$value"},
+                    "step": {"$max": "$step"},
+                    "timestamp": {"$max": "$timestamp"},
+                    "count": {"$sum": 1},
+                },
+            }},
+            {"$project": {"_id": 0}},
+        ], allowDiskUse=True)
+
+        return list(buckets)
+
+    @classmethod
+    def get_latest_metrics(cls, model_ids):
+        """
+        Get the latest value of every metric of the models, as {model_id: {key: {"value", "step", "timestamp"}}}.
+        """
+        latest_metrics = {model_id: {} for model_id in model_ids}
+
+        for summary in cls.model_metric_summaries.find(
+            {"model_id": {"$in": list(model_ids)}},
+            {"model_id": 1, "key": 1, "latest": 1},
+        ):
+            latest_metrics[summary["model_id"]][summary["key"]] = summary["latest"]
+
+        return latest_metrics
+
+    @classmethod
+    def migrate_model_metrics(cls, batch_size=1000):
+        """
+        Move the metric arrays embedded in model documents into the model metrics collection.
+        """
+        migrated_model_count = 0
+
+        while True:
+            models_info = list(cls.models.find(
+                {"metric": {"$exists": True}},
+                {"metric": 1, "job_id": 1},
+            ).limit(batch_size))
+
+            if not models_info:
+                break
+
+            metrics = [
+                {
+                    "model_id": model_info["_id"],
+                    "job_id": model_info.get("job_id"),
+                    "key": key,
+                    "value": metric_val["value"],
+                    "timestamp": metric_val["timestamp"],
+                }
+                for model_info in models_info
+                for key, metric_vals in (model_info["metric"] or {}).items()
+                for metric_val in metric_vals
+            ]
+
+            cls.add_metrics(metrics)
+
+            cls.models.update_many(
+                {"_id": {"$in": [model_info["_id"] for model_info in models_info]}},
+                {"$unset": {"metric": ""}},
+            )
+
+            migrated_model_count += len(models_info)
+            logging.info("Migrated metrics of {} models.".format(migrated_model_count))
+
+        return migrated_model_count
 
 Tracking.init()
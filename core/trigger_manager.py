@@ -1,6 +1,5 @@
 from core import consts
-from core.config import Config
-from pymongo import MongoClient
+from core import mongo
 import collections
 import importlib
 import json
@@ -8,10 +7,29 @@ import time
 
 
 class TriggerManager:
+    # Managed indexes. See core.mongo.ensure_indexes for the spec format.
+    TRIGGER_INDEXES = {
+        "trigger_class": {"keys": [("trigger_class", 1)]},
+    }
+
     @classmethod
     def init(cls):
-        cls.mongo_client = MongoClient(Config.MONGO_DB_ENDPOINT)
-        cls.triggers = cls.mongo_client[consts.MODEL_FACTORY_DB_NAME][consts.MODEL_FACTORY_TRIGGERS_COLLECTION_NAME]
+        cls.mongo_client = mongo.get_mongo_client()
+        cls.triggers = mongo.get_collection(consts.MODEL_FACTORY_TRIGGERS_COLLECTION_NAME)
+
+    @classmethod
+    def ensure_indexes(cls):
+        mongo.ensure_indexes(cls.triggers, cls.TRIGGER_INDEXES)
+
+    @classmethod
+    def get_canonical_queries(cls):
+        return [
+            {
+                "name": "cli: mf model list",
+                "collection": cls.triggers,
+                "filter": {"trigger_class": "ModelServingRolloutTrigger"},
+            },
+        ]
 
     @classmethod
     def validate_existance(cls, trigger_name):
@@ -112,6 +130,10 @@ class TriggerManager:
     def load_info_for_all_triggers(cls):
         return list(cls.triggers.find())
 
+    @classmethod
+    def load_info_for_triggers_by_class(cls, trigger_class):
+        return list(cls.triggers.find({"trigger_class": trigger_class}))
+
     @classmethod
     def load_info_for_trigger(cls, trigger_name):
         return cls.triggers.find_one({"_id" : trigger_name})
@@ -3,7 +3,6 @@ from core.config import Config
 from core.execution_context import ExecutionContext
 from core.parameter import Parameter, ParameterGroup
 from core.termcolor import get_colored_text_by_hsv
-from core.tracking import Tracking
 from datetime import datetime
 from services.model_factory_frontend.client import ModelFactoryFrontendClient
 
@@ -23,22 +22,22 @@ def get_first_available_value(values):
 
 
 def get_current_cpu_request():
-    current_job_info = Tracking.get_info_for_single_job(ExecutionContext.job_id)
+    current_job_info = ExecutionContext.get_job_info()
     return current_job_info["resources"]["cpu_request"]
 
 
 def get_current_memory_request():
-    current_job_info = Tracking.get_info_for_single_job(ExecutionContext.job_id)
+    current_job_info = ExecutionContext.get_job_info()
     return current_job_info["resources"]["memory_request"]
 
 
 def get_current_storage_request():
-    current_job_info = Tracking.get_info_for_single_job(ExecutionContext.job_id)
+    current_job_info = ExecutionContext.get_job_info()
     return current_job_info["resources"]["storage_request"]
 
 
 def get_current_gpu_request():
-    current_job_info = Tracking.get_info_for_single_job(ExecutionContext.job_id)
+    current_job_info = ExecutionContext.get_job_info()
     return current_job_info["resources"]["gpu_request"]
 
 
@@ -418,8 +417,7 @@ def build_image(pipeline_name, image_tag, push=False):
 
 
 def get_current_pipeline_name():
-    current_job_info = Tracking.get_info_for_single_job(
-        ExecutionContext.job_id)
+    current_job_info = ExecutionContext.get_job_info()
     if not current_job_info:
         return None
     return current_job_info["pipeline_name"]
@@ -62,6 +62,32 @@ def task_model_factory_autohide_service():
     }
 
 
+def task_model_factory_job_archiver():
+    return {
+        "actions": [
+            "docker pull {}/model_factory_base_image".format(Config.DOCKER_REGISTRY),
+            "docker build --build-arg DOCKER_REGISTRY={} . -f services/model_factory_job_archiver/Dockerfile -t {}/model-factory-job-archiver".format(
+                Config.DOCKER_REGISTRY, Config.DOCKER_REGISTRY
+            ),
+            "docker push {}/model-factory-job-archiver".format(Config.DOCKER_REGISTRY),
+            "DOCKER_REGISTRY={} envsubst < services/model_factory_job_archiver/deployment/deployment.yaml | kubectl apply -f -".format(Config.DOCKER_REGISTRY),
+        ],
+    }
+
+
+def task_model_factory_model_gc():
+    return {
+        "actions": [
+            "docker pull {}/model_factory_base_image".format(Config.DOCKER_REGISTRY),
+            "docker build --build-arg DOCKER_REGISTRY={} . -f services/model_factory_model_gc/Dockerfile -t {}/model-factory-model-gc".format(
+                Config.DOCKER_REGISTRY, Config.DOCKER_REGISTRY
+            ),
+            "docker push {}/model-factory-model-gc".format(Config.DOCKER_REGISTRY),
+            "DOCKER_REGISTRY={} envsubst < services/model_factory_model_gc/deployment/deployment.yaml | kubectl apply -f -".format(Config.DOCKER_REGISTRY),
+        ],
+    }
+
+
 def task_model_factory_trigger_service():
     return {
         "actions": [
@@ -96,6 +122,8 @@ def task_server():
             "model_factory_frontend",
             "model_factory_execution_syncer",
             "model_factory_autohide_service",
+            "model_factory_job_archiver",
+            "model_factory_model_gc",
             "model_factory_trigger_service",
             "model_factory_model_downloader",
         ],
@@ -106,7 +134,7 @@ def task_client():
     return {
         "actions": [
             "echo \033[93mSetting up model factory client on your devbox...\033[0m",
-            "pip3 install awscli boto3 click dataclasses docker git+https://github.com/kubernetes-client/python.git@release-19.0 gitpython jsonpickle pudb pymongo python-dateutil pytz pyyaml tabulate thrift treelib ansible_runner croniter slackclient",
+            "pip3 install awscli boto3 click dataclasses docker git+https://github.com/kubernetes-client/python.git@release-19.0 gitpython jsonpickle pudb pymongo python-dateutil pytz pyyaml tabulate thrift treelib ansible_runner croniter slackclient zstandard lz4 numpy",
             "PYTHONPATH=`pwd` python3 cli/mf.py dev install-alias",
             "echo \033[92mModel factory has been successully installed. Please restart your shell before using model factory!\033[0m",
         ]
@@ -1,3 +1,4 @@
+from core import consts
 from core.kubernetes_proxy import KubernetesProxy
 from core.model_registry import ModelRegistry
 from services.model_factory_frontend.client import ModelFactoryFrontendClient
@@ -15,16 +16,17 @@ def main():
 
 @main.command()
 def autohide_model():
-    models_info = ModelRegistry.get_info_for_models()
+    # Only fetch the ids of the visible models which are old enough to be hidden.
+    models_info = ModelRegistry.get_info_for_models(
+        query_filter={
+            "tags": {"$nin": ["hide"]},
+            "timestamp": {"$lt": time.time() - consts.AUTOHIDE_AGE_SECONDS},
+        },
+        fields={"_id": 1},
+    )
 
-    now = time.time()
     for model_info in models_info:
         model_id = model_info["_id"]
-        t = model_info["timestamp"]
-        tags = model_info["tags"]
-
-        if "hide" in tags or now - t < 7 * 24 * 3600:
-            continue
 
         ModelRegistry.tag_model(model_id, "hide")
         logging.info("hide model {}".format(model_id))
@@ -49,9 +51,13 @@ def autohide_job():
 
     # Check visible jobs.
     model_factory_frontend_client = ModelFactoryFrontendClient()
-    jobs_info = model_factory_frontend_client.get_info_for_all_visiable_jobs()
-
     now = time.time()
+
+    # A job can only have been inactive for long enough if it was created before the autohide window.
+    jobs_info = model_factory_frontend_client.get_info_for_all_visiable_jobs(
+        created_before=now - consts.AUTOHIDE_AGE_SECONDS,
+    )
+
     for job_info in jobs_info:
         job_id = job_info.get("job_id", None)
 
@@ -64,7 +70,7 @@ def autohide_job():
 
         last_active_time = job_info.get("completion_timestamp", None) or job_info.get("start_timestamp", None)
 
-        if last_active_time and now - last_active_time > 7 * 24 * 3600:
+        if last_active_time and now - last_active_time > consts.AUTOHIDE_AGE_SECONDS:
             logging.info("Hiding {}".format(job_id))
             model_factory_frontend_client.tag_job(job_id, "hide")
 
@@ -24,7 +24,7 @@ def sync_job_metadata():
     jobs_info = Tracking.get_info_for_jobs(
         job_filter={
             "execution_mode": "k8s",
-            "status": {"$nin": ["succeeded", "failed", "deleted"]},
+            "status": {"$nin": list(mf_consts.JOB_TERMINAL_STATUSES)},
         },
     )
 
@@ -87,6 +87,31 @@ def sync_job_metadata():
 
     logging.info("Finished achiving jobs...")
 
+    _sync_job_stats()
+
+
+@main.command()
+def sync_job_stats():
+    _sync_job_stats()
+
+
+def _sync_job_stats():
+    """
+    Count the jobs which reached a terminal status in the job stats summaries.
+    """
+    logging.info("Start syncing job stats...")
+
+    recorded_job_count = 0
+    while True:
+        jobs_info = Tracking.get_jobs_pending_stats()
+
+        if not jobs_info:
+            break
+
+        recorded_job_count += Tracking.record_job_stats(jobs_info)
+
+    logging.info("Recorded stats of {} jobs.".format(recorded_job_count))
+
 
 if __name__ == '__main__':
     logging.basicConfig(
@@ -181,6 +181,46 @@ class ModelFactoryFrontendClient():
             },
         )
 
+    @client_api()
+    def get_job_events(
+        self,
+        job_id,
+        start_timestamp=None,
+        end_timestamp=None,
+        event_types=None,
+    ):
+        return requests.post(
+            '{}/get_job_events'.format(self.mf_frontend_endpoint),
+            json={
+                "job_id": job_id,
+                "start_timestamp": start_timestamp,
+                "end_timestamp": end_timestamp,
+                "event_types": event_types,
+            },
+        )
+
+    @client_api()
+    def job_stats(
+        self,
+        group_by,
+        start_day=None,
+        end_day=None,
+        pipeline_name=None,
+        owner=None,
+        pool=None,
+    ):
+        return requests.post(
+            '{}/job_stats'.format(self.mf_frontend_endpoint),
+            json={
+                "group_by": group_by,
+                "start_day": start_day,
+                "end_day": end_day,
+                "pipeline_name": pipeline_name,
+                "owner": owner,
+                "pool": pool,
+            },
+        )
+
     @client_api()
     def tag_job(
         self,
@@ -210,10 +250,13 @@ class ModelFactoryFrontendClient():
         )
 
     @client_api(serialization="jsonpickle")
-    def get_info_for_all_visiable_jobs(self):
+    def get_info_for_all_visiable_jobs(self, created_before=None):
         return requests.post(
             '{}/get_info_for_all_visiable_jobs'.format(
                 self.mf_frontend_endpoint),
+            json={
+                "created_before": created_before,
+            },
         )
 
     @client_api()
@@ -223,15 +266,66 @@ class ModelFactoryFrontendClient():
         )
 
     @client_api()
-    def get_info_for_jobs(self, job_filter, job_fields=None):
+    def get_info_for_jobs(
+        self,
+        job_filter,
+        job_fields=None,
+        limit=None,
+        sort_key=None,
+        descending=True,
+        continuation_token=None,
+        include_archived=False,
+    ):
+        """
+        Get job info. If limit is provided, a page of jobs is returned as
+        {"jobs": [...], "continuation_token": ...}, and the continuation token can be passed in to get the next page.
+
+        With include_archived, the jobs moved to the job archive are returned as well.
+        """
         return requests.post(
             '{}/get_info_for_jobs'.format(self.mf_frontend_endpoint),
             json={
                 "job_filter": json.dumps(job_filter),
                 "job_fields": job_fields and json.dumps(job_fields),
+                "limit": limit,
+                "sort_key": sort_key,
+                "descending": descending,
+                "continuation_token": continuation_token,
+                "include_archived": include_archived,
             }
         )
 
+    def iter_info_for_jobs(
+        self,
+        job_filter,
+        job_fields=None,
+        page_size=1000,
+        sort_key=None,
+        descending=True,
+        include_archived=False,
+    ):
+        """
+        Iterate over job info page by page.
+        """
+        continuation_token = None
+
+        while True:
+            page = self.get_info_for_jobs(
+                job_filter,
+                job_fields,
+                limit=page_size,
+                sort_key=sort_key,
+                descending=descending,
+                continuation_token=continuation_token,
+                include_archived=include_archived,
+            )
+
+            yield from page["jobs"]
+
+            continuation_token = page["continuation_token"]
+            if not continuation_token:
+                break
+
     @client_api()
     def list_artifacts_namespaces(self):
         return requests.post(
@@ -242,14 +336,51 @@ class ModelFactoryFrontendClient():
     def list_artifacts(
         self,
         artifact_namespace,
+        prefix=None,
+        limit=None,
+        continuation_token=None,
     ):
+        """
+        List a page of the artifacts of a namespace, optionally only those whose name starts with prefix, as
+        {"artifacts": [...], "continuation_token": ...}. The continuation token can be passed in to get the next page,
+        and is None on the last page. limit defaults to ARTIFACT_PAGE_SIZE on the server. Use iter_artifacts to
+        iterate over all the artifacts.
+        """
         return requests.post(
             '{}/list_artifacts'.format(self.mf_frontend_endpoint),
             json={
                 "artifact_namespace": artifact_namespace,
+                "prefix": prefix,
+                "limit": limit,
+                "continuation_token": continuation_token,
             },
         )
 
+    def iter_artifacts(
+        self,
+        artifact_namespace,
+        prefix=None,
+        page_size=consts.ARTIFACT_MAX_PAGE_SIZE,
+    ):
+        """
+        Iterate over the artifacts of a namespace page by page.
+        """
+        continuation_token = None
+
+        while True:
+            page = self.list_artifacts(
+                artifact_namespace,
+                prefix=prefix,
+                limit=page_size,
+                continuation_token=continuation_token,
+            )
+
+            yield from page["artifacts"]
+
+            continuation_token = page["continuation_token"]
+            if not continuation_token:
+                break
+
     @client_api()
     def del_artifact(
         self,
@@ -288,6 +419,58 @@ class ModelFactoryFrontendClient():
             },
         )
 
+    @client_api()
+    def get_metric_series(
+        self,
+        key,
+        model_id=None,
+        job_id=None,
+        max_points=None,
+        x_field=None,
+    ):
+        return requests.post(
+            '{}/get_metric_series'.format(self.mf_frontend_endpoint),
+            json={
+                "key": key,
+                "model_id": model_id,
+                "job_id": job_id,
+                "max_points": max_points,
+                "x_field": x_field,
+            },
+        )
+
+    @client_api()
+    def get_latest_metrics(
+        self,
+        model_ids,
+    ):
+        return requests.post(
+            '{}/get_latest_metrics'.format(self.mf_frontend_endpoint),
+            json={
+                "model_ids": model_ids,
+            },
+        )
+
+    @client_api()
+    def model_leaderboard(
+        self,
+        model_name,
+        key,
+        k=10,
+        by="latest",
+        ascending=False,
+    ):
+        return requests.post(
+            '{}/model_leaderboard'.format(self.mf_frontend_endpoint),
+            json={
+                "model_name": model_name,
+                "key": key,
+                "k": k,
+                "by": by,
+                "ascending": ascending,
+            },
+        )
+
     @client_api()
     def list_models(
         self,
@@ -396,6 +579,22 @@ class ModelFactoryFrontendClient():
             },
         )
 
+    @client_api()
+    def model_fleet(
+        self,
+        model_name,
+        stale_seconds=consts.MODEL_FLEET_STALE_SECONDS,
+        include_hosts=False,
+    ):
+        return requests.post(
+            '{}/model_fleet'.format(self.mf_frontend_endpoint),
+            json={
+                "model_name": model_name,
+                "stale_seconds": stale_seconds,
+                "include_hosts": include_hosts,
+            },
+        )
+
     @client_api(serialization="jsonpickle")
     def get_devvms(self, vm_filter=[]):
         return requests.post(
@@ -1,22 +1,19 @@
 #!/usr/bin/env python3
 
 from core import consts
-from core.config import Config
+from core import storage
 from core.kubernetes_proxy import KubernetesProxy
 from core.model_registry import ModelRegistry
 from core.tracking import Tracking
 from core.trigger_manager import TriggerManager
-from flask import Flask, request
+from flask import Flask, abort, request
 from flask_cors import CORS
-import boto3
 import functools
 import json
 import jsonpickle
 import logging
-import os
 import shlex
 import sys
-import tempfile
 
 
 def service_api(serialization="json"):
@@ -48,6 +45,26 @@ app = Flask(__name__)
 CORS(app)
 
 
+def _get_page_size():
+    """
+    Get the optional page size of a list request, rejecting invalid ones with a 400 error.
+    """
+    limit = request.json.get("limit", None)
+
+    if limit is None:
+        return None
+
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        abort(400, "Invalid limit {}, expecting a positive integer!".format(limit))
+
+    if limit <= 0:
+        abort(400, "Invalid limit {}, expecting a positive integer!".format(limit))
+
+    return limit
+
+
 ################################################################################
 # keepalive APIs
 ################################################################################
@@ -67,21 +84,7 @@ def keepalive():
 def get_archived_job_log():
     job_id = request.json["job_id"]
 
-    _, filename = tempfile.mkstemp(prefix="model_factory_job_log_")
-
-    s3_client = boto3.client('s3')
-    fp = s3_client.download_file(
-        Bucket=Config.S3_BUCKET,
-        Key="job_logs/{}.log".format(job_id),
-        Filename=filename,
-    )
-
-    with open(filename, "rb") as fp:
-        log = fp.read()
-
-    os.remove(filename)
-
-    return log.decode()
+    return storage.get_storage().get("job_logs/{}.log".format(job_id)).decode()
 
 
 ################################################################################
@@ -212,6 +215,35 @@ def get_info_for_single_job():
     return job_info
 
 
+@app.route('/get_job_events', methods=["POST"])
+@service_api()
+def get_job_events():
+    job_id = request.json["job_id"]
+    start_timestamp = request.json.get("start_timestamp", None)
+    end_timestamp = request.json.get("end_timestamp", None)
+    event_types = request.json.get("event_types", None)
+
+    return Tracking.get_job_events(
+        job_id=job_id,
+        start_timestamp=start_timestamp,
+        end_timestamp=end_timestamp,
+        event_types=event_types,
+    )
+
+
+@app.route('/job_stats', methods=["POST"])
+@service_api()
+def job_stats():
+    return Tracking.get_job_stats(
+        group_by=request.json.get("group_by", []),
+        start_day=request.json.get("start_day", None),
+        end_day=request.json.get("end_day", None),
+        pipeline_name=request.json.get("pipeline_name", None),
+        owner=request.json.get("owner", None),
+        pool=request.json.get("pool", None),
+    )
+
+
 @app.route('/tag_job', methods=["POST"])
 @service_api()
 def tag_job():
@@ -233,7 +265,9 @@ def untag_job():
 @app.route('/get_info_for_all_visiable_jobs', methods=["POST"])
 @service_api(serialization="jsonpickle")
 def get_info_for_all_visiable_jobs():
-    return Tracking.get_info_for_all_visiable_jobs()
+    created_before = (request.get_json(silent=True) or {}).get("created_before", None)
+
+    return Tracking.get_info_for_all_visiable_jobs(created_before=created_before)
 
 
 @app.route('/get_info_for_all_jobs', methods=["POST"])
@@ -245,12 +279,29 @@ def get_info_for_all_jobs():
 @app.route('/get_info_for_jobs', methods=["POST"])
 @service_api()
 def get_info_for_jobs():
+    """
+    Get job info. If limit is provided, return a page of jobs with a continuation token for the next page.
+    """
     job_filter = request.json["job_filter"]
     job_fields = request.json["job_fields"]
+    limit = _get_page_size()
+    include_archived = request.json.get("include_archived", False)
 
-    return Tracking.get_info_for_jobs(
+    if limit is None:
+        return Tracking.get_info_for_jobs(
+            job_filter=job_filter and json.loads(job_filter),
+            job_fields=job_fields and json.loads(job_fields),
+            include_archived=include_archived,
+        )
+
+    return Tracking.get_page_of_jobs(
         job_filter=job_filter and json.loads(job_filter),
         job_fields=job_fields and json.loads(job_fields),
+        limit=limit,
+        sort_key=request.json.get("sort_key") or "creation_timestamp",
+        descending=request.json.get("descending", True),
+        continuation_token=request.json.get("continuation_token", None),
+        include_archived=include_archived,
     )
 
 
@@ -263,17 +314,21 @@ def list_artifacts_namespaces():
 @app.route('/list_artifacts', methods=["POST"])
 @service_api()
 def list_artifacts():
-    artifact_namespace = request.json["artifact_namespace"]
-
-    artifacts_info = Tracking.get_artifacts_info(artifact_namespace)
-
-    return {
-        name: {
-            str(key): str(value)
-            for key, value in artifact_info.items()
-        }
-        for name, artifact_info in artifacts_info.items()
-    }
+    """
+    List a page of the artifacts of a namespace, optionally only those whose name starts with prefix, with a
+    continuation token for the next page. Pages have ARTIFACT_PAGE_SIZE artifacts unless limit is provided.
+    """
+    limit = _get_page_size() or consts.ARTIFACT_PAGE_SIZE
+
+    if limit > consts.ARTIFACT_MAX_PAGE_SIZE:
+        abort(400, "Invalid limit {}, expecting at most {}!".format(limit, consts.ARTIFACT_MAX_PAGE_SIZE))
+
+    return Tracking.get_page_of_artifacts(
+        request.json["artifact_namespace"],
+        prefix=request.json.get("prefix", None),
+        limit=limit,
+        continuation_token=request.json.get("continuation_token", None),
+    )
 
 
 @app.route('/del_artifact', methods=["POST"])
@@ -282,7 +337,7 @@ def del_artifact():
     artifact_namespace = request.json["artifact_namespace"]
     artifact_name = request.json["artifact_name"]
 
-    Tracking.del_artifact(artifact_namespace, artifact_name)
+    return Tracking.del_artifact(artifact_namespace, artifact_name)
 
 
 @app.route('/drop_artifact_namespace', methods=["POST"])
@@ -290,7 +345,7 @@ def del_artifact():
 def drop_artifact_namespace():
     artifact_namespace = request.json["artifact_namespace"]
 
-    Tracking.drop_artifact_namespace(artifact_namespace)
+    return Tracking.drop_artifact_namespace(artifact_namespace)
 
 
 @app.route('/get_model_by_id', methods=["POST"])
@@ -311,6 +366,38 @@ def list_models():
     )
 
 
+@app.route('/get_metric_series', methods=["POST"])
+@service_api()
+def get_metric_series():
+    return Tracking.get_metric_series(
+        key=request.json["key"],
+        model_id=request.json.get("model_id", None),
+        job_id=request.json.get("job_id", None),
+        max_points=request.json.get("max_points", None),
+        x_field=request.json.get("x_field", None) or "step",
+    )
+
+
+@app.route('/get_latest_metrics', methods=["POST"])
+@service_api()
+def get_latest_metrics():
+    model_ids = request.json["model_ids"]
+
+    return ModelRegistry.get_latest_metrics(model_ids)
+
+
+@app.route('/model_leaderboard', methods=["POST"])
+@service_api()
+def model_leaderboard():
+    return ModelRegistry.get_model_leaderboard(
+        model_name=request.json["model_name"],
+        key=request.json["key"],
+        k=request.json.get("k", 10),
+        by=request.json.get("by", "latest"),
+        ascending=request.json.get("ascending", False),
+    )
+
+
 @app.route('/delete_model', methods=["POST"])
 @service_api()
 def delete_model():
@@ -373,6 +460,16 @@ def list_production_models():
     return ModelRegistry.list_production_models(model_names)
 
 
+@app.route('/model_fleet', methods=["POST"])
+@service_api()
+def model_fleet():
+    return ModelRegistry.get_model_fleet(
+        model_name=request.json["model_name"],
+        stale_seconds=request.json.get("stale_seconds", consts.MODEL_FLEET_STALE_SECONDS),
+        include_hosts=request.json.get("include_hosts", False),
+    )
+
+
 if __name__ == '__main__':
     logging.basicConfig(
         format='[%(asctime)s] {%(filename)32s:%(lineno)-5d} %(levelname)8s - %(message)s',
@@ -380,4 +477,8 @@ if __name__ == '__main__':
         level=logging.INFO,
     )
 
+    # Create or migrate the managed indexes before serving any request.
+    Tracking.ensure_indexes()
+    TriggerManager.ensure_indexes()
+
     app.run(host='0.0.0.0')
@@ -0,0 +1,76 @@
+from core import consts
+from core import storage
+from core.kubernetes_proxy import KubernetesProxy
+from core.tracking import Tracking
+
+import click
+import logging
+import sys
+import time
+
+
+@click.group()
+def main():
+    pass
+
+
+def _archive_job_log(job_info):
+    """
+    Keep the k8s log of a job in the storage if its pod is still around, so that it can be read once the job is archived.
+    """
+    pod_name = job_info.get("pod_name", None)
+
+    if not pod_name:
+        return
+
+    try:
+        job_log = KubernetesProxy.get_job_log(pod_name)
+    except:
+        logging.info("The log of job {} is no longer available.".format(job_info["_id"]))
+        return
+
+    if job_log:
+        storage.get_storage().put(
+            "job_logs/{}.log".format(job_info["_id"]),
+            job_log.encode() if isinstance(job_log, str) else job_log,
+        )
+
+
+@main.command()
+@click.option("--age-days", type=int, help="Archive the terminal jobs created more than this many days ago.")
+@click.option("--max-segments", type=int, help="Stop after writing this many segments.")
+def archive_jobs(age_days, max_segments):
+    age_seconds = age_days * 24 * 3600 if age_days is not None else consts.JOB_ARCHIVE_AGE_SECONDS
+    archived_before = time.time() - age_seconds
+
+    logging.info("Start archiving the terminal jobs created before {}...".format(archived_before))
+
+    archived_job_count = 0
+    segment_count = 0
+
+    while not max_segments or segment_count < max_segments:
+        jobs_info = Tracking.get_jobs_to_archive(archived_before)
+
+        if not jobs_info:
+            break
+
+        for job_info in jobs_info:
+            if job_info.get("execution_mode") == consts.EXECUTION_MODE_K8S:
+                _archive_job_log(job_info)
+
+        Tracking.archive_jobs(jobs_info)
+
+        archived_job_count += len(jobs_info)
+        segment_count += 1
+
+    logging.info("Archived {} jobs.".format(archived_job_count))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='[%(asctime)s] {%(filename)32s:%(lineno)-5d} %(levelname)8s - %(message)s',
+        stream=sys.stdout,
+        level=logging.INFO,
+    )
+
+    main()
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+from core import consts
+from core.model_cache import ModelCache
 from core.model_registry import ModelRegistry
 from core.tracking import Tracking
 from datetime import datetime
@@ -7,8 +9,15 @@ import click
 import json
 import logging
 import os
+import shutil
 import socket
 import sys
+import time
+import uuid
+
+
+# The directory of the model versions downloaded by watch-models, in its target directory.
+VERSIONS_DIR_NAME = ".versions"
 
 
 @click.group()
@@ -16,22 +25,57 @@ def main():
     pass
 
 
+def _pull_model(model_id, target_dir, include, no_cache, verify=False):
+    """
+    Pull a model through the host model cache, unless only some of its files are pulled. Returns whether the model was
+    served from the cache.
+    """
+    if include or no_cache:
+        ModelRegistry.pull(model_id, target_dir, include=list(include) or None)
+        return False
+
+    return ModelCache(verify=verify).pull(model_id, target_dir)
+
+
+def _record_download(model_name, model_id, cache_hit):
+    # The fleet state has one document per host, rather than an event per download on the production model.
+    Tracking.update_model_fleet_state(
+        model_name=model_name,
+        hostname=socket.gethostname(),
+        model_id=model_id,
+        metadata={"cache_hit": cache_hit},
+    )
+
+    logging.info(json.dumps({
+        "timestamp": datetime.utcnow().isoformat(),
+        "verb": "updated",
+        "type": "deployment",
+        "notes": "[Model ID: {}]".format(model_id),
+        "name": "model_factory_model_downloader",
+        "namespace": "model_factory_services",
+    }))
+
+
 @main.command()
 @click.argument("model-id")
 @click.argument("target-dir")
-def download_model(model_id, target_dir):
-    ModelRegistry.pull(model_id, target_dir)
+@click.option("--include", multiple=True, help="Glob pattern of the files to download, for models pushed with the files layout.")
+@click.option("--no-cache", is_flag=True, help="Download the model from s3 without the host model cache.")
+def download_model(model_id, target_dir, include, no_cache):
+    _pull_model(model_id, target_dir, include, no_cache)
 
 
 @main.command()
 @click.argument("model-name")
 @click.argument("target-dir")
 @click.option("--use-model-id-as-name", is_flag=True, help="Use model id as the file name.")
-def download_model_by_name(model_name, target_dir, use_model_id_as_name):
+@click.option("--include", multiple=True, help="Glob pattern of the files to download, for models pushed with the files layout.")
+@click.option("--no-cache", is_flag=True, help="Download the model from s3 without the host model cache.")
+def download_model_by_name(model_name, target_dir, use_model_id_as_name, include, no_cache):
     production_model_info = ModelRegistry.list_production_models([model_name])[0]
     model_id = production_model_info["model_id"]
 
-    ModelRegistry.pull(model_id, target_dir)
+    cache_hit = _pull_model(model_id, target_dir, include, no_cache)
 
     if use_model_id_as_name:
         os.rename(
@@ -39,23 +83,139 @@ def download_model_by_name(model_name, target_dir, use_model_id_as_name):
             os.path.expanduser(os.path.join(target_dir, model_id)),
         )
 
-    Tracking.add_production_model_event(
-        model_name=model_name,
-        event_type="model_download",
-        event_metadata={
-            "hostname": socket.gethostname(),
-            "model_id": model_id,
-        },
+    _record_download(model_name, model_id, cache_hit)
+
+
+def _get_current_model_id(target_dir, model_name):
+    link_path = os.path.join(target_dir, model_name)
+
+    if not os.path.islink(link_path):
+        return None
+
+    # The link points to .versions/<model_name>/<model_id>/<model_name>.
+    return os.path.basename(os.path.dirname(os.readlink(link_path)))
+
+
+def _stage_model(target_dir, model_name, model_id, no_cache):
+    """
+    Download and verify a model into its version directory, next to the current one. Returns whether the model was
+    served from the cache.
+    """
+    versions_dir = os.path.join(target_dir, VERSIONS_DIR_NAME, model_name)
+    version_dir = os.path.join(versions_dir, model_id)
+
+    # A version kept around, e.g. when rolling back, is ready already.
+    if os.path.isdir(os.path.join(version_dir, model_name)):
+        return True
+
+    staging_dir = os.path.join(versions_dir, ".staging-{}-{}".format(model_id, uuid.uuid4()))
+
+    try:
+        cache_hit = _pull_model(model_id, staging_dir, (), no_cache, verify=True)
+
+        assert os.path.exists(os.path.join(staging_dir, model_name)), "Model {} has no {} directory!".format(
+            model_id,
+            model_name,
+        )
+
+        shutil.rmtree(version_dir, ignore_errors=True)
+        os.rename(staging_dir, version_dir)
+    except:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    return cache_hit
+
+
+def _swap_model(target_dir, model_name, model_id):
+    """
+    Point the <target_dir>/<model_name> symlink to a staged model version. The symlink is replaced with a rename, so
+    readers see either the old or the new model, and never a missing or partial one.
+    """
+    link_path = os.path.join(target_dir, model_name)
+
+    assert not os.path.exists(link_path) or os.path.islink(link_path), \
+        "{} is not a symlink, please remove the model downloaded there first!".format(link_path)
+
+    tmp_link_path = os.path.join(target_dir, ".{}.{}.tmp".format(model_name, uuid.uuid4()))
+    os.symlink(os.path.join(VERSIONS_DIR_NAME, model_name, model_id, model_name), tmp_link_path)
+    os.replace(tmp_link_path, link_path)
+
+    # Version directories are ordered by their last use when removing the old ones.
+    os.utime(os.path.join(target_dir, VERSIONS_DIR_NAME, model_name, model_id))
+
+
+def _remove_old_versions(target_dir, model_name, keep):
+    versions_dir = os.path.join(target_dir, VERSIONS_DIR_NAME, model_name)
+
+    version_dirs = sorted(
+        (
+            os.path.join(versions_dir, dir_name) for dir_name in os.listdir(versions_dir)
+            if not dir_name.startswith(".")
+        ),
+        key=os.path.getmtime,
+        reverse=True,
     )
 
-    logging.info(json.dumps({
-        "timestamp": datetime.utcnow().isoformat(),
-        "verb": "updated",
-        "type": "deployment",
-        "notes": "[Model ID: {}]".format(model_id),
-        "name": "model_factory_model_downloader",
-        "namespace": "model_factory_services",
-    }))
+    for version_dir in version_dirs[keep:]:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        logging.info("Removed old model version {}".format(version_dir))
+
+
+@main.command()
+@click.argument("model-names", nargs=-1, required=True)
+@click.option("--target-dir", required=True, help="Directory of the model symlinks.")
+@click.option("--keep", default=2, show_default=True, help="Number of versions kept per model, including the current one.")
+@click.option("--no-cache", is_flag=True, help="Download the models from s3 without the host model cache.")
+def watch_models(model_names, target_dir, keep, no_cache):
+    """
+    Keep the production models of the given model names up to date in the target directory.
+
+    Each model is served at <target_dir>/<model_name>, a symlink to the current version of the model. As soon as a
+    model is promoted, the new version is downloaded and verified next to the current one, and the symlink is swapped
+    atomically. Serving processes starting meanwhile find the current model locally, and processes watching the
+    symlink can reload the new model without a restart.
+    """
+    assert keep >= 1, "At least the current version of each model must be kept!"
+
+    target_dir = os.path.expanduser(target_dir)
+    os.makedirs(target_dir, exist_ok=True)
+
+    current_model_ids = {model_name: _get_current_model_id(target_dir, model_name) for model_name in model_names}
+    production_model_ids = {}
+    last_heartbeat_time = 0
+
+    # Watching yields None periodically, so that failed rollouts are retried.
+    for production_model in ModelRegistry.watch_production_models(model_names):
+        if production_model is not None and production_model.get("model_id"):
+            production_model_ids[production_model["_id"]] = production_model["model_id"]
+
+        for model_name, model_id in production_model_ids.items():
+            if current_model_ids.get(model_name) == model_id:
+                continue
+
+            try:
+                cache_hit = _stage_model(target_dir, model_name, model_id, no_cache)
+                _swap_model(target_dir, model_name, model_id)
+            except Exception:
+                logging.exception("Failed to roll out model {} {}, retrying later".format(model_name, model_id))
+                continue
+
+            _record_download(model_name, model_id, cache_hit)
+            current_model_ids[model_name] = model_id
+
+            _remove_old_versions(target_dir, model_name, keep)
+
+        # Report the served models periodically, so that the fleet view tells live hosts from gone ones.
+        if time.time() - last_heartbeat_time >= consts.MODEL_FLEET_HEARTBEAT_INTERVAL:
+            for model_name, model_id in current_model_ids.items():
+                if model_id:
+                    Tracking.update_model_fleet_state(model_name, socket.gethostname(), model_id)
+
+            last_heartbeat_time = time.time()
+
+    # The watch only ends by itself if it fails, so that the daemon is restarted rather than exiting successfully.
+    raise Exception("Stopped watching the production models {}!".format(", ".join(model_names)))
 
 
 if __name__ == '__main__':
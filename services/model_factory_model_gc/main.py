@@ -0,0 +1,50 @@
+from core import consts
+from core import model_gc
+
+import click
+import logging
+import sys
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.option("--age-days", type=int, help="Collect the hidden models created more than this many days ago.")
+@click.option("--dry-run", is_flag=True, help="Only report what would be collected.")
+def collect_garbage(age_days, dry_run):
+    age_seconds = age_days * 24 * 3600 if age_days is not None else consts.MODEL_GC_AGE_SECONDS
+
+    collected_models = model_gc.collect_models(age_seconds=age_seconds, dry_run=dry_run)
+
+    for collected_model in collected_models:
+        logging.info("{} {} model {} ({} objects, {} bytes)".format(
+            "Would collect" if dry_run else "Collected",
+            collected_model["reason"],
+            collected_model["model_id"],
+            collected_model["object_count"],
+            collected_model["size"],
+        ))
+
+    collected_chunks = model_gc.collect_model_chunks(dry_run=dry_run)
+
+    logging.info("{} {} models ({} bytes) and {} unreferenced chunks ({} bytes), {} bytes in total.".format(
+        "Would collect" if dry_run else "Collected",
+        len(collected_models),
+        sum(collected_model["size"] for collected_model in collected_models),
+        collected_chunks["chunk_count"],
+        collected_chunks["size"],
+        sum(collected_model["size"] for collected_model in collected_models) + collected_chunks["size"],
+    ))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='[%(asctime)s] {%(filename)32s:%(lineno)-5d} %(levelname)8s - %(message)s',
+        stream=sys.stdout,
+        level=logging.INFO,
+    )
+
+    main()